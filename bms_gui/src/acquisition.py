@@ -0,0 +1,362 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+
+import numpy as np
+
+from database_schema import SAMPLE_COLUMNS, MAX_CELLS, DEFAULT_PACK_ID
+from time_utils import now_ms
+
+# Multi-pack acquisition on one asyncio event loop.
+#
+# Every source (a serial BMS board, a simulated pack, a replay of stored
+# data) is an async generator yielding (timestamps, values) batches for one
+# pack, with values as (n, SAMPLE_COLUMNS) arrays and NaN for the cells the
+# pack doesn't have. Each source runs under its
+# own supervisor coroutine, which reconnects it with exponential backoff when
+# it fails or ends, so one bad pack never affects the others. Replays are
+# the exception: they run once, unless "loop": true is set, as every run
+# stores the whole recording again. All batches go
+# into one queue, tagged with their pack id and cell count, and a single
+# consumer hands them to storage and alerting. Hundreds of packs cost hundreds of coroutines, not
+# threads.
+#
+# Sources are configured in a JSON file, one object per source:
+#   [{"type": "serial", "pack_id": 1, "port": "/dev/ttyUSB0", "baud_rate": 115200},
+#    {"type": "simulated", "pack_id": 2, "rate_hz": 1, "seed": 42, "dropout_rate": 0.01},
+#    {"type": "replay", "pack_id": 3, "from_pack_id": 1, "start_ms": 1700000000000, "speed": 10},
+#    {"type": "replay", "pack_id": 4, "path": "exports/bms_data_20240101.csv", "speed": "max", "loop": true}]
+
+# Seconds before the first reconnect attempt, doubling up to the maximum
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 60.0
+MAX_QUEUED_BATCHES = 10000
+# Poll interval for serial ports the event loop can't watch (e.g. on Windows)
+SERIAL_POLL_INTERVAL = 0.05
+# How often a lossless source checks whether storage and alerting have room again
+BACKPRESSURE_INTERVAL = 0.01
+
+
+def sample_values(cells, temperature, state_of_charge):
+    """(n, SAMPLE_COLUMNS) array from per-sample cell voltages (n, cells) and (n,) readings"""
+    values = np.full((len(temperature), len(SAMPLE_COLUMNS)), np.nan)
+    cells = np.asarray(cells, dtype=np.float64).reshape(len(temperature), -1)[:, :MAX_CELLS]
+    values[:, :cells.shape[1]] = cells
+    values[:, MAX_CELLS] = temperature
+    values[:, MAX_CELLS + 1] = state_of_charge
+    return values
+
+
+def cell_count(values):
+    """Number of cells in a (n, SAMPLE_COLUMNS) batch: up to the last one with any reading"""
+    used = np.flatnonzero(~np.isnan(values[:, :MAX_CELLS]).all(axis=0))
+    return int(used[-1]) + 1 if len(used) else 0
+
+
+class Source:
+    kind = 'source'
+    # Live sources never wait: samples storage or alerting can't take are dropped.
+    # Recorded ones lose nothing by waiting, so they are held back instead.
+    lossless = False
+    # Live sources are reconnected whenever they end; a source with loop False runs once
+    loop = True
+
+    def __init__(self, pack_id, name=None):
+        self.pack_id = pack_id
+        self.name = name or f"{self.kind}-{pack_id}"
+
+        # Supervisor state and statistics
+        self.state = 'idle'
+        self.batches = 0
+        self.samples = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    async def stream(self):
+        """Yield (timestamps, values) batches until the source ends or fails"""
+        raise NotImplementedError
+        yield
+
+    def stats(self):
+        return {
+            'pack_id': self.pack_id,
+            'state': self.state,
+            'batches': self.batches,
+            'samples': self.samples,
+            'errors': self.errors,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+        }
+
+
+class SerialSource(Source):
+    kind = 'serial'
+
+    def __init__(self, pack_id, port, baud_rate=115200, name=None):
+        super().__init__(pack_id, name)
+        self.port = port
+        self.baud_rate = baud_rate
+
+    async def stream(self):
+        import serial
+        from serial_protocol import FrameDecoder, ReceiptClock, decode_samples
+
+        loop = asyncio.get_running_loop()
+        conn = serial.Serial(self.port, self.baud_rate, timeout=0)
+        decoder = FrameDecoder()
+        clock = ReceiptClock()
+        readable = asyncio.Event()
+        try:
+            loop.add_reader(conn.fileno(), readable.set)
+            watching = True
+        except (NotImplementedError, AttributeError):
+            watching = False
+        try:
+            while True:
+                if watching:
+                    await readable.wait()
+                    readable.clear()
+                else:
+                    await asyncio.sleep(SERIAL_POLL_INTERVAL)
+                data = conn.read(conn.in_waiting or 1)
+                if not data:
+                    continue
+                received_ms = now_ms()
+                batches = decode_samples(decoder.feed(data))
+                if not batches:
+                    continue
+                # Frames carry no time; spread what arrived together back from the receipt time
+                timestamps = clock.stamp(received_ms, sum(len(samples) for samples in batches))
+                position = 0
+                for samples in batches:
+                    values = sample_values(samples['cells'], samples['temperature'],
+                                           samples['state_of_charge'])
+                    yield timestamps[position:position + len(values)], values
+                    position += len(values)
+        finally:
+            if watching:
+                loop.remove_reader(conn.fileno())
+            conn.close()
+
+
+class SimulatedSource(Source):
+    kind = 'simulated'
+
+    def __init__(self, pack_id, rate_hz=1.0, cell_count=3, seed=None, dropout_rate=0.0, name=None):
+        super().__init__(pack_id, name)
+        self.rate_hz = rate_hz
+        self.cell_count = cell_count
+        self.seed = seed
+        self.dropout_rate = dropout_rate
+
+    async def stream(self):
+        from simulator import PackSimulator
+
+        # Samples are stamped on the simulator's schedule, starting now
+        simulator = PackSimulator(self.cell_count, self.seed, self.pack_id, self.rate_hz,
+                                  dropout_rate=self.dropout_rate)
+        period_ms = 1000.0 / self.rate_hz
+        n = 0
+        while True:
+            await asyncio.sleep(1.0 / self.rate_hz)
+            due = int((now_ms() - simulator.start_ms) / period_ms)
+            if due > n:
+                yield simulator.take(due - n)
+                n = due
+
+
+class ReplaySource(Source):
+    """Recorded samples of pack from_pack_id, re-timed to now and paced at `speed` times real time (0 or "max" = no pacing).
+
+    The recording is read from the database, or from path (an archive directory or
+    CSV export), see replay.py. The replay runs once; with loop set it starts over
+    after the reconnect delay whenever it ends.
+    """
+    kind = 'replay'
+    lossless = True
+
+    def __init__(self, pack_id, start_ms=None, end_ms=None, speed=1.0, from_pack_id=DEFAULT_PACK_ID, path=None,
+                 loop=False, name=None):
+        from replay import parse_speed
+
+        if path is None and pack_id == from_pack_id:
+            raise ValueError(f"Replaying pack {pack_id} into itself would store its samples twice")
+        super().__init__(pack_id, name)
+        self.loop = loop
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.speed = parse_speed(speed)
+        self.from_pack_id = from_pack_id
+        self.path = path
+
+    async def stream(self):
+        from replay import Replayer, open_batches
+
+        loop = asyncio.get_running_loop()
+        replayer = Replayer(open_batches(self.path, self.start_ms, self.end_ms, self.from_pack_id), self.speed)
+        try:
+            while True:
+                # Batches are read ahead on their own thread; this only blocks if that fell behind
+                wait = await loop.run_in_executor(None, replayer.wait)
+                if wait is None:
+                    return
+                if wait:
+                    await asyncio.sleep(wait)
+                yield replayer.take()
+        finally:
+            replayer.close()
+
+
+SOURCE_TYPES = {cls.kind: cls for cls in (SerialSource, SimulatedSource, ReplaySource)}
+
+
+def load_sources(path):
+    """Sources from a JSON file as described at the top of this module"""
+    with open(path) as f:
+        entries = json.load(f)
+    sources = []
+    for entry in entries:
+        entry = dict(entry)
+        kind = entry.pop('type')
+        if kind not in SOURCE_TYPES:
+            raise ValueError(f"Unknown source type: {kind}")
+        sources.append(SOURCE_TYPES[kind](**entry))
+    pack_ids = [source.pack_id for source in sources]
+    if len(set(pack_ids)) != len(pack_ids):
+        raise ValueError("Every source needs its own pack_id")
+    return sources
+
+
+class AcquisitionManager:
+    def __init__(self, sources, writer=None, alert_engine=None, max_queued_batches=MAX_QUEUED_BATCHES):
+        self.sources = list(sources)
+        self.writer = writer
+        self.alert_engine = alert_engine
+        self.max_queued_batches = max_queued_batches
+        self.thread = None
+        self.loop = None
+        self._stopping = None
+
+        # Counters for diagnostics
+        self.samples_delivered = 0
+        self.samples_stored = 0
+
+    @property
+    def pack_ids(self):
+        return [source.pack_id for source in self.sources]
+
+    def start(self):
+        """Run the event loop on a background thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(started,), name="AcquisitionManager")
+        self.thread.daemon = True
+        self.thread.start()
+        started.wait(5.0)
+
+    def run(self, started=None):
+        """Run the event loop on this thread until stop() is called"""
+        asyncio.run(self._main(started))
+
+    def stop(self, timeout=5.0):
+        if self.loop and self._stopping:
+            try:
+                self.loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                pass  # Loop already closed
+        if self.thread:
+            self.thread.join(timeout)
+
+    def stats(self):
+        return {source.name: source.stats() for source in self.sources}
+
+    async def _main(self, started=None):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        queue = asyncio.Queue(maxsize=self.max_queued_batches)
+        tasks = [asyncio.create_task(self._supervise(source, queue)) for source in self.sources]
+        tasks.append(asyncio.create_task(self._deliver(queue)))
+        if started:
+            started.set()
+        try:
+            await self._stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Hand over whatever the sources produced before stopping
+            self._drain(queue)
+
+    async def _supervise(self, source, queue):
+        delay = RECONNECT_DELAY
+        while True:
+            source.state = 'connecting'
+            try:
+                async for timestamps, values in source.stream():
+                    if source.state != 'streaming':
+                        source.state = 'streaming'
+                        delay = RECONNECT_DELAY
+                    source.batches += 1
+                    source.samples += len(timestamps)
+                    if source.lossless:
+                        await self._wait_for_room(len(timestamps))
+                    await queue.put((source.pack_id, cell_count(values), timestamps, values))
+                source.last_error = None
+                if not source.loop:
+                    source.state = 'finished'
+                    logging.info(f"Source {source.name} finished after {source.samples} samples")
+                    return
+                logging.info(f"Source {source.name} ended, restarting")
+            except asyncio.CancelledError:
+                source.state = 'stopped'
+                raise
+            except Exception as e:
+                source.errors += 1
+                source.last_error = str(e)
+                logging.error(f"Source {source.name} failed: {str(e)}")
+                if not source.loop:
+                    # Starting over would store what was already delivered a second time
+                    source.state = 'failed'
+                    return
+
+            # Jitter keeps a rack of packs from reconnecting in lockstep
+            source.state = 'backoff'
+            source.reconnects += 1
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def _wait_for_room(self, count):
+        """Wait until storage and alerting can queue `count` more samples"""
+        queues = [consumer.queue for consumer in (self.writer, self.alert_engine) if consumer]
+        while any(q.qsize() and q.qsize() + count > q.maxsize for q in queues):
+            await asyncio.sleep(BACKPRESSURE_INTERVAL)
+
+    async def _deliver(self, queue):
+        while True:
+            batches = [await queue.get()]
+            while not queue.empty():
+                batches.append(queue.get_nowait())
+            self._sink(batches)
+
+    def _drain(self, queue):
+        batches = []
+        while not queue.empty():
+            batches.append(queue.get_nowait())
+        if batches:
+            self._sink(batches)
+
+    def _sink(self, batches):
+        """Pass pack-tagged batches to storage and alerting; both only queue them"""
+        for pack_id, cells, timestamps, values in batches:
+            self.samples_delivered += len(timestamps)
+            rows = zip(timestamps.tolist(), values.tolist())
+            for timestamp, sample in rows:
+                if self.writer:
+                    self.writer.submit_row((timestamp, pack_id, *sample), cells)
+                    self.samples_stored += 1
+                if self.alert_engine:
+                    self.alert_engine.submit(timestamp, sample, pack_id)
@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+
+# Oversampling stage for the MCP3008 cell voltage channels.
+#
+# Every read takes a burst of burst_size samples from each channel into a
+# preallocated (burst_size, channels) array and reduces it to one value per
+# channel, all channels at once:
+#   mean      plain average, lowest noise for Gaussian noise
+#   median    ignores up to half the burst being glitches
+#   ema       exponential moving average of the burst means, smooths across reads
+#   reject    average of the samples within outlier_k robust standard
+#             deviations (MAD based) of the burst median
+# The result is scaled to volts with the reference voltage and the divider
+# of each channel. Time spent reading and filtering is tracked per stage.
+
+FILTERS = ('mean', 'median', 'ema', 'reject')
+
+# Scales the median absolute deviation to the standard deviation of normal noise
+MAD_TO_SIGMA = 1.4826
+
+
+class OversampledADC:
+    def __init__(self, channels, dividers, reference_voltage=3.3, burst_size=8, method='median',
+                 ema_alpha=0.3, outlier_k=3.0):
+        """channels are gpiozero-style inputs whose .value is 0..1 of the reference voltage"""
+        if method not in FILTERS:
+            raise ValueError(f"Unknown ADC filter: {method}")
+        if len(dividers) != len(channels):
+            raise ValueError("Need one divider per channel")
+        self.channels = list(channels)
+        self.scale = np.asarray(dividers, dtype=np.float64) * reference_voltage
+        self.samples = np.empty((max(int(burst_size), 1), len(self.channels)))
+        self.method = method
+        self.ema_alpha = ema_alpha
+        self.outlier_k = outlier_k
+        self.ema = None
+        self._filter = getattr(self, f'_{method}')
+
+        # Stage cost and filter statistics
+        self.bursts = 0
+        self.read_time = 0.0
+        self.filter_time = 0.0
+        self.filter_time_max = 0.0
+        self.rejected = 0
+
+    def read(self):
+        """One burst per channel, filtered and scaled; returns an array of volts"""
+        started = time.perf_counter()
+        samples = self.samples
+        for i in range(len(samples)):
+            for c, channel in enumerate(self.channels):
+                samples[i, c] = channel.value
+        sampled = time.perf_counter()
+
+        # All filters are linear in the samples, so scaling afterwards is equivalent
+        values = self._filter(samples) * self.scale
+        finished = time.perf_counter()
+
+        self.bursts += 1
+        self.read_time += sampled - started
+        self.filter_time += finished - sampled
+        self.filter_time_max = max(self.filter_time_max, finished - sampled)
+        return values
+
+    def stats(self):
+        bursts = max(self.bursts, 1)
+        return {
+            'filter': self.method,
+            'burst_size': len(self.samples),
+            'read_ms': self.read_time / bursts * 1000,
+            'filter_ms': self.filter_time / bursts * 1000,
+            'filter_max_ms': self.filter_time_max * 1000,
+            'rejected': self.rejected,
+        }
+
+    def _mean(self, samples):
+        return samples.mean(axis=0)
+
+    def _median(self, samples):
+        return np.median(samples, axis=0)
+
+    def _ema(self, samples):
+        mean = samples.mean(axis=0)
+        if self.ema is None:
+            self.ema = mean
+        else:
+            self.ema = self.ema + self.ema_alpha * (mean - self.ema)
+        return self.ema
+
+    def _reject(self, samples):
+        median = np.median(samples, axis=0)
+        deviation = np.abs(samples - median)
+        mad = np.median(deviation, axis=0)
+        # At least half of every column is within the MAD, so nothing divides by zero
+        keep = deviation <= self.outlier_k * MAD_TO_SIGMA * mad
+        self.rejected += int(keep.size - np.count_nonzero(keep))
+        return np.where(keep, samples, 0.0).sum(axis=0) / keep.sum(axis=0)
@@ -0,0 +1,173 @@
+import logging
+import queue
+import threading
+
+import numpy as np
+
+from db_connection import get_connection_manager
+from time_utils import now_ms, from_epoch_ms
+from rules import RuleSet
+
+# Threshold alerts evaluated on a background thread.
+#
+# A limit opens an alert once it has been exceeded for its minimum duration,
+# and the alert closes once the value has been back past the clear threshold
+# (the limit minus hysteresis) for as long. Single out-of-range samples and
+# values hovering around the limit therefore don't flap. Samples are checked
+# in batches by a compiled RuleSet (see rules.py). Open and close are written
+# to the Alerts table and published on the events queue, which the GUI drains
+# on its own thread.
+
+
+class AlertEvent:
+    """An alert opening ('open') or closing ('close')"""
+    def __init__(self, kind, rule, timestamp, value, alert_id=None):
+        self.kind = kind
+        self.rule = rule
+        self.timestamp = timestamp
+        self.value = value
+        self.alert_id = alert_id
+
+    def describe(self):
+        time_text = from_epoch_ms(self.timestamp).strftime('%H:%M:%S')
+        if self.kind == 'open':
+            return f"{time_text} {self.rule.message}: {self.value:.2f} (limit {self.rule.threshold:g})"
+        return f"{time_text} {self.rule.message} cleared (peak {self.value:.2f})"
+
+
+class AlertEngine:
+    def __init__(self, rules=None, max_queue_size=10000, batch_size=1000):
+        """rules is a RuleSet; by default it is compiled from Configuration"""
+        self.rules = rules if rules is not None else RuleSet.from_configuration()
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.events = queue.Queue()
+        self.thread = None
+        self.is_running = False
+        self.samples_dropped = 0
+        # Samples of packs the rules have no limits for
+        self.samples_unknown_pack = 0
+        # Alerts table id of every open alert, by rule
+        self.alert_ids = {}
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self._close_stale_alerts()
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, name="AlertEngine")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, timestamp, sample, pack_id=None):
+        """Queue a (timestamp_ms, SAMPLE_COLUMNS values) sample for evaluation without blocking"""
+        if pack_id is None:
+            pack = 0
+        elif pack_id in self.rules.pack_index:
+            pack = self.rules.pack_index[pack_id]
+        else:
+            self.samples_unknown_pack += 1
+            if self.samples_unknown_pack % 1000 == 1:
+                logging.warning(f"No alert rules for pack {pack_id}, "
+                                f"{self.samples_unknown_pack} samples not evaluated so far")
+            return False
+        try:
+            self.queue.put_nowait((timestamp, sample, pack))
+            return True
+        except queue.Full:
+            self.samples_dropped += 1
+            if self.samples_dropped % 1000 == 1:
+                logging.warning(f"Alert queue full, {self.samples_dropped} samples dropped so far")
+            return False
+
+    def poll_events(self):
+        """Return the events published since the last call"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def active_rules(self):
+        return self.rules.active_rules()
+
+    def shutdown(self, timeout=5.0):
+        self.is_running = False
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=0.5)]
+            except queue.Empty:
+                if not self.is_running:
+                    break
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            samples = [item for item in batch if item is not None]
+            if samples:
+                events = self.evaluate(
+                    [item[0] for item in samples], [item[1] for item in samples], [item[2] for item in samples]
+                )
+                if events:
+                    self._persist(events)
+                    for event in events:
+                        self.events.put(event)
+            if stop:
+                break
+
+    def evaluate(self, timestamps, values, packs=None):
+        """Check a batch of samples in one vectorized pass; returns AlertEvents"""
+        transitions = self.rules.evaluate(np.asarray(timestamps), np.asarray(values), packs)
+        return [AlertEvent(kind, self.rules.rule(p, slot), timestamp, value)
+                for kind, p, slot, timestamp, value in transitions]
+
+    def _persist(self, events):
+        try:
+            with get_connection_manager().writer() as conn:
+                for event in events:
+                    rule = event.rule
+                    if event.kind == 'open':
+                        cursor = conn.execute('''
+                        INSERT INTO Alerts (rule, severity, opened_ms, threshold, peak_value, message)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ''', (rule.name, rule.severity, event.timestamp, rule.threshold, event.value, rule.message))
+                        event.alert_id = self.alert_ids[rule] = cursor.lastrowid
+                        continue
+                    event.alert_id = self.alert_ids.pop(rule, None)
+                    if event.alert_id is not None:
+                        conn.execute('UPDATE Alerts SET closed_ms = ?, peak_value = ? WHERE id = ?',
+                                     (event.timestamp, event.value, event.alert_id))
+        except Exception as e:
+            print(f"Error saving alerts: {str(e)}")
+
+    def _close_stale_alerts(self):
+        # Alerts still open from a previous run have no state here anymore
+        try:
+            with get_connection_manager().writer() as conn:
+                conn.execute('UPDATE Alerts SET closed_ms = ? WHERE closed_ms IS NULL', (now_ms(),))
+        except Exception as e:
+            print(f"Error closing stale alerts: {str(e)}")
+
+
+def get_alerts(start_ms=None, end_ms=None, limit=1000):
+    """Return alert history rows (id, rule, severity, opened_ms, closed_ms, threshold, peak_value, message), newest first"""
+    sql = 'SELECT id, rule, severity, opened_ms, closed_ms, threshold, peak_value, message FROM Alerts WHERE 1'
+    params = []
+    if start_ms is not None:
+        sql += ' AND opened_ms >= ?'
+        params.append(start_ms)
+    if end_ms is not None:
+        sql += ' AND opened_ms < ?'
+        params.append(end_ms)
+    with get_connection_manager().reader() as conn:
+        return conn.execute(sql + ' ORDER BY opened_ms DESC LIMIT ?', params + [limit]).fetchall()
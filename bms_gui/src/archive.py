@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from db_connection import get_connection_manager
+from database_schema import SAMPLE_COLUMNS, DEFAULT_PACK_ID, pack_columns
+from partitions import list_partitions, DAY_MS
+
+# Columnar archive of historical samples of one pack for offline analysis.
+#
+# An archive is a directory with one raw little-endian file per column
+# (timestamp.bin as int64 epoch ms, one float64 file per measurement the pack
+# has) and a manifest.json describing the pack, columns, row count and a
+# per-day time index of row ranges. The loader memory-maps the column files,
+# so selecting any time range returns NumPy views without reading or copying
+# the rest of the archive.
+
+ARCHIVE_FORMAT = 'bms-columnar'
+ARCHIVE_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+TIMESTAMP_DTYPE = '<i8'
+VALUE_DTYPE = '<f8'
+
+def _day_batches(start_ms, end_ms, batch_size, pack_id, columns):
+    """Yield (day, timestamps, values) batches from whichever storage backend is active"""
+    from database import get_chunk_store
+
+    chunk_store = get_chunk_store()
+    if chunk_store:
+        # Chunks aren't partitioned, walk the range one day at a time
+        indexes = [SAMPLE_COLUMNS.index(col) for col in columns]
+        oldest, newest = chunk_store.get_bounds(pack_id)
+        if oldest is None:
+            return
+        first = start_ms if start_ms is not None else oldest
+        last = end_ms if end_ms is not None else newest + 1
+        for day in range(first // DAY_MS, (last - 1) // DAY_MS + 1):
+            lo, hi = max(first, day * DAY_MS), min(last, (day + 1) * DAY_MS)
+            timestamps, values = chunk_store.get_range(lo, hi, pack_id)
+            if len(timestamps):
+                yield day, timestamps, values[:, indexes]
+        return
+
+    with get_connection_manager().reader() as conn:
+        partitions = list_partitions(conn, start_ms, end_ms)
+
+    cols = ', '.join(columns)
+    lo = start_ms if start_ms is not None else -2**62
+    hi = end_ms if end_ms is not None else 2**62
+    for day, table in partitions:
+        with get_connection_manager().reader() as conn:
+            cursor = conn.execute(f'''
+            SELECT timestamp, {cols} FROM {table}
+            WHERE pack_id = ? AND timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+            ''', (pack_id, lo, hi))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                data = np.array(rows, dtype=np.float64)
+                yield day, np.array([row[0] for row in rows], dtype=np.int64), data[:, 1:]
+
+def export_archive(out_dir, start_ms=None, end_ms=None, batch_size=50000, progress=None,
+                   pack_id=DEFAULT_PACK_ID, columns=None):
+    """Write samples of a pack in [start_ms, end_ms) to a columnar archive; returns the manifest.
+
+    columns are the measurements to archive, by default the cells of the pack
+    as registered in Packs plus temperature and state of charge.
+    """
+    if columns is None:
+        from database import get_packs
+
+        pack = get_packs().get(pack_id)
+        columns = pack_columns(pack[1]) if pack else SAMPLE_COLUMNS
+    dtypes = {'timestamp': TIMESTAMP_DTYPE}
+    dtypes.update({col: VALUE_DTYPE for col in columns})
+
+    os.makedirs(out_dir, exist_ok=True)
+    files = {name: open(os.path.join(out_dir, f'{name}.bin'), 'wb') for name in dtypes}
+
+    row_count = 0
+    index = []
+    try:
+        for day, timestamps, values in _day_batches(start_ms, end_ms, batch_size, pack_id, columns):
+            if not index or index[-1]['day'] != day:
+                index.append({'day': day, 'row_start': row_count, 'row_end': row_count,
+                              'start_ms': int(timestamps[0]), 'end_ms': int(timestamps[-1])})
+            files['timestamp'].write(timestamps.astype(TIMESTAMP_DTYPE).tobytes())
+            for i, col in enumerate(columns):
+                files[col].write(np.ascontiguousarray(values[:, i], dtype=VALUE_DTYPE).tobytes())
+
+            row_count += len(timestamps)
+            index[-1]['row_end'] = row_count
+            index[-1]['end_ms'] = int(timestamps[-1])
+            if progress:
+                progress(row_count)
+    finally:
+        for f in files.values():
+            f.close()
+
+    manifest = {
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'created': datetime.now().isoformat(),
+        'pack_id': pack_id,
+        'row_count': row_count,
+        'start_ms': index[0]['start_ms'] if index else None,
+        'end_ms': index[-1]['end_ms'] if index else None,
+        'columns': [{'name': name, 'dtype': dtype, 'file': f'{name}.bin'}
+                    for name, dtype in dtypes.items()],
+        'time_index': index,
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def open_archive(path):
+    """Return (manifest, {column: read-only memmap}) for an archive directory"""
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARCHIVE_FORMAT or manifest.get('version') != ARCHIVE_VERSION:
+        raise ValueError(f"{path} is not a supported BMS archive")
+
+    count = manifest['row_count']
+    columns = {}
+    for column in manifest['columns']:
+        if count:
+            columns[column['name']] = np.memmap(os.path.join(path, column['file']),
+                                                dtype=column['dtype'], mode='r', shape=(count,))
+        else:
+            columns[column['name']] = np.empty(0, dtype=column['dtype'])
+    return manifest, columns
+
+def load_archive(path, start_ms=None, end_ms=None):
+    """Return {column: array view} for start_ms <= timestamp < end_ms without copying data"""
+    manifest, columns = open_archive(path)
+
+    # Narrow to the days involved first, then binary search inside them
+    days = [entry for entry in manifest['time_index']
+            if (start_ms is None or entry['end_ms'] >= start_ms)
+            and (end_ms is None or entry['start_ms'] < end_ms)]
+    if not days:
+        return {name: values[0:0] for name, values in columns.items()}
+    base, hi = days[0]['row_start'], days[-1]['row_end']
+
+    timestamps = columns['timestamp'][base:hi]
+    lo = base
+    if start_ms is not None:
+        lo = base + int(np.searchsorted(timestamps, start_ms, side='left'))
+    if end_ms is not None:
+        hi = base + int(np.searchsorted(timestamps, end_ms, side='left'))
+    return {name: values[lo:hi] for name, values in columns.items()}
+
+if __name__ == "__main__":
+    # python archive.py <output directory> [start ISO time] [end ISO time]
+    from time_utils import to_epoch_ms
+
+    if len(sys.argv) < 2:
+        print("Usage: archive.py <output directory> [start] [end]")
+        sys.exit(1)
+    start = to_epoch_ms(sys.argv[2]) if len(sys.argv) > 2 else None
+    end = to_epoch_ms(sys.argv[3]) if len(sys.argv) > 3 else None
+    result = export_archive(sys.argv[1], start, end)
+    print(f"Archived {result['row_count']} samples to {sys.argv[1]}")
@@ -6,37 +6,122 @@ import logging
 import threading
 import sys
 import os
+import functools
+
+from sensor_scheduler import SensorScheduler
+from database_schema import DEFAULT_PACK_ID, DEFAULT_CELL_COUNT, MAX_CELLS
+from pack_model import PackSample
 
 # Add import for bms_code compatibility
 import importlib.util
 
-# Initialize hardware availability flags
-RPI_HARDWARE_AVAILABLE = False
-try:
-    # Try to import the needed modules for Raspberry Pi operation
-    import board
-    import adafruit_dht
-    from gpiozero import MCP3008
-    RPI_HARDWARE_AVAILABLE = True
-except ImportError:
-    pass
+# Detection and the Raspberry Pi sensor libraries are only touched when a
+# connection is made; importing the Adafruit/gpiozero stack takes seconds on
+# a Pi and is skipped entirely elsewhere. Both results are cached.
+
+@functools.lru_cache(maxsize=None)
+def is_raspberry_pi():
+    """Check if we're running on a Raspberry Pi"""
+    for path in ('/proc/device-tree/model', '/proc/cpuinfo'):
+        try:
+            with open(path, 'r', errors='ignore') as f:
+                if 'Raspberry Pi' in f.read():
+                    return True
+        except OSError:
+            continue
+    return False
+
+@functools.lru_cache(maxsize=None)
+def load_hardware():
+    """Import the sensor libraries; returns (board, adafruit_dht, MCP3008) or None if unavailable"""
+    try:
+        import board
+        import adafruit_dht
+        from gpiozero import MCP3008
+        return board, adafruit_dht, MCP3008
+    except ImportError:
+        return None
+
+# Default sensor rates in Hz; Configuration keys adc_sample_rate_hz and temperature_sample_rate_hz
+ADC_SAMPLE_RATE_HZ = 50.0
+TEMPERATURE_SAMPLE_RATE_HZ = 0.5
+
+# Cell voltage front end (Configuration keys cell_count, cell<n>_divider,
+# adc_reference_voltage, adc_burst_size and adc_filter; see adc_filter.py for
+# the filters). Cells past the ones listed here default to a divider of 1.
+CELL_DIVIDERS = [5.7, 3.127, 1.47]
+ADC_REFERENCE_VOLTAGE = 3.3
+ADC_BURST_SIZE = 8
+ADC_FILTER = 'median'
+
+# Simulated source (Configuration keys simulator_seed, simulator_rate_hz and
+# simulator_dropout_rate; an empty seed gives a different stream every time)
+SIMULATOR_RATE_HZ = 1.0
+
+# Seconds between read_data() polls for sources without a rate of their own
+POLL_INTERVAL = 1.0
+
+# Where samples come from (Configuration key bms_source):
+#   auto       Raspberry Pi sensors if present, otherwise simulated data
+#   serial     external BMS board on com_port/baud_rate, see serial_protocol.py
+#   simulated  simulated data
+#   replay     recorded samples (Configuration keys replay_path, empty for the
+#              database, replay_pack_id and replay_speed; see replay.py)
+BMS_SOURCES = ('auto', 'serial', 'simulated', 'replay')
+# Longest a serial read waits for data, so disconnect() is never held up
+SERIAL_READ_TIMEOUT = 0.1
+
+def _positive(value):
+    value = float(value)
+    if not value > 0:
+        raise ValueError("must be greater than 0")
+    return value
+
+def _bms_source(value):
+    if value not in BMS_SOURCES:
+        raise ValueError(f"not one of {', '.join(BMS_SOURCES)}")
+    return value
 
 class BMSCommunication:
     def __init__(self):
         self.port = 'COM1'  # Default COM port for non-Raspberry Pi operation
         self.baud_rate = 9600  # Default baud rate
         self.serial_conn = None
+        self.decoder = None
+        self.source = 'auto'
         self.connected = False
         self.data_thread = None
         self.is_running = False
         self.is_raspberry_pi = False
+        self.scheduler = None
+        self.adc_rate_hz = ADC_SAMPLE_RATE_HZ
+        self.temperature_rate_hz = TEMPERATURE_SAMPLE_RATE_HZ
+        self.pack_id = DEFAULT_PACK_ID
+        self.cell_count = DEFAULT_CELL_COUNT
+        self.cell_dividers = list(CELL_DIVIDERS)
+        self.adc_reference_voltage = ADC_REFERENCE_VOLTAGE
+        self.adc_burst_size = ADC_BURST_SIZE
+        self.adc_filter = ADC_FILTER
+        self.adc = None
+        self.simulator_seed = None
+        self.simulator_rate_hz = SIMULATOR_RATE_HZ
+        self.simulator_dropout_rate = 0.0
+        self.replay_path = ''
+        self.replay_pack_id = DEFAULT_PACK_ID
+        self.replay_speed = '1x'
+        # Replay being served by read_data(); finished once it ran to the end
+        self.replayer = None
+        self.replay_lock = threading.Lock()
+        self.finished = False
+        # Storage and alerting for sources that deliver every sample themselves, see attach()
+        self.writer = None
+        self.alert_engine = None
         
-        # Initialize data storage
-        self.cell_values = [0.0, 0.0, 0.0]
-        self.temperature = 0.0
-        self.total_voltage = 0.0
-        self.current = 0.0
-        self.state_of_charge = 0.0
+        # Latest reading, updated in place by the acquisition thread
+        self.sample = PackSample(self.pack_id, self.cell_count)
+        # time.time() of the last good temperature reading; the value is kept between reads
+        self.temperature_updated = None
+        self.samples_received = 0
         
         # Setup logging
         os.makedirs('logs', exist_ok=True)
@@ -45,18 +130,20 @@ class BMSCommunication:
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
+        self._load_sensor_settings()
+        self.sample = PackSample(self.pack_id, self.cell_count)
 
     def _check_if_raspberry_pi(self):
         """Check if we're running on a Raspberry Pi"""
-        try:
-            with open('/proc/cpuinfo', 'r') as f:
-                return 'Raspberry Pi' in f.read()
-        except:
-            return False
+        return is_raspberry_pi()
 
     def connect(self):
         try:
-            if self._check_if_raspberry_pi() and RPI_HARDWARE_AVAILABLE:
+            if self.source == 'serial':
+                return self._connect_serial()
+            if self.source == 'replay':
+                return self._connect_replay()
+            if self.source == 'auto' and self._check_if_raspberry_pi() and load_hardware() is not None:
                 # For Raspberry Pi, we'll use direct hardware access
                 self.is_raspberry_pi = True
                 self.connected = True
@@ -81,123 +168,304 @@ class BMSCommunication:
 
     def disconnect(self):
         self.is_running = False
+        if self.scheduler:
+            self.scheduler.stop()
         if self.data_thread and self.data_thread.is_alive():
             self.data_thread.join(timeout=2.0)
         self.connected = False
         self.log_error("BMS Connection closed", "INFO")
 
+    def _connect_serial(self):
+        # Only needed for serial boards; keeps NumPy out of the import of this module
+        from serial_protocol import FrameDecoder
+        
+        self.serial_conn = serial.Serial(self.port, self.baud_rate, timeout=SERIAL_READ_TIMEOUT)
+        self.decoder = FrameDecoder()
+        self.connected = True
+        self.is_running = True
+        self.data_thread = threading.Thread(target=self._read_serial_data)
+        self.data_thread.daemon = True
+        self.data_thread.start()
+        self.log_error(f"Serial BMS connection on {self.port} at {self.baud_rate} baud", "INFO")
+        return True
+
+    def attach(self, writer, alert_engine):
+        """Have streaming sources pass every sample to an IngestWriter and an AlertEngine.
+
+        A serial board or the Pi's ADC produce more samples than anyone polls
+        with read_data(); while streaming is True the polled reading is only
+        for display and must not be stored or alerted on again.
+        """
+        self.writer = writer
+        self.alert_engine = alert_engine
+
+    @property
+    def streaming(self):
+        return self.writer is not None and (self.source == 'serial' or self.is_raspberry_pi)
+
+    @property
+    def poll_interval(self):
+        """Seconds between read_data() calls that keep up with the source"""
+        if self.is_raspberry_pi:
+            return 1.0 / self.adc_rate_hz
+        if self.source in ('auto', 'simulated'):
+            return 1.0 / self.simulator_rate_hz
+        return POLL_INTERVAL
+
+    @property
+    def replaying(self):
+        """True for replays: read_data() serves every sample once, in order, with its recorded timestamp"""
+        return self.source == 'replay'
+
+    @property
+    def stores_samples(self):
+        """False for replays: the samples are recorded already, storing them again would duplicate them"""
+        return self.source != 'replay'
+
+    def _read_serial_data(self):
+        """Thread function to decode sample frames from the serial port until disconnect"""
+        from serial_protocol import ReceiptClock, decode_samples
+        from time_utils import now_ms
+        
+        clock = ReceiptClock()
+        try:
+            while self.is_running:
+                # Everything already received, or wait up to the timeout for the first byte
+                data = self.serial_conn.read(self.serial_conn.in_waiting or 1)
+                if not data:
+                    continue
+                received_ms = now_ms()
+                batches = decode_samples(self.decoder.feed(data))
+                if not batches:
+                    continue
+                
+                timestamps = clock.stamp(received_ms, sum(len(batch) for batch in batches))
+                if self.streaming:
+                    self._deliver(batches, timestamps.tolist())
+                
+                latest = batches[-1][-1]
+                sample = self.sample
+                sample.set_cells(latest['cells'].tolist())
+                sample.current = float(latest['current'])
+                sample.temperature = float(latest['temperature'])
+                self.temperature_updated = time.time()
+                sample.state_of_charge = float(latest['state_of_charge'])
+                self.samples_received += len(timestamps)
+        except Exception as e:
+            self.log_error(f"Serial read error: {str(e)}", "ERROR")
+        finally:
+            # The last reading would otherwise be served, and stored, forever
+            self.connected = False
+            self.is_running = False
+            self.serial_conn.close()
+
+    def _deliver(self, batches, timestamps):
+        """Queue every decoded sample for storage and alerting"""
+        from acquisition import sample_values
+
+        position = 0
+        for batch in batches:
+            values = sample_values(batch['cells'], batch['temperature'], batch['state_of_charge'])
+            cell_count = batch['cells'].shape[1]
+            for timestamp, row in zip(timestamps[position:position + len(batch)], values.tolist()):
+                self.writer.submit_row((timestamp, self.pack_id, *row), cell_count)
+                if self.alert_engine:
+                    self.alert_engine.submit(timestamp, row, pack_id=self.pack_id)
+            position += len(batch)
+
+    def _connect_replay(self):
+        from replay import Replayer, open_batches, parse_speed
+        
+        replayer = Replayer(open_batches(self.replay_path or None, pack_id=self.replay_pack_id),
+                            parse_speed(self.replay_speed))
+        with self.replay_lock:
+            self.replayer = replayer
+        self.finished = False
+        self.connected = True
+        self.is_running = True
+        self.data_thread = threading.Thread(target=self._replay_data, args=(replayer,))
+        self.data_thread.daemon = True
+        self.data_thread.start()
+        self.log_error(f"Replaying {self.replay_path or 'stored data'} of pack {self.replay_pack_id} "
+                       f"at {self.replay_speed}", "INFO")
+        return True
+
+    def _replay_data(self, replayer):
+        """Thread function to end the replay once read_data() has served every sample, or on disconnect"""
+        try:
+            while self.is_running and not replayer.finished:
+                # Short sleeps, so disconnect() is never held up
+                time.sleep(SERIAL_READ_TIMEOUT)
+            if replayer.finished:
+                self.finished = True
+                self.log_error(f"Replay finished after {replayer.samples} samples", "INFO")
+        finally:
+            with self.replay_lock:
+                # Nothing more to serve; stale readings must not be read as new ones
+                self.connected = False
+                self.is_running = False
+                self.replayer = None
+                replayer.close()
+
+    def _read_replay(self, into):
+        """Next sample of the replay in order, None until it is due"""
+        with self.replay_lock:
+            if self.replayer is None:
+                return None
+            try:
+                sample = self.replayer.read_data(self.sample)
+            except Exception as e:
+                self.log_error(f"Replay error: {str(e)}", "ERROR")
+                self.replayer.finished = True
+                return None
+            if sample is None:
+                return None
+            self.temperature_updated = time.time()
+            self.samples_received += 1
+        if into is None:
+            return sample.copy()
+        return sample.copy_to(into)
+
+    def link_stats(self):
+        """Frame statistics of the serial link ({} when not using one)"""
+        if not self.decoder:
+            return {}
+        stats = self.decoder.stats()
+        stats['samples'] = self.samples_received
+        return stats
+
+    def _load_sensor_settings(self):
+        """Settings from Configuration; an invalid value only resets its own setting"""
+        try:
+            from database import get_configuration
+            config = get_configuration()
+        except Exception as e:
+            self.log_error(f"Using default sensor settings: {str(e)}", "WARNING")
+            return
+
+        def setting(key, parse, default):
+            if key not in config:
+                return default
+            try:
+                return parse(config[key])
+            except (TypeError, ValueError) as e:
+                self.log_error(f"Invalid {key} {config[key]!r} ({str(e)}), using {default!r}", "WARNING")
+                return default
+
+        self.source = setting('bms_source', _bms_source, self.source)
+        self.port = setting('com_port', str, self.port)
+        self.baud_rate = setting('baud_rate', int, self.baud_rate)
+        self.adc_rate_hz = setting('adc_sample_rate_hz', _positive, self.adc_rate_hz)
+        self.temperature_rate_hz = setting('temperature_sample_rate_hz', _positive, self.temperature_rate_hz)
+        self.cell_count = min(max(setting('cell_count', int, self.cell_count), 1), MAX_CELLS)
+        self.cell_dividers = [setting(f'cell{n}_divider', float, divider)
+                              for n, divider in enumerate(self._default_dividers(), start=1)]
+        self.adc_reference_voltage = setting('adc_reference_voltage', _positive, self.adc_reference_voltage)
+        self.adc_burst_size = setting('adc_burst_size', int, self.adc_burst_size)
+        self.adc_filter = setting('adc_filter', str, self.adc_filter)
+        self.simulator_seed = setting('simulator_seed', lambda value: int(value) if value else None,
+                                      self.simulator_seed)
+        self.simulator_rate_hz = setting('simulator_rate_hz', _positive, self.simulator_rate_hz)
+        self.simulator_dropout_rate = setting('simulator_dropout_rate', float, self.simulator_dropout_rate)
+        self.replay_path = setting('replay_path', str, self.replay_path)
+        self.replay_pack_id = setting('replay_pack_id', int, self.replay_pack_id)
+        self.replay_speed = setting('replay_speed', str, self.replay_speed)
+
+    def _default_dividers(self):
+        return [CELL_DIVIDERS[n] if n < len(CELL_DIVIDERS) else 1.0 for n in range(self.cell_count)]
+
     def _read_raspberry_pi_data(self):
-        """Thread function to continuously read data from Raspberry Pi sensors"""
-        if not RPI_HARDWARE_AVAILABLE:
+        """Thread function to read the Raspberry Pi sensors, each at its own rate, until disconnect"""
+        hardware = load_hardware()
+        if hardware is None:
             return
-            
+        board, adafruit_dht, MCP3008 = hardware
+        
+        dht_device = None
         try:
+            # Only needed on the Pi; keeps NumPy out of the import of this module
+            from adc_filter import OversampledADC
+            from time_utils import now_ms
+            
             # Initialize the sensors
-            cell_1 = MCP3008(channel=0)
-            cell_2 = MCP3008(channel=1)
-            cell_3 = MCP3008(channel=2)
+            self.adc = OversampledADC(
+                [MCP3008(channel=channel) for channel in range(len(self.cell_dividers))],
+                self.cell_dividers,
+                reference_voltage=self.adc_reference_voltage,
+                burst_size=self.adc_burst_size,
+                method=self.adc_filter,
+            )
             dht_device = adafruit_dht.DHT22(board.D4, use_pulseio=False)
             
-            while self.is_running:
-                try:
-                    # Read cell voltages
-                    self.cell_values[0] = (cell_1.value * 3.3) * 5.7
-                    self.cell_values[1] = (cell_2.value * 3.3) * 3.127
-                    self.cell_values[2] = (cell_3.value * 3.3) * 1.47
-                    
-                    # Read temperature
-                    self.temperature = dht_device.temperature
-                    
-                    # Calculate total voltage
-                    self.total_voltage = sum(self.cell_values)
-                    
-                    time.sleep(2.0)
-                    
-                except RuntimeError as error:
-                    self.log_error(f"Sensor reading error: {error.args[0]}", "WARNING")
-                    time.sleep(2.0)
-                except Exception as e:
-                    self.log_error(f"Hardware reading error: {str(e)}", "ERROR")
-                    time.sleep(2.0)
+            def read_cells():
+                self.sample.set_cells(self.adc.read())
+                writer, alert_engine = self.writer, self.alert_engine
+                if writer:
+                    # Every ADC read is stored and alerted on, not only the ones read_data() is polled for
+                    self.sample.timestamp = now_ms()
+                    writer.submit(self.sample)
+                    if alert_engine:
+                        alert_engine.submit(self.sample.timestamp, self.sample.values(), pack_id=self.pack_id)
+                    self.samples_received += 1
+            
+            def read_temperature():
+                # Failed DHT22 reads raise RuntimeError; the last good value stays in place
+                temperature = dht_device.temperature
+                if temperature is not None:
+                    self.sample.temperature = temperature
+                    self.temperature_updated = time.time()
+            
+            self.scheduler = SensorScheduler()
+            self.scheduler.add('adc', self.adc_rate_hz, read_cells)
+            self.scheduler.add('dht22', self.temperature_rate_hz, read_temperature, isolated=True)
+            if self.is_running:
+                self.scheduler.run()
         except Exception as e:
             self.log_error(f"Failed to initialize hardware: {str(e)}", "ERROR")
             self.is_running = False
+        finally:
+            if dht_device is not None:
+                dht_device.exit()
+
+    def sensor_stats(self):
+        """Per-sensor read statistics ({} when not reading hardware)"""
+        stats = self.scheduler.stats() if self.scheduler else {}
+        if self.adc and 'adc' in stats:
+            stats['adc'].update(self.adc.stats())
+        return stats
 
     def _generate_simulated_data(self):
         """Generate simulated data for testing when hardware is not available"""
-        import random
-        import math
-        
-        # Starting values
-        cell1_base = 12.0
-        cell2_base = 12.5
-        cell3_base = 12.8
-        temp_base = 25.0
-        soc_base = 80.0
-        
-        # For simple sine wave variation
-        time_counter = 0
-        
-        # For tracking when to generate spikes
-        next_voltage_spike = random.randint(5, 15)
-        next_temp_spike = random.randint(5, 15)
+        # NumPy is only needed here, see simulator.py
+        from simulator import PackSimulator
         
+        simulator = PackSimulator(self.cell_count, self.simulator_seed, self.pack_id, self.simulator_rate_hz,
+                                  dropout_rate=self.simulator_dropout_rate)
+        # Fixed schedule, so the rate doesn't drift with the time a sample takes
+        period = 1.0 / self.simulator_rate_hz
+        next_tick = time.monotonic()
         while self.is_running:
             try:
-                time_counter += 1
-                
-                # Add some sine wave variation plus small random noise
-                sine_factor = math.sin(time_counter / 10) * 0.5
-                
-                # Determine if we should create voltage spike
-                if time_counter >= next_voltage_spike:
-                    # Generate a spike that exceeds threshold
-                    voltage_spike = random.uniform(1.0, 2.5)
-                    next_voltage_spike = time_counter + random.randint(20, 40)  # Next spike in 20-40 seconds
-                else:
-                    voltage_spike = 0
-                
-                # Determine if we should create temperature spike
-                if time_counter >= next_temp_spike:
-                    # Generate a spike that exceeds threshold
-                    temp_spike = random.uniform(5.0, 10.0)
-                    next_temp_spike = time_counter + random.randint(30, 60)  # Next spike in 30-60 seconds
-                else:
-                    temp_spike = 0
-                
-                # Update cell values with variation and potential spike
-                self.cell_values[0] = cell1_base + sine_factor + random.uniform(-0.1, 0.1) + voltage_spike
-                self.cell_values[1] = cell2_base + sine_factor + random.uniform(-0.1, 0.1) + (voltage_spike * 0.8)
-                self.cell_values[2] = cell3_base + sine_factor + random.uniform(-0.1, 0.1) + (voltage_spike * 0.6)
-                
-                # Update temperature with variation and potential spike
-                self.temperature = temp_base + sine_factor + random.uniform(-0.5, 0.5) + temp_spike
-                
-                # Update total voltage
-                self.total_voltage = sum(self.cell_values)
-                
-                # Update SOC (decrease during voltage spikes to simulate high load)
-                soc_adjustment = -5.0 if voltage_spike > 0 else 0
-                self.state_of_charge = max(0, min(100, soc_base + sine_factor * 3 + random.uniform(-1, 1) + soc_adjustment))
-                
-                time.sleep(1.0)
-                
+                simulator.next_sample(self.sample)
             except Exception as e:
                 self.log_error(f"Simulation error: {str(e)}", "ERROR")
-                time.sleep(1.0)
+            next_tick += period
+            time.sleep(max(next_tick - time.monotonic(), 0))
+
+    def read_data(self, into=None):
+        """Latest reading as a PackSample; copied into `into` if given, so polling allocates nothing.
 
-    def read_data(self):
+        A replay instead serves its samples one per call, in order, once they are due.
+        """
         if not self.connected:
             return None
+        if self.source == 'replay':
+            return self._read_replay(into)
 
         try:
-            return {
-                'voltage': self.total_voltage,
-                'current': self.current,
-                'temperature': self.temperature,
-                'state_of_charge': self.state_of_charge,
-                'cell_voltages': self.cell_values.copy()
-            }
+            if into is None:
+                return self.sample.copy()
+            return self.sample.copy_to(into)
         except Exception as e:
             self.log_error(f"Error reading BMS data: {str(e)}", "ERROR")
             return None
@@ -212,10 +480,56 @@ class BMSCommunication:
 
     def update_configuration(self, parameter, value):
         try:
-            if parameter == 'port':
+            if parameter in ('port', 'com_port'):
                 self.port = value
+            elif parameter == 'bms_source':
+                if value not in BMS_SOURCES:
+                    raise ValueError(f"Unknown BMS source: {value}")
+                self.source = value
             elif parameter == 'baud_rate':
                 self.baud_rate = int(value)
+            elif parameter == 'adc_sample_rate_hz':
+                rate_hz = float(value)
+                if not rate_hz > 0:
+                    raise ValueError("The ADC sample rate must be greater than 0 Hz")
+                self.adc_rate_hz = rate_hz
+            elif parameter == 'temperature_sample_rate_hz':
+                rate_hz = float(value)
+                if not rate_hz > 0:
+                    raise ValueError("The temperature sample rate must be greater than 0 Hz")
+                self.temperature_rate_hz = rate_hz
+            elif parameter == 'cell_count':
+                cell_count = int(value)
+                if not 0 < cell_count <= MAX_CELLS:
+                    raise ValueError(f"A pack has 1 to {MAX_CELLS} cells")
+                self.cell_count = cell_count
+                self.cell_dividers = (self.cell_dividers + self._default_dividers()[len(self.cell_dividers):])[:cell_count]
+                self.sample = PackSample(self.pack_id, cell_count)
+            elif parameter in [f'cell{n}_divider' for n in range(1, len(self.cell_dividers) + 1)]:
+                self.cell_dividers[int(parameter[4:-len('_divider')]) - 1] = float(value)
+            elif parameter == 'adc_reference_voltage':
+                self.adc_reference_voltage = float(value)
+            elif parameter == 'adc_burst_size':
+                self.adc_burst_size = int(value)
+            elif parameter == 'adc_filter':
+                self.adc_filter = value
+            elif parameter == 'simulator_seed':
+                self.simulator_seed = int(value) if value else None
+            elif parameter == 'simulator_rate_hz':
+                rate_hz = float(value)
+                if not rate_hz > 0:
+                    raise ValueError("The simulator rate must be greater than 0 Hz")
+                self.simulator_rate_hz = rate_hz
+            elif parameter == 'simulator_dropout_rate':
+                self.simulator_dropout_rate = float(value)
+            elif parameter == 'replay_path':
+                self.replay_path = value
+            elif parameter == 'replay_pack_id':
+                self.replay_pack_id = int(value)
+            elif parameter == 'replay_speed':
+                from replay import parse_speed
+                parse_speed(value)
+                self.replay_speed = value
             self.log_error(f"Configuration updated: {parameter} = {value}", "INFO")
             return True
         except Exception as e:
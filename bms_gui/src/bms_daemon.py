@@ -0,0 +1,303 @@
+import startup_timing
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+# Headless acquisition service for unattended units: BMS acquisition, storage
+# and alerting without Tk, matplotlib or pandas. A supervisor loop samples the
+# BMS on a fixed schedule and restarts whatever stopped (BMS connection,
+# database writer, alert engine). SIGTERM/SIGINT shut down cleanly after
+# flushing queued samples; SIGHUP reloads the alert limits from Configuration.
+#
+# With --sources the daemon is a gateway for many packs instead: the sources
+# in the file (see acquisition.py) run on one asyncio event loop and their
+# samples go to storage and alerting tagged with their pack id.
+#
+#   python bms_daemon.py [--interval SECONDS] [--log-file PATH] [--sources FILE]
+
+from database_schema import create_database
+from database import get_configuration
+from db_connection import close_connections
+from ingest_writer import IngestWriter
+from bms_communication import BMSCommunication
+from pack_model import PackSample
+from time_utils import now_ms
+
+DEFAULT_INTERVAL = 1.0
+# Seconds between reconnect attempts, doubling up to the maximum
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 60.0
+
+
+class AcquisitionDaemon:
+    def __init__(self, interval=None, sources=None):
+        self.interval = interval
+        self.sources = sources
+        self.pack_ids = [source.pack_id for source in sources] if sources else [1]
+        self.manager = None
+        self.stop_event = threading.Event()
+        self.reload_requested = False
+        self.bms = None
+        self.sample = PackSample()
+        self.writer = None
+        self.alert_engine = None
+        self.reconnect_delay = RECONNECT_DELAY
+        self.next_reconnect = 0.0
+
+        # Counters for the status line
+        self.samples = 0
+        self.missed_ticks = 0
+
+    def start(self):
+        if not create_database():
+            raise RuntimeError("Database initialization failed")
+        startup_timing.mark("database")
+        if self.interval is None:
+            # sampling_rate is stored in milliseconds
+            try:
+                self.interval = float(get_configuration().get('sampling_rate', 1000)) / 1000
+            except ValueError:
+                self.interval = DEFAULT_INTERVAL
+        if not self.interval > 0:
+            logging.warning(f"Invalid sampling interval {self.interval}, using {DEFAULT_INTERVAL:g} s")
+            self.interval = DEFAULT_INTERVAL
+
+        self.writer = IngestWriter()
+        self.writer.start()
+        # NumPy comes in with the alert rules, after the database is up
+        from alerts import AlertEngine
+        from rules import RuleSet
+
+        self.alert_engine = AlertEngine(RuleSet.from_configuration(pack_ids=self.pack_ids))
+        self.alert_engine.start()
+        startup_timing.mark("alerts")
+        if self.sources:
+            from acquisition import AcquisitionManager
+
+            self.manager = AcquisitionManager(self.sources, self.writer, self.alert_engine)
+            self.manager.start()
+        else:
+            self.bms = BMSCommunication()
+            self.bms.attach(self.writer, self.alert_engine)
+            self._connect()
+        startup_timing.mark("acquisition")
+
+    def request_stop(self, signum=None, frame=None):
+        logging.info(f"Stop requested (signal {signum})")
+        self.stop_event.set()
+
+    def request_reload(self, signum=None, frame=None):
+        self.reload_requested = True
+
+    def run(self):
+        """Supervisor loop; returns once a stop was requested"""
+        next_tick = time.monotonic()
+        last_status = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                self._supervise()
+                self._sample()
+            except Exception as e:
+                logging.error(f"Acquisition error: {str(e)}")
+
+            # Fixed schedule: ticks that were overrun are skipped, not bunched up
+            next_tick += self.interval
+            now = time.monotonic()
+            if now > next_tick:
+                skipped = int((now - next_tick) / self.interval) + 1
+                self.missed_ticks += skipped
+                next_tick += skipped * self.interval
+            if now - last_status >= 60:
+                last_status = now
+                self._log_status()
+            self.stop_event.wait(max(next_tick - time.monotonic(), 0))
+
+    def _log_status(self):
+        logging.info(f"Status: {self.samples} samples, {self.missed_ticks} missed ticks, "
+                     f"{self.writer.rows_dropped} dropped by writer, "
+                     f"{len(self.alert_engine.active_rules())} active alerts")
+        if self.manager:
+            sources = self.manager.stats()
+            states = {}
+            for stats in sources.values():
+                states[stats['state']] = states.get(stats['state'], 0) + 1
+            logging.info("Sources: " + ", ".join(f"{count} {state}" for state, count in sorted(states.items())))
+            for name, stats in sources.items():
+                if stats['state'] != 'streaming' and stats['last_error']:
+                    logging.info(f"Source {name}: {stats['state']} after {stats['errors']} errors, "
+                                 f"last: {stats['last_error']}")
+            return
+
+        link = self.bms.link_stats()
+        if link:
+            logging.info(f"Serial link: {link['samples']} samples in {link['frames']} frames, "
+                         f"{link['crc_errors']} CRC errors, {link['length_errors']} bad headers, "
+                         f"{link['bad_samples']} bad samples, "
+                         f"{link['bytes_discarded']} bytes discarded")
+        for name, stats in self.bms.sensor_stats().items():
+            logging.info(f"Sensor {name}: {stats['reads']} reads, {stats['errors']} errors, "
+                         f"{stats['missed']} missed deadlines, latency {stats['latency_ms']:.1f} ms "
+                         f"(max {stats['latency_max_ms']:.1f}), jitter {stats['jitter_ms']:.1f} ms "
+                         f"(max {stats['jitter_max_ms']:.1f})")
+            if 'filter' in stats:
+                logging.info(f"Sensor {name}: {stats['filter']} of {stats['burst_size']}, "
+                             f"read {stats['read_ms']:.2f} ms, filter {stats['filter_ms']:.3f} ms "
+                             f"(max {stats['filter_max_ms']:.3f}), {stats['rejected']} rejected")
+
+    def _sample(self):
+        if self.manager:
+            # The sources deliver on their own; only report what the alert engine found
+            self.samples = self.manager.samples_delivered
+            self._log_alerts()
+            return
+        if not self.bms.connected:
+            return
+        # One record, refilled every tick; the writer and the alert engine copy what they keep
+        sample = self.bms.read_data(self.sample)
+        if not sample:
+            return
+        if self.bms.streaming:
+            # The source stored and alerted on every sample itself
+            self.samples = self.bms.samples_received
+        else:
+            while sample:
+                if not self.bms.replaying:
+                    sample.timestamp = now_ms()
+                if self.bms.stores_samples:
+                    self.writer.submit(sample)
+                self.alert_engine.submit(sample.timestamp, sample.values())
+                self.samples += 1
+                # A replay serves every sample that has come due since the last tick, one per call
+                sample = self.bms.read_data(self.sample) if self.bms.replaying else None
+        self._log_alerts()
+
+    def _log_alerts(self):
+        for event in self.alert_engine.poll_events():
+            level = logging.WARNING if event.kind == 'open' else logging.INFO
+            logging.log(level, f"Alert {event.kind}: {event.describe()}")
+
+    def _supervise(self):
+        if self.reload_requested:
+            self.reload_requested = False
+            self._restart_alert_engine("Configuration reload")
+
+        if not (self.writer.thread and self.writer.thread.is_alive()):
+            logging.error("Database writer stopped, restarting it")
+            self.writer.start()
+        if not (self.alert_engine.thread and self.alert_engine.thread.is_alive()):
+            self._restart_alert_engine("Alert engine stopped")
+
+        if self.manager:
+            # Sources reconnect on their own; only the event loop itself needs watching
+            if not (self.manager.thread and self.manager.thread.is_alive()):
+                logging.error("Acquisition manager stopped, restarting it")
+                self.manager.start()
+            return
+
+        if self.bms.finished:
+            # A replay that ran to the end is not started over
+            return
+        # The BMS source runs in its own thread; reconnect with backoff if it died
+        source_alive = self.bms.data_thread is not None and self.bms.data_thread.is_alive()
+        if not (self.bms.connected and source_alive) and time.monotonic() >= self.next_reconnect:
+            if self.bms.connected:
+                logging.error("BMS acquisition thread stopped, reconnecting")
+                self.bms.disconnect()
+            self._connect()
+
+    def _connect(self):
+        if self.bms.connect():
+            logging.info("BMS connected")
+            self.reconnect_delay = RECONNECT_DELAY
+        else:
+            logging.error(f"BMS connection failed, retrying in {self.reconnect_delay:.0f} s")
+            self.next_reconnect = time.monotonic() + self.reconnect_delay
+            self.reconnect_delay = min(self.reconnect_delay * 2, MAX_RECONNECT_DELAY)
+
+    def _restart_alert_engine(self, reason):
+        from alerts import AlertEngine
+        from rules import RuleSet
+
+        logging.info(f"{reason}, reloading alert rules")
+        if self.alert_engine:
+            self.alert_engine.shutdown()
+        self.alert_engine = AlertEngine(RuleSet.from_configuration(pack_ids=self.pack_ids))
+        self.alert_engine.start()
+        if self.manager:
+            self.manager.alert_engine = self.alert_engine
+        if self.bms:
+            self.bms.attach(self.writer, self.alert_engine)
+
+    def shutdown(self):
+        """Stop acquisition and write out everything still queued"""
+        try:
+            if self.manager:
+                self.manager.stop()
+                self.samples = self.manager.samples_delivered
+            if self.bms and self.bms.connected:
+                self.bms.disconnect()
+            if self.alert_engine:
+                self.alert_engine.shutdown()
+            if self.writer:
+                self.writer.shutdown()
+            logging.info(f"Stopped after {self.samples} samples")
+        finally:
+            close_connections()
+
+
+def setup_logging(log_file):
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.FileHandler(log_file), logging.StreamHandler(sys.stdout)]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless BMS acquisition service")
+    parser.add_argument('--interval', type=float, default=None,
+                        help="Seconds between samples (default: sampling_rate from Configuration)")
+    parser.add_argument('--log-file', default='logs/bms_daemon.log')
+    parser.add_argument('--sources', default=None, help="JSON file of pack sources (gateway mode)")
+    args = parser.parse_args()
+    if args.interval is not None and not args.interval > 0:
+        parser.error("--interval must be greater than 0")
+
+    setup_logging(args.log_file)
+    sources = None
+    if args.sources:
+        # Only gateway mode needs asyncio and the source drivers
+        from acquisition import load_sources
+
+        try:
+            sources = load_sources(args.sources)
+        except Exception as e:
+            logging.error(f"Invalid sources file: {str(e)}")
+            return 1
+    daemon = AcquisitionDaemon(interval=args.interval, sources=sources)
+    signal.signal(signal.SIGTERM, daemon.request_stop)
+    signal.signal(signal.SIGINT, daemon.request_stop)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, daemon.request_reload)
+
+    try:
+        daemon.start()
+        logging.info(f"BMS daemon started in {startup_timing.elapsed_ms():.0f} ms, "
+                     f"sampling every {daemon.interval:g} s")
+        startup_timing.report(echo=False)
+        daemon.run()
+    except Exception as e:
+        logging.error(f"BMS daemon failed: {str(e)}")
+        return 1
+    finally:
+        daemon.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
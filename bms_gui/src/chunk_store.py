@@ -0,0 +1,310 @@
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from db_connection import get_connection_manager
+from database_schema import SAMPLE_COLUMNS, MAX_CELLS, DEFAULT_PACK_ID
+from time_utils import now_ms
+
+# Optional storage backend that packs samples into compressed chunks instead of
+# one SQLite row per sample. Each SampleChunks row holds up to chunk_size
+# samples of one pack plus the chunk's time bounds, which are indexed for
+# range queries. A chunk only stores the cells its pack has: the cell
+# voltages followed by temperature and state of charge.
+#
+# Chunk encoding (all vectorized with NumPy, then zlib):
+#   timestamps: first value, then delta-of-delta (regular sampling -> mostly zeros)
+#   floats:     each value XOR the previous one (slowly changing -> mostly zero bits)
+# Both streams are byte-shuffled so equal-significance bytes sit together,
+# which is what makes the zero runs visible to zlib.
+#
+# A payload is one or more such segments back to back. The chunk being filled
+# grows by one segment per commit, so a commit only encodes its own rows; when
+# the chunk is sealed it is re-encoded once as a single segment.
+
+CHUNK_MAGIC = b'BMSC'
+CHUNK_VERSION = 1
+_HEADER = struct.Struct('<4sBHH')   # magic, version, sample count, column count
+
+DEFAULT_CHUNK_SIZE = 1024
+
+def _shuffle(values):
+    """Transpose an 8-byte array into byte planes"""
+    return np.ascontiguousarray(values.view(np.uint8).reshape(-1, 8).T).tobytes()
+
+def _unshuffle(data, count):
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(8, count)
+    return np.ascontiguousarray(planes.T).view(np.uint64).reshape(count)
+
+def encode_chunk(timestamps, values):
+    """Encode int64 epoch-ms timestamps (n,) and float64 values (n, columns) into a BLOB"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    count, columns = values.shape
+
+    # Delta-of-delta; the first two entries carry the start value and first delta
+    dod = np.diff(timestamps, n=2, prepend=[0, 0]) if count else timestamps
+    dod[1:2] = np.diff(timestamps[:2])
+    body = [_shuffle(dod.view(np.uint64))]
+
+    bits = values.view(np.uint64)
+    xored = bits.copy()
+    xored[1:] ^= bits[:-1]
+    for col in range(columns):
+        body.append(_shuffle(np.ascontiguousarray(xored[:, col])))
+
+    return _HEADER.pack(CHUNK_MAGIC, CHUNK_VERSION, count, columns) + zlib.compress(b''.join(body), 6)
+
+def _pack_values(values):
+    """Full SAMPLE_COLUMNS values -> the used cells plus temperature and state of charge"""
+    used = np.flatnonzero(~np.isnan(values[:, :MAX_CELLS]).all(axis=0))
+    cells = used[-1] + 1 if len(used) else 0
+    return np.concatenate([values[:, :cells], values[:, MAX_CELLS:]], axis=1)
+
+def _unpack_values(values):
+    """Inverse of _pack_values; cells the chunk doesn't have are NaN"""
+    full = np.full((len(values), len(SAMPLE_COLUMNS)), np.nan)
+    cells = values.shape[1] - (len(SAMPLE_COLUMNS) - MAX_CELLS)
+    full[:, :cells] = values[:, :cells]
+    full[:, MAX_CELLS:] = values[:, cells:]
+    return full
+
+def _decode_segment(blob, offset):
+    """Decode the segment at offset; returns (timestamps, values, offset of the next segment)"""
+    magic, version, count, columns = _HEADER.unpack_from(blob, offset)
+    if magic != CHUNK_MAGIC or version != CHUNK_VERSION:
+        raise ValueError("Unsupported sample chunk format")
+
+    decompressor = zlib.decompressobj()
+    body = decompressor.decompress(blob[offset + _HEADER.size:])
+    size = count * 8
+
+    dod = _unshuffle(body[:size], count).view(np.int64)
+    # Undo delta-of-delta: running sum twice, anchored at the first timestamp
+    timestamps = dod.copy()
+    if count > 1:
+        timestamps[1:] = dod[0] + np.cumsum(np.cumsum(dod[1:]))
+
+    values = np.empty((count, columns), dtype=np.float64)
+    bits = values.view(np.uint64)
+    for col in range(columns):
+        start = size * (col + 1)
+        xored = _unshuffle(body[start:start + size], count)
+        bits[:, col] = np.bitwise_xor.accumulate(xored)
+    return timestamps, values, len(blob) - len(decompressor.unused_data)
+
+def decode_segments(blob):
+    """Every segment of a payload as (timestamps, values); segments can differ in column count"""
+    segments = []
+    offset = 0
+    while offset < len(blob):
+        timestamps, values, offset = _decode_segment(blob, offset)
+        segments.append((timestamps, values))
+    return segments
+
+def decode_chunk(blob):
+    """Inverse of encode_chunk; returns (timestamps, values)"""
+    timestamps, values, _ = _decode_segment(blob, 0)
+    return timestamps, values
+
+def _decode_payload(blob):
+    """All samples of a payload as (timestamps, SAMPLE_COLUMNS values)"""
+    segments = decode_segments(blob)
+    return (np.concatenate([timestamps for timestamps, _ in segments]),
+            np.concatenate([_unpack_values(values) for _, values in segments]))
+
+def sample_rows(timestamps, values):
+    """(timestamp, *values) tuples like the row store returns them: missing values are None, not NaN"""
+    cells = values.astype(object)
+    cells[np.isnan(values)] = None
+    return list(zip(timestamps.tolist(), *cells.T.tolist()))
+
+def _encode_rows(rows):
+    """(timestamp_ms, pack_id, *SAMPLE_COLUMNS) rows -> (sorted timestamps, encoded segment)"""
+    data = np.array([row[2:] for row in rows], dtype=np.float64)
+    timestamps = np.array([row[0] for row in rows], dtype=np.int64)
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], encode_chunk(timestamps[order], _pack_values(data[order]))
+
+
+class ChunkStore:
+    """Chunked, compressed sample storage with the same API as the row store in database.py.
+
+    The chunk being filled is kept in memory, one per pack, and each insert
+    appends a segment with just the new samples to it, so a commit is as
+    durable as with the row store. Once it holds chunk_size samples it is
+    re-encoded as one segment, sealed and a new one is started. Unsealed
+    chunks are picked up again at startup.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        # pack_id -> (SampleChunks id or None, rows) of the chunk being filled
+        self._open = {}
+        with get_connection_manager().writer() as conn:
+            create_chunk_table(conn)
+            self._load_open_chunks(conn)
+
+    def _load_open_chunks(self, conn):
+        """Resume filling the newest unsealed chunk of every pack; older leftovers are sealed as they are"""
+        chunks = conn.execute('SELECT id, pack_id, payload FROM SampleChunks WHERE sealed = 0 ORDER BY id').fetchall()
+        for chunk_id, pack_id, payload in chunks:
+            if pack_id in self._open:
+                conn.execute('UPDATE SampleChunks SET sealed = 1 WHERE id = ?', (self._open[pack_id][0],))
+            timestamps, values = _decode_payload(payload)
+            rows = [(ts, pack_id, *row) for ts, row in zip(timestamps.tolist(), values.tolist())]
+            self._open[pack_id] = (chunk_id, rows)
+
+    def insert_data(self, values, pack_id=DEFAULT_PACK_ID):
+        return self.insert_many([(now_ms(), pack_id, *values)])
+
+    def insert_many(self, rows, conn=None):
+        """Append (timestamp_ms, pack_id, *SAMPLE_COLUMNS) rows; pass conn to join an open write transaction"""
+        if not rows:
+            return True
+        try:
+            if conn is None:
+                with get_connection_manager().writer() as conn:
+                    self.write_rows(conn, rows)
+            else:
+                self.write_rows(conn, rows)
+            return True
+        except Exception as e:
+            print(f"Error inserting chunked data: {str(e)}")
+            return False
+
+    def write_rows(self, conn, rows):
+        """Append rows inside the caller's write transaction; errors propagate"""
+        by_pack = {}
+        for row in rows:
+            by_pack.setdefault(row[1], []).append(row)
+        with self.lock:
+            saved = {pack_id: (chunk_id, list(open_rows)) for pack_id, (chunk_id, open_rows) in self._open.items()}
+            try:
+                for pack_id, pending in by_pack.items():
+                    chunk_id, open_rows = self._open.get(pack_id, (None, []))
+                    while pending:
+                        space = self.chunk_size - len(open_rows)
+                        added, pending = pending[:space], pending[space:]
+                        open_rows.extend(added)
+                        if len(open_rows) >= self.chunk_size:
+                            # Sealed as a single segment; the next rows go to a new chunk
+                            self._write_chunk(conn, pack_id, chunk_id, open_rows)
+                            chunk_id, open_rows = None, []
+                        else:
+                            chunk_id = self._append_segment(conn, pack_id, chunk_id, added, len(open_rows))
+                    self._open[pack_id] = (chunk_id, open_rows)
+            except Exception:
+                # The caller rolls back, so forget what this call added
+                self._open = saved
+                raise
+
+    def _write_chunk(self, conn, pack_id, chunk_id, rows, sealed=True):
+        """Write rows as the whole payload of a chunk; returns its id"""
+        timestamps, blob = _encode_rows(rows)
+        start_ms, end_ms = int(timestamps[0]), int(timestamps[-1])
+
+        if chunk_id is None:
+            cursor = conn.execute(
+                'INSERT INTO SampleChunks (pack_id, start_ms, end_ms, sample_count, sealed, payload) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (pack_id, start_ms, end_ms, len(rows), int(sealed), blob)
+            )
+            return cursor.lastrowid
+        conn.execute(
+            'UPDATE SampleChunks SET start_ms = ?, end_ms = ?, sample_count = ?, sealed = ?, payload = ? WHERE id = ?',
+            (start_ms, end_ms, len(rows), int(sealed), blob, chunk_id)
+        )
+        return chunk_id
+
+    def _append_segment(self, conn, pack_id, chunk_id, rows, sample_count):
+        """Append rows to the unsealed chunk as a new segment; returns the chunk id"""
+        if chunk_id is None:
+            return self._write_chunk(conn, pack_id, None, rows, sealed=False)
+        timestamps, blob = _encode_rows(rows)
+        conn.execute(
+            'UPDATE SampleChunks SET start_ms = MIN(start_ms, ?), end_ms = MAX(end_ms, ?), sample_count = ?, '
+            'payload = CAST(payload || ? AS BLOB) WHERE id = ?',
+            (int(timestamps[0]), int(timestamps[-1]), sample_count, blob, chunk_id)
+        )
+        return chunk_id
+
+    def write_sealed(self, conn, rows):
+        """Store rows of one pack as sealed chunks of their own, inside the caller's write transaction.
+
+        For history such as CSV imports: the chunk being filled with live
+        samples is left alone, so its time bounds stay tight.
+        """
+        for start in range(0, len(rows), self.chunk_size):
+            part = rows[start:start + self.chunk_size]
+            self._write_chunk(conn, part[0][1], None, part)
+
+    def get_range(self, start_ms, end_ms, pack_id=DEFAULT_PACK_ID):
+        """Return (timestamps, values) arrays of one pack for start_ms <= timestamp < end_ms, sorted by time"""
+        with get_connection_manager().reader() as conn:
+            blobs = conn.execute('''
+            SELECT payload FROM SampleChunks
+            WHERE pack_id = ? AND end_ms >= ? AND start_ms < ?
+            ORDER BY start_ms
+            ''', (pack_id, start_ms, end_ms)).fetchall()
+
+        parts = [_decode_payload(blob) for blob, in blobs]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(SAMPLE_COLUMNS)))
+        timestamps = np.concatenate([p[0] for p in parts])
+        values = np.concatenate([p[1] for p in parts])
+        mask = (timestamps >= start_ms) & (timestamps < end_ms)
+        timestamps, values = timestamps[mask], values[mask]
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], values[order]
+
+    def get_bounds(self, pack_id=DEFAULT_PACK_ID):
+        """(oldest, newest) stored timestamp of a pack, or (None, None) when empty"""
+        with get_connection_manager().reader() as conn:
+            return conn.execute('SELECT MIN(start_ms), MAX(end_ms) FROM SampleChunks WHERE pack_id = ?',
+                                (pack_id,)).fetchone()
+
+    def get_recent_data(self, seconds=60, pack_id=DEFAULT_PACK_ID):
+        try:
+            end = now_ms() + 1
+            timestamps, values = self.get_range(end - 1 - int(seconds * 1000), end, pack_id)
+            return sample_rows(timestamps, values)
+        except Exception as e:
+            print(f"Error getting recent chunked data: {str(e)}")
+            return []
+
+    def clear_data(self, conn=None):
+        with self.lock:
+            if conn is None:
+                with get_connection_manager().writer() as conn:
+                    conn.execute('DELETE FROM SampleChunks')
+            else:
+                conn.execute('DELETE FROM SampleChunks')
+            self._open = {}
+        return True
+
+    def apply_retention(self, conn, cutoff_ms):
+        """Delete sealed chunks that end before cutoff_ms"""
+        open_ids = [chunk_id for chunk_id, _ in self._open.values() if chunk_id is not None]
+        conn.execute(f'DELETE FROM SampleChunks WHERE end_ms < ? AND id NOT IN ({", ".join("?" * len(open_ids))})',
+                     [cutoff_ms] + open_ids)
+
+
+def create_chunk_table(conn):
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS SampleChunks (
+        id INTEGER PRIMARY KEY,
+        pack_id INTEGER NOT NULL DEFAULT {DEFAULT_PACK_ID},
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        sample_count INTEGER NOT NULL,
+        sealed INTEGER NOT NULL DEFAULT 1,
+        payload BLOB NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sample_chunks_time ON SampleChunks(pack_id, end_ms, start_ms)')
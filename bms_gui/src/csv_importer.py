@@ -0,0 +1,240 @@
+import csv
+import glob
+import math
+import os
+import sys
+import time
+
+from db_connection import get_connection_manager
+from database_schema import SAMPLE_COLUMNS, CELL_COLUMNS, DEFAULT_PACK_ID, DEFAULT_CELL_COUNT
+from partitions import partition_day, ensure_partition, create_partition_index, retention_cutoff_ms, DAY_MS
+from rollups import last_row_id, update_rollups
+from time_utils import to_epoch_ms
+
+# Bulk loader for the bms_data_*.csv files written by the export function.
+#
+# Fast path for the row store: everything is written in one transaction with
+# executemany, and the covering index of every partition touched is dropped on
+# first use and rebuilt once at the end, together with the rollups. Rows are
+# deduplicated on pack and timestamp, both within the import and against what
+# is already stored. Rows older than the retention window are skipped, they
+# would be dropped again on the next start anyway.
+#
+# Files need the columns below and any number of cell columns. Files without
+# a pack_id column (exports of earlier versions) belong to pack 1, and the
+# oldest exports (id,timestamp,voltage,current,temperature,state_of_charge)
+# have no cell columns at all: their cells are stored as NULL and the pack
+# voltage and current are left out. Empty fields, readings that had dropped
+# out, are stored as NULL too.
+#
+# With the chunked backend imported history goes into sealed chunks of its
+# own rather than the chunk being filled with live samples.
+
+REQUIRED_COLUMNS = ['timestamp', 'temperature', 'state_of_charge']
+DEFAULT_BATCH_SIZE = 20000
+
+
+class _PartitionState:
+    """Per-partition bookkeeping for one import run"""
+    def __init__(self, table, after_id, existing):
+        self.table = table
+        self.after_id = after_id
+        self.existing = existing
+
+
+def _parse_value(text):
+    """Float of a CSV field, None for an empty one; raises ValueError for anything else"""
+    if not text.strip():
+        return None
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(f"Not a finite number: {text}")
+    return value
+
+
+def read_csv_rows(path, batch_size=DEFAULT_BATCH_SIZE, stats=None):
+    """Yield batches of validated (timestamp_ms, pack_id, *SAMPLE_COLUMNS) tuples from one CSV file"""
+    if stats is None:
+        stats = {'skipped_files': 0, 'invalid': 0, 'packs': {}}
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip() for name in header]
+        missing = [name for name in REQUIRED_COLUMNS if name not in header]
+        if missing:
+            print(f"Skipping {path}: missing columns {', '.join(missing)}")
+            stats['skipped_files'] += 1
+            return
+        timestamp_position = header.index('timestamp')
+        pack_position = header.index('pack_id') if 'pack_id' in header else None
+        # Every measurement column, or None where the file doesn't have it
+        positions = [header.index(name) if name in header else None for name in SAMPLE_COLUMNS]
+        cell_count = sum(1 for name in CELL_COLUMNS if name in header)
+
+        batch = []
+        for record in reader:
+            try:
+                timestamp = to_epoch_ms(record[timestamp_position])
+                pack_id = int(record[pack_position]) if pack_position is not None else DEFAULT_PACK_ID
+                values = tuple(_parse_value(record[i]) if i is not None else None for i in positions)
+            except (IndexError, ValueError):
+                stats['invalid'] += 1
+                continue
+            if timestamp is None:
+                stats['invalid'] += 1
+                continue
+            stats['packs'][pack_id] = max(stats['packs'].get(pack_id, 0), cell_count)
+            batch.append((timestamp, pack_id) + values)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _batches(conn, paths, batch_size, stats):
+    """Yield batches from all files with rows outside the retention window removed"""
+    cutoff_ms = retention_cutoff_ms(conn)
+    for path in paths:
+        for batch in read_csv_rows(path, batch_size, stats):
+            if cutoff_ms is not None:
+                kept = [row for row in batch if row[0] >= cutoff_ms]
+                stats['expired'] += len(batch) - len(kept)
+                batch = kept
+            yield batch
+        stats['files'] += 1
+
+
+def _open_partition(conn, day):
+    table, _ = ensure_partition(conn, day)
+    existing = set(conn.execute(f'SELECT timestamp, pack_id FROM {table}'))
+    after_id = last_row_id(conn, table)
+    # Defer index maintenance until all rows are in
+    conn.execute(f'DROP INDEX IF EXISTS idx_{table}_cover')
+    return _PartitionState(table, after_id, existing)
+
+
+def _import_rows(paths, batch_size, stats):
+    cols = ', '.join(SAMPLE_COLUMNS)
+    placeholders = ', '.join('?' for _ in SAMPLE_COLUMNS)
+    opened = {}
+
+    with get_connection_manager().writer() as conn:
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        for batch in _batches(conn, paths, batch_size, stats):
+            by_day = {}
+            for row in batch:
+                by_day.setdefault(partition_day(row[0]), []).append(row)
+
+            for day, rows in by_day.items():
+                if day not in opened:
+                    opened[day] = _open_partition(conn, day)
+                state = opened[day]
+
+                fresh = []
+                for row in rows:
+                    if row[:2] in state.existing:
+                        stats['duplicates'] += 1
+                        continue
+                    state.existing.add(row[:2])
+                    fresh.append(row)
+                conn.executemany(
+                    f'INSERT INTO {state.table} (timestamp, pack_id, {cols}) VALUES (?, ?, {placeholders})', fresh
+                )
+                stats['inserted'] += len(fresh)
+
+        # Rebuild indexes and fold the new rows into the rollups once per partition
+        for state in opened.values():
+            create_partition_index(conn, state.table)
+            update_rollups(conn, state.table, state.after_id)
+
+
+def _import_chunked(chunk_store, paths, batch_size, stats):
+    from rollups import update_rollups_from_rows
+
+    seen = {}
+    # pack_id -> rows not yet making up a full chunk
+    pending = {}
+    with get_connection_manager().writer() as conn:
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        for batch in _batches(conn, paths, batch_size, stats):
+            fresh = []
+            for row in batch:
+                key = (partition_day(row[0]), row[1])
+                if key not in seen:
+                    day = key[0]
+                    timestamps, _ = chunk_store.get_range(day * DAY_MS, (day + 1) * DAY_MS, row[1])
+                    seen[key] = set(timestamps.tolist())
+                if row[0] in seen[key]:
+                    stats['duplicates'] += 1
+                    continue
+                seen[key].add(row[0])
+                fresh.append(row)
+            if fresh:
+                update_rollups_from_rows(conn, fresh)
+                stats['inserted'] += len(fresh)
+                for row in fresh:
+                    pending.setdefault(row[1], []).append(row)
+                # Write the full chunks now, the rest waits for more rows of its pack
+                for pack_id, rows in pending.items():
+                    full = len(rows) - len(rows) % chunk_store.chunk_size
+                    if full:
+                        rows.sort()
+                        chunk_store.write_sealed(conn, rows[:full])
+                        del rows[:full]
+        for rows in pending.values():
+            if rows:
+                rows.sort()
+                chunk_store.write_sealed(conn, rows)
+
+
+def import_csv_files(paths, batch_size=DEFAULT_BATCH_SIZE):
+    """Import CSV exports in a single transaction; returns a dict of counters"""
+    from database import get_chunk_store, get_packs, register_pack
+
+    # 'packs' collects the cell count of every pack found in the files
+    stats = {'files': 0, 'skipped_files': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0,
+             'expired': 0, 'packs': {}}
+    chunk_store = get_chunk_store()
+    if chunk_store:
+        _import_chunked(chunk_store, paths, batch_size, stats)
+    else:
+        _import_rows(paths, batch_size, stats)
+
+    known = get_packs()
+    for pack_id, cell_count in stats['packs'].items():
+        if not cell_count:
+            # Files without cell columns say nothing about the pack's cells
+            if pack_id in known:
+                continue
+            cell_count = DEFAULT_CELL_COUNT
+        if pack_id not in known or known[pack_id][1] < cell_count:
+            register_pack(pack_id, cell_count)
+    return stats
+
+
+if __name__ == "__main__":
+    # python csv_importer.py bms_data_*.csv [more files or directories]
+    from database_schema import create_database
+
+    paths = []
+    for arg in sys.argv[1:]:
+        if os.path.isdir(arg):
+            paths.extend(sorted(glob.glob(os.path.join(arg, 'bms_data_*.csv'))))
+        else:
+            paths.extend(sorted(glob.glob(arg)) or [arg])
+    if not paths:
+        print("Usage: csv_importer.py <csv files or directories>")
+        sys.exit(1)
+
+    create_database()
+    started = time.perf_counter()
+    result = import_csv_files(paths)
+    elapsed = time.perf_counter() - started
+    print(f"Imported {result['inserted']} rows from {result['files']} files in {elapsed:.1f}s "
+          f"({result['duplicates']} duplicates, {result['invalid']} invalid, {result['expired']} expired rows, "
+          f"{result['skipped_files']} files skipped)")
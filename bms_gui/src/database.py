@@ -1,126 +1,312 @@
-import sqlite3
-from datetime import datetime, timedelta
-
-def create_database():
-    conn = sqlite3.connect('database/battery_data.db')
-    cursor = conn.cursor()
-    
-    # Create BatteryData table if it doesn't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS BatteryData (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        cell1_voltage REAL NOT NULL,
-        cell2_voltage REAL NOT NULL,
-        cell3_voltage REAL NOT NULL,
-        temperature REAL NOT NULL,
-        state_of_charge REAL NOT NULL
-    )
-    ''')
-    
-    # Create ExportLogs table if it doesn't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS ExportLogs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        file_path TEXT NOT NULL,
-        export_format TEXT NOT NULL
-    )
-    ''')
-    
-    # Check if index exists before creating it
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name='idx_timestamp'")
-    if not cursor.fetchone():
-        cursor.execute('CREATE INDEX idx_timestamp ON BatteryData(timestamp)')
-    
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully")
-
-def insert_data(cell1_voltage, cell2_voltage, cell3_voltage, temperature, state_of_charge):
-    conn = None
+import threading
+from datetime import datetime
+from db_connection import get_connection_manager
+from database_schema import create_database, SAMPLE_COLUMNS, DEFAULT_PACK_ID
+from time_utils import now_ms
+from rollups import last_row_id, update_rollups, update_rollups_from_rows, clear_rollups
+from partitions import (partition_day, ensure_partition, list_partitions, drop_all_partitions,
+                        apply_retention, retention_cutoff_ms)
+
+_COLUMNS = ', '.join(SAMPLE_COLUMNS)
+_PLACEHOLDERS = ', '.join('?' for _ in SAMPLE_COLUMNS)
+
+# Sample storage backend, chosen by the storage_backend Configuration entry:
+# 'rows' (day-partitioned tables, the default) or 'chunked' (compressed chunks,
+# see chunk_store.py). Switching backends does not move already stored samples.
+_chunk_store = None
+_backend_checked = False
+_backend_lock = threading.Lock()
+_last_retention_day = None
+
+def get_chunk_store():
+    """Return the ChunkStore if the chunked backend is configured, else None"""
+    global _chunk_store, _backend_checked
+    with _backend_lock:
+        if not _backend_checked:
+            _backend_checked = True
+            if get_configuration().get('storage_backend') == 'chunked':
+                from chunk_store import ChunkStore
+                _chunk_store = ChunkStore()
+        return _chunk_store
+
+# Cell count of every pack as last written to Packs, so registering is free when nothing changed
+_pack_cells = {}
+_packs_lock = threading.Lock()
+
+def insert_data(values, pack_id=DEFAULT_PACK_ID):
+    """Insert one sample with values in SAMPLE_COLUMNS order (None for cells the pack doesn't have)"""
+    return insert_many([(now_ms(), pack_id, *values)])
+
+def insert_many(rows):
+    """Insert a batch of (timestamp_ms, pack_id, *SAMPLE_COLUMNS) rows in one commit"""
+    if not rows:
+        return True
+
+    chunk_store = get_chunk_store()
+    if chunk_store:
+        return _insert_chunked(chunk_store, rows)
+
+    # Route rows to their day partition; a batch normally spans one day
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(partition_day(row[0]), []).append(row)
+
     try:
-        # Add timeout to prevent indefinite waiting if database is locked
-        conn = sqlite3.connect('database/battery_data.db', timeout=10)
-        cursor = conn.cursor()
-        
-        # Use ISO format to ensure compatibility with SQLite datetime functions
-        timestamp = datetime.now().isoformat()
-        
-        # Debug print the values being inserted
-        print(f"Inserting values: timestamp={timestamp}, cell1={cell1_voltage}, cell2={cell2_voltage}, cell3={cell3_voltage}, temp={temperature}, soc={state_of_charge}")
-        
-        # Debug: Check the table structure 
-        cursor.execute("PRAGMA table_info(BatteryData)")
-        columns = cursor.fetchall()
-        print("Table structure:")
-        for col in columns:
-            print(f"  - {col[1]} ({col[2]})")
-        
-        # Insert the data
-        sql = '''
-        INSERT INTO BatteryData (timestamp, cell1_voltage, cell2_voltage, cell3_voltage, 
-                               temperature, state_of_charge)
-        VALUES (?, ?, ?, ?, ?, ?)
-        '''
-        print(f"SQL: {sql}")
-        
-        cursor.execute(sql, (timestamp, cell1_voltage, cell2_voltage, cell3_voltage, 
-              temperature, state_of_charge))
-        
-        conn.commit()
-        print(f"Data inserted successfully")
+        with get_connection_manager().writer() as conn:
+            new_partition = False
+            for day, day_rows in by_day.items():
+                table, created = ensure_partition(conn, day)
+                new_partition = new_partition or created
+                after_id = last_row_id(conn, table)
+                conn.executemany(
+                    f'INSERT INTO {table} (timestamp, pack_id, {_COLUMNS}) VALUES (?, ?, {_PLACEHOLDERS})',
+                    day_rows
+                )
+                # Keep the rollup tables in step within the same commit
+                update_rollups(conn, table, after_id)
+
+            # A new day has started, expire partitions that fell out of the retention window
+            if new_partition:
+                apply_retention(conn)
         return True
     except Exception as e:
         print(f"Error inserting data: {str(e)}")
         import traceback
         traceback.print_exc()
         return False
-    finally:
-        # Ensure connection is closed even if an error occurs
-        if conn:
-            conn.close()
 
-def get_recent_data(seconds=60):
-    conn = None
+def _insert_chunked(chunk_store, rows):
+    global _last_retention_day
+    try:
+        with get_connection_manager().writer() as conn:
+            chunk_store.write_rows(conn, rows)
+            update_rollups_from_rows(conn, rows)
+
+            # Once per day, expire chunks that fell out of the retention window
+            today = partition_day(now_ms())
+            if _last_retention_day != today:
+                _last_retention_day = today
+                cutoff_ms = retention_cutoff_ms(conn)
+                if cutoff_ms is not None:
+                    chunk_store.apply_retention(conn, cutoff_ms)
+        return True
+    except Exception as e:
+        print(f"Error inserting data: {str(e)}")
+        return False
+
+def get_packs():
+    """Return {pack_id: (name, cell_count)} for every registered pack"""
+    try:
+        with get_connection_manager().reader() as conn:
+            cursor = conn.execute('SELECT pack_id, name, cell_count FROM Packs ORDER BY pack_id')
+            return {pack_id: (name, cell_count) for pack_id, name, cell_count in cursor}
+    except Exception as e:
+        print(f"Error loading packs: {str(e)}")
+        return {}
+
+def register_pack(pack_id, cell_count, name=None):
+    """Record a pack and its cell count in Packs; only touches the database when something changed"""
+    with _packs_lock:
+        if _pack_cells.get(pack_id) == cell_count and name is None:
+            return True
+        try:
+            with get_connection_manager().writer() as conn:
+                conn.execute('''
+                INSERT INTO Packs (pack_id, name, cell_count) VALUES (?, ?, ?)
+                ON CONFLICT(pack_id) DO UPDATE SET
+                    cell_count = excluded.cell_count,
+                    name = COALESCE(?, name)
+                ''', (pack_id, name or f'Pack {pack_id}', cell_count, name))
+            _pack_cells[pack_id] = cell_count
+            return True
+        except Exception as e:
+            print(f"Error registering pack: {str(e)}")
+            return False
+
+def get_recent_data(seconds=60, pack_id=DEFAULT_PACK_ID):
+    chunk_store = get_chunk_store()
+    if chunk_store:
+        return chunk_store.get_recent_data(seconds, pack_id)
+
     try:
-        conn = sqlite3.connect('database/battery_data.db', timeout=10)
-        cursor = conn.cursor()
-        
-        # Calculate the timestamp for seconds ago
-        time_threshold = (datetime.now() - timedelta(seconds=seconds)).isoformat()
-        
-        cursor.execute('''
-        SELECT timestamp, cell1_voltage, cell2_voltage, cell3_voltage,
-               temperature, state_of_charge
-        FROM BatteryData 
-        WHERE timestamp >= ?
-        ORDER BY timestamp
-        ''', (time_threshold,))
-        
-        data = cursor.fetchall()
+        # Calculate the epoch timestamp for seconds ago
+        time_threshold = now_ms() - int(seconds * 1000)
+
+        data = []
+        with get_connection_manager().reader() as conn:
+            # Partitions don't overlap, so reading them in order keeps rows sorted
+            for _, table in list_partitions(conn, start_ms=time_threshold):
+                cursor = conn.execute(f'''
+                SELECT timestamp, {_COLUMNS}
+                FROM {table}
+                WHERE pack_id = ? AND timestamp >= ?
+                ORDER BY timestamp
+                ''', (pack_id, time_threshold))
+                data.extend(cursor.fetchall())
         return data
     except Exception as e:
         print(f"Error getting recent data: {str(e)}")
         return []
-    finally:
-        if conn:
-            conn.close()
+
+def iter_range(start_ms=None, end_ms=None, columns=None, batch_size=5000, bucket_ms=None,
+               as_numpy=False, pack_id=DEFAULT_PACK_ID):
+    """Stream samples of one pack with start_ms <= timestamp < end_ms in batches of at most batch_size.
+
+    columns selects a subset of SAMPLE_COLUMNS (timestamp always comes first).
+    With bucket_ms set, rows are averaged per time bucket and the timestamp is
+    the bucket start. Batches are lists of tuples, or (timestamps, values)
+    NumPy arrays with as_numpy=True. Only one batch is held in memory at a time.
+    """
+    columns = list(columns or SAMPLE_COLUMNS)
+    unknown = [col for col in columns if col not in SAMPLE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    chunk_store = get_chunk_store()
+    if chunk_store:
+        batches = _iter_chunked(chunk_store, start_ms, end_ms, columns, batch_size, bucket_ms, pack_id)
+    elif bucket_ms:
+        batches = _iter_buckets(start_ms, end_ms, columns, batch_size, bucket_ms, pack_id)
+    else:
+        batches = _iter_rows(start_ms, end_ms, columns, batch_size, pack_id)
+
+    for batch in batches:
+        if as_numpy:
+            import numpy as np
+            data = np.array(batch, dtype=np.float64).reshape(len(batch), len(columns) + 1)
+            yield np.array([row[0] for row in batch], dtype=np.int64), data[:, 1:]
+        else:
+            yield batch
+
+def _range_partitions(start_ms, end_ms):
+    with get_connection_manager().reader() as conn:
+        return list_partitions(conn, start_ms, end_ms)
+
+def _iter_rows(start_ms, end_ms, columns, batch_size, pack_id):
+    select = ', '.join(['timestamp'] + columns)
+    lo = start_ms if start_ms is not None else -2**62
+    hi = end_ms if end_ms is not None else 2**62
+
+    for _, table in _range_partitions(start_ms, end_ms):
+        # Keyset pagination on (timestamp, rows already returned at that timestamp).
+        # Both follow the covering index order, so every page is an index seek
+        # instead of an OFFSET over everything before it.
+        last_ts, seen_at_last = lo, 0
+        while True:
+            with get_connection_manager().reader() as conn:
+                rows = conn.execute(f'''
+                SELECT {select} FROM {table}
+                WHERE pack_id = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+                LIMIT ? OFFSET ?
+                ''', (pack_id, last_ts, hi, batch_size, seen_at_last)).fetchall()
+            if not rows:
+                break
+            yield rows
+            if len(rows) < batch_size:
+                break
+
+            newest = rows[-1][0]
+            same = sum(1 for row in rows if row[0] == newest)
+            seen_at_last = seen_at_last + same if newest == last_ts else same
+            last_ts = newest
+
+def _iter_buckets(start_ms, end_ms, columns, batch_size, bucket_ms, pack_id):
+    averages = ', '.join(f'AVG({col})' for col in columns)
+    for _, table in _range_partitions(start_ms, end_ms):
+        with get_connection_manager().reader() as conn:
+            first, last = conn.execute(f'''
+            SELECT MIN(timestamp), MAX(timestamp) FROM {table}
+            WHERE pack_id = ? AND timestamp >= ? AND timestamp < ?
+            ''', (pack_id, start_ms if start_ms is not None else -2**62,
+                  end_ms if end_ms is not None else 2**62)).fetchone()
+        if first is None:
+            continue
+
+        # Each page covers a fixed window of batch_size buckets, so the GROUP BY stays bounded
+        window_start = (first // bucket_ms) * bucket_ms
+        if start_ms is not None:
+            window_start = max(window_start, start_ms)
+        stop = last + 1 if end_ms is None else min(last + 1, end_ms)
+        while window_start < stop:
+            window_end = min(((window_start // bucket_ms) + batch_size) * bucket_ms, stop)
+            with get_connection_manager().reader() as conn:
+                rows = conn.execute(f'''
+                SELECT (timestamp / {bucket_ms}) * {bucket_ms} AS bucket, {averages}
+                FROM {table}
+                WHERE pack_id = ? AND timestamp >= ? AND timestamp < ?
+                GROUP BY bucket
+                ORDER BY bucket
+                ''', (pack_id, window_start, window_end)).fetchall()
+            if rows:
+                yield rows
+            window_start = window_end
+
+def _iter_chunked(chunk_store, start_ms, end_ms, columns, batch_size, bucket_ms, pack_id):
+    import numpy as np
+    from chunk_store import sample_rows
+    from partitions import DAY_MS
+
+    oldest, newest = chunk_store.get_bounds(pack_id)
+    if oldest is None:
+        return
+    first = start_ms if start_ms is not None else oldest
+    last = end_ms if end_ms is not None else newest + 1
+    indexes = [SAMPLE_COLUMNS.index(col) for col in columns]
+
+    # Decode one day at a time to keep memory bounded
+    for day_start in range((first // DAY_MS) * DAY_MS, last, DAY_MS):
+        timestamps, values = chunk_store.get_range(max(first, day_start), min(last, day_start + DAY_MS), pack_id)
+        values = values[:, indexes]
+        if bucket_ms and len(timestamps):
+            buckets = (timestamps // bucket_ms) * bucket_ms
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            timestamps = buckets[starts]
+            # Like SQL AVG: missing values are skipped, a bucket without any stays missing
+            present = ~np.isnan(values)
+            sums = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+            counts = np.add.reduceat(present, starts, axis=0)
+            values = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        for i in range(0, len(timestamps), batch_size):
+            yield sample_rows(timestamps[i:i + batch_size], values[i:i + batch_size])
+
+def log_export(file_path, export_format):
+    """Record a finished export in ExportLogs"""
+    try:
+        with get_connection_manager().writer() as conn:
+            conn.execute(
+                "INSERT INTO ExportLogs (timestamp, file_path, export_format) VALUES (?, ?, ?)",
+                (datetime.now().isoformat(), file_path, export_format)
+            )
+        return True
+    except Exception as e:
+        print(f"Error logging export: {str(e)}")
+        return False
+
+def get_configuration():
+    """Return the Configuration table as a {parameter_name: value} dict (latest row wins)"""
+    try:
+        with get_connection_manager().reader() as conn:
+            cursor = conn.execute('SELECT parameter_name, value FROM Configuration ORDER BY id')
+            return dict(cursor.fetchall())
+    except Exception as e:
+        print(f"Error loading configuration: {str(e)}")
+        return {}
 
 def clear_data():
-    conn = None
     try:
-        conn = sqlite3.connect('database/battery_data.db', timeout=10)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM BatteryData')
-        conn.commit()
+        # Outside the transaction: creating the ChunkStore commits on its own connection
+        chunk_store = get_chunk_store()
+        with get_connection_manager().writer() as conn:
+            # Dropping partitions is constant time per day, unlike DELETE
+            drop_all_partitions(conn)
+            clear_rollups(conn)
+            if chunk_store:
+                chunk_store.clear_data(conn)
         return True
     except Exception as e:
         print(f"Error clearing data: {str(e)}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
 if __name__ == "__main__":
-    create_database() 
\ No newline at end of file
+    create_database()
\ No newline at end of file
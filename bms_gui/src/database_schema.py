@@ -1,83 +1,325 @@
 import sqlite3
 import os
+from db_connection import get_connection_manager
+from time_utils import to_epoch_ms
 from datetime import datetime
 
+# Bumped whenever a migration is added below; stored in PRAGMA user_version
+SCHEMA_VERSION = 7
+
+# Samples belong to a pack (schema version 6+). Every pack has its own cell
+# count, recorded in the Packs table; sample rows have room for MAX_CELLS cells
+# and the cells a pack doesn't have are NULL.
+MAX_CELLS = 24
+DEFAULT_PACK_ID = 1
+DEFAULT_CELL_COUNT = 3
+
+CELL_COLUMNS = [f'cell{n}_voltage' for n in range(1, MAX_CELLS + 1)]
+
+# Measurement columns of a sample row, in storage order (after timestamp and pack_id)
+SAMPLE_COLUMNS = CELL_COLUMNS + ['temperature', 'state_of_charge']
+
+# The fixed three-cell layout of schema versions 1 to 5, used by the older migrations
+LEGACY_SAMPLE_COLUMNS = CELL_COLUMNS[:3] + ['temperature', 'state_of_charge']
+
+def pack_columns(cell_count):
+    """Measurement columns used by a pack with cell_count cells"""
+    return CELL_COLUMNS[:cell_count] + ['temperature', 'state_of_charge']
+
+# Layout of the unpartitioned table of schema versions 2 and 3. Since version 4
+# raw samples live in day partitions (see partitions.py) and BatteryData is a view.
+# Timestamps are INTEGER epoch milliseconds (schema version 2+)
+BATTERY_DATA_TABLE = '''
+CREATE TABLE IF NOT EXISTS BatteryData (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp INTEGER NOT NULL,
+    cell1_voltage REAL NOT NULL,
+    cell2_voltage REAL NOT NULL,
+    cell3_voltage REAL NOT NULL,
+    temperature REAL NOT NULL,
+    state_of_charge REAL NOT NULL
+)
+'''
+
+# Covering index so range queries never have to touch the table itself
+BATTERY_DATA_INDEX = f'''
+CREATE INDEX IF NOT EXISTS idx_battery_data_cover
+ON BatteryData(timestamp, {', '.join(LEGACY_SAMPLE_COLUMNS)})
+'''
+
+# Rollup resolutions as (name, bucket size in ms), finest first
+ROLLUP_RESOLUTIONS = [('1s', 1000), ('1m', 60 * 1000), ('1h', 60 * 60 * 1000)]
+
+# Cell readings are tap voltages around 12 V, not single-cell voltages
+DEFAULT_CELL_WARNING_THRESHOLD = '14.0'
+
+def rollup_table(resolution):
+    return f'BatteryRollup_{resolution}'
+
+def _rollup_table_sql(resolution):
+    # Per pack and bucket: sample count plus min/max/sum of every measurement column
+    stats = ',\n    '.join(f'{col}_min REAL, {col}_max REAL, {col}_sum REAL' for col in SAMPLE_COLUMNS)
+    return f'''
+CREATE TABLE IF NOT EXISTS {rollup_table(resolution)} (
+    pack_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    sample_count INTEGER NOT NULL,
+    {stats},
+    PRIMARY KEY (pack_id, bucket)
+)
+'''
+
+def _create_packs_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Packs (
+        pack_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        cell_count INTEGER NOT NULL
+    )
+    ''')
+    # Everything stored before packs existed came from the one three-cell pack
+    conn.execute('INSERT OR IGNORE INTO Packs (pack_id, name, cell_count) VALUES (?, ?, ?)',
+                 (DEFAULT_PACK_ID, f'Pack {DEFAULT_PACK_ID}', DEFAULT_CELL_COUNT))
+
 def create_database():
     try:
         os.makedirs('database', exist_ok=True)
-        
-        conn = sqlite3.connect('database/battery_data.db')
-        cursor = conn.cursor()
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS BatteryData (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            cell1_voltage REAL NOT NULL,
-            cell2_voltage REAL NOT NULL,
-            cell3_voltage REAL NOT NULL,
-            temperature REAL NOT NULL,
-            state_of_charge REAL NOT NULL
-        )
-        ''')
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Configuration (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            parameter_name TEXT NOT NULL,
-            value TEXT NOT NULL,
-            last_updated DATETIME NOT NULL
-        )
-        ''')
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ErrorLogs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME NOT NULL,
-            error_message TEXT NOT NULL,
-            severity TEXT NOT NULL
-        )
-        ''')
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ExportLogs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            export_format TEXT NOT NULL
-        )
-        ''')
-
-        # Create index for better performance
-        try:
-            cursor.execute('CREATE INDEX idx_timestamp ON BatteryData(timestamp)')
-        except sqlite3.OperationalError:
-            # Index might already exist
-            pass
-
-        default_configs = [
-            ('baud_rate', '9600', datetime.now()),
-            ('com_port', 'COM1', datetime.now()),
-            ('sampling_rate', '1000', datetime.now()),
-            ('temperature_unit', 'celsius', datetime.now()),
-            ('cell1_warning_threshold', '3.7', datetime.now()),
-            ('cell2_warning_threshold', '3.7', datetime.now()),
-            ('cell3_warning_threshold', '3.7', datetime.now())
-        ]
-
-        cursor.executemany('''
-        INSERT OR IGNORE INTO Configuration (parameter_name, value, last_updated)
-        VALUES (?, ?, ?)
-        ''', default_configs)
-
-        conn.commit()
-        conn.close()
-        
+
+        with get_connection_manager().writer() as conn:
+            # Upgrade existing files first so tables are never created in an old layout
+            migrate_database(conn)
+            _create_tables(conn.cursor())
+
+            from partitions import apply_retention
+            apply_retention(conn)
+
         print("Database initialized successfully")
         return True
     except Exception as e:
         print(f"Error initializing database: {str(e)}")
         return False
 
+def _create_tables(cursor):
+    from partitions import create_partition_registry, rebuild_view
+
+    create_partition_registry(cursor.connection)
+    _create_packs_table(cursor.connection)
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'BatteryData'").fetchone():
+        rebuild_view(cursor.connection)
+
+    for resolution, _ in ROLLUP_RESOLUTIONS:
+        cursor.execute(_rollup_table_sql(resolution))
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Configuration (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parameter_name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        last_updated DATETIME NOT NULL
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ErrorLogs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME NOT NULL,
+        error_message TEXT NOT NULL,
+        severity TEXT NOT NULL
+    )
+    ''')
+
+    # One row per alert; closed_ms stays NULL while the alert is active
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rule TEXT NOT NULL,
+        severity TEXT NOT NULL,
+        opened_ms INTEGER NOT NULL,
+        closed_ms INTEGER,
+        threshold REAL NOT NULL,
+        peak_value REAL NOT NULL,
+        message TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alerts_opened ON Alerts(opened_ms)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alerts_open ON Alerts(rule) WHERE closed_ms IS NULL')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ExportLogs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        export_format TEXT NOT NULL
+    )
+    ''')
+
+    default_configs = [
+        ('baud_rate', '9600', datetime.now()),
+        ('com_port', 'COM1', datetime.now()),
+        ('sampling_rate', '1000', datetime.now()),
+        ('temperature_unit', 'celsius', datetime.now()),
+        ('cell1_warning_threshold', DEFAULT_CELL_WARNING_THRESHOLD, datetime.now()),
+        ('cell2_warning_threshold', DEFAULT_CELL_WARNING_THRESHOLD, datetime.now()),
+        ('cell3_warning_threshold', DEFAULT_CELL_WARNING_THRESHOLD, datetime.now()),
+        ('cell_warning_threshold', DEFAULT_CELL_WARNING_THRESHOLD, datetime.now()),
+        ('temperature_warning_threshold', '30.0', datetime.now()),
+        ('alert_min_duration_ms', '2000', datetime.now()),
+        ('retention_days', '90', datetime.now()),
+        ('storage_backend', 'rows', datetime.now()),
+        ('graph_max_fps', '10', datetime.now()),
+        ('adc_sample_rate_hz', '50', datetime.now()),
+        ('temperature_sample_rate_hz', '0.5', datetime.now()),
+        ('cell1_divider', '5.7', datetime.now()),
+        ('cell2_divider', '3.127', datetime.now()),
+        ('cell3_divider', '1.47', datetime.now()),
+        ('adc_reference_voltage', '3.3', datetime.now()),
+        ('adc_burst_size', '8', datetime.now()),
+        ('adc_filter', 'median', datetime.now()),
+        ('bms_source', 'auto', datetime.now()),
+        ('cell_count', str(DEFAULT_CELL_COUNT), datetime.now()),
+        ('simulator_seed', '', datetime.now()),
+        ('simulator_rate_hz', '1.0', datetime.now()),
+        ('simulator_dropout_rate', '0.0', datetime.now()),
+        ('replay_path', '', datetime.now()),
+        ('replay_pack_id', str(DEFAULT_PACK_ID), datetime.now()),
+        ('replay_speed', '1x', datetime.now())
+    ]
+
+    # parameter_name has no UNIQUE constraint, so only add defaults that are missing
+    cursor.executemany('''
+    INSERT INTO Configuration (parameter_name, value, last_updated)
+    SELECT ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM Configuration WHERE parameter_name = ?)
+    ''', [(name, value, updated, name) for name, value, updated in default_configs])
+
+def _table_columns(conn, table):
+    return {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def _migrate_epoch_timestamps(conn):
+    """Version 2: BatteryData.timestamp TEXT (ISO-8601) -> INTEGER epoch milliseconds"""
+    columns = _table_columns(conn, 'BatteryData')
+    if columns and columns.get('timestamp') != 'INTEGER':
+        conn.create_function('to_epoch_ms', 1, to_epoch_ms, deterministic=True)
+        conn.execute('ALTER TABLE BatteryData RENAME TO BatteryData_v1')
+        conn.execute(BATTERY_DATA_TABLE)
+
+        if all(col in columns for col in LEGACY_SAMPLE_COLUMNS):
+            cols = ', '.join(LEGACY_SAMPLE_COLUMNS)
+            conn.execute(f'''
+            INSERT INTO BatteryData (id, timestamp, {cols})
+            SELECT id, ts, {cols}
+            FROM (SELECT id, to_epoch_ms(timestamp) AS ts, {cols} FROM BatteryData_v1)
+            WHERE ts IS NOT NULL
+            ORDER BY ts
+            ''')
+            conn.execute('DROP TABLE BatteryData_v1')
+        else:
+            # Very old voltage/current layout; keep the rows around instead of guessing
+            conn.execute('ALTER TABLE BatteryData_v1 RENAME TO BatteryData_legacy')
+            print("BatteryData had an unsupported layout, old rows kept in BatteryData_legacy")
+
+    # The plain timestamp indexes are superseded by the covering index
+    conn.execute('DROP INDEX IF EXISTS idx_timestamp')
+    conn.execute('DROP INDEX IF EXISTS idx_battery_data_timestamp')
+    if columns:
+        conn.execute(BATTERY_DATA_INDEX)
+
+def _migrate_partitions(conn):
+    """Version 4: split BatteryData into day partitions behind a BatteryData view"""
+    from partitions import migrate_to_partitions
+
+    migrate_to_partitions(conn)
+
+def _migrate_warning_thresholds(conn):
+    """Version 5: the seeded 3.7 V cell limits never matched the readings, use the GUI's 14 V"""
+    if not _table_columns(conn, 'Configuration'):
+        return
+    conn.execute('''
+    UPDATE Configuration SET value = ?, last_updated = ?
+    WHERE parameter_name IN ('cell1_warning_threshold', 'cell2_warning_threshold', 'cell3_warning_threshold')
+    AND value = '3.7'
+    ''', (DEFAULT_CELL_WARNING_THRESHOLD, datetime.now()))
+
+def _migrate_packs(conn):
+    """Version 6: pack_id and up to MAX_CELLS nullable cell columns in every partition, per-pack rollups"""
+    from partitions import create_partition_registry, list_partitions, rebuild_partition, rebuild_view
+    from rollups import rebuild_rollups
+
+    create_partition_registry(conn)
+    _create_packs_table(conn)
+
+    # Renaming tables would rewrite the view to point at the old copies
+    conn.execute('DROP VIEW IF EXISTS BatteryData')
+    for _, table in list_partitions(conn):
+        if 'pack_id' not in _table_columns(conn, table):
+            rebuild_partition(conn, table, LEGACY_SAMPLE_COLUMNS)
+
+    # Copy the old rollups rather than recompute them, the coarse ones outlive the raw samples
+    backfill = False
+    for resolution, _ in ROLLUP_RESOLUTIONS:
+        table = rollup_table(resolution)
+        columns = _table_columns(conn, table)
+        if 'pack_id' in columns:
+            continue
+        if columns:
+            conn.execute(f'ALTER TABLE {table} RENAME TO {table}_v5')
+        conn.execute(_rollup_table_sql(resolution))
+        if columns:
+            stats = ', '.join(f'{col}_min, {col}_max, {col}_sum' for col in LEGACY_SAMPLE_COLUMNS)
+            conn.execute(f'''
+            INSERT INTO {table} (pack_id, bucket, sample_count, {stats})
+            SELECT {DEFAULT_PACK_ID}, bucket, sample_count, {stats} FROM {table}_v5
+            ''')
+            conn.execute(f'DROP TABLE {table}_v5')
+        else:
+            backfill = True
+    if backfill:
+        rebuild_rollups(conn)
+
+    chunk_columns = _table_columns(conn, 'SampleChunks')
+    if chunk_columns and 'pack_id' not in chunk_columns:
+        conn.execute(f'ALTER TABLE SampleChunks ADD COLUMN pack_id INTEGER NOT NULL DEFAULT {DEFAULT_PACK_ID}')
+        conn.execute('DROP INDEX IF EXISTS idx_sample_chunks_time')
+        conn.execute('CREATE INDEX idx_sample_chunks_time ON SampleChunks(pack_id, end_ms, start_ms)')
+
+    rebuild_view(conn)
+
+def _migrate_chunk_seal(conn):
+    """Version 7: SampleChunks.sealed, so the chunk being filled survives a restart.
+
+    Existing chunks count as sealed; at worst the last one of a pack stays short.
+    """
+    columns = _table_columns(conn, 'SampleChunks')
+    if columns and 'sealed' not in columns:
+        conn.execute('ALTER TABLE SampleChunks ADD COLUMN sealed INTEGER NOT NULL DEFAULT 1')
+
+# (version, migration) pairs, applied in order to databases below that version;
+# None only bumps the version
+MIGRATIONS = [
+    (2, _migrate_epoch_timestamps),
+    # Version 3 added the rollup tables; version 6 creates them in their per-pack layout
+    (3, None),
+    (4, _migrate_partitions),
+    (5, _migrate_warning_thresholds),
+    (6, _migrate_packs),
+    (7, _migrate_chunk_seal),
+]
+
+def migrate_database(conn):
+    """Bring an open database up to SCHEMA_VERSION in a single transaction"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    for target, migration in MIGRATIONS:
+        if version < target:
+            if migration:
+                migration(conn)
+            version = target
+            conn.execute(f'PRAGMA user_version = {version}')
+    return version
+
 if __name__ == "__main__":
-    create_database() 
\ No newline at end of file
+    create_database()
\ No newline at end of file
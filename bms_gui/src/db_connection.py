@@ -0,0 +1,117 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = 'database/battery_data.db'
+
+# Tuning applied to every connection
+BUSY_TIMEOUT_MS = 10000
+MMAP_SIZE = 64 * 1024 * 1024   # 64 MB memory-mapped I/O
+CACHE_SIZE_KB = 8192           # 8 MB page cache per connection
+
+
+class ConnectionManager:
+    """Shared SQLite connections for the whole application.
+
+    There is exactly one writer connection, serialized by a lock, and a small
+    pool of read connections. The database runs in WAL mode so readers (graph
+    refresh, exports, settings) never block on, or get blocked by, the ingest
+    writer.
+    """
+
+    def __init__(self, db_path=DB_PATH, pool_size=4):
+        self.db_path = os.path.abspath(db_path)
+        self.pool_size = pool_size
+        self.write_lock = threading.RLock()
+        self._writer = None
+        self._readers = queue.Queue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
+
+    def _open(self, read_only=False):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Connections are handed between threads, access is serialized by the lock/pool
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        if not read_only:
+            # journal_mode is persistent in the database file, the writer sets it once
+            conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if read_only:
+            conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Yield the writer connection; commits on success and rolls back on error"""
+        with self.write_lock:
+            if self._writer is None:
+                self._writer = self._open()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Yield a read-only connection from the pool"""
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                if self._reader_count < self.pool_size:
+                    self._reader_count += 1
+                    try:
+                        conn = self._open(read_only=True)
+                    except Exception:
+                        self._reader_count -= 1
+                        raise
+        if conn is None:
+            # Pool exhausted, wait for another thread to return a connection
+            conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close_all(self):
+        with self.write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._pool_lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._reader_count = 0
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_connection_manager():
+    """Return the process-wide connection manager, creating it on first use"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager()
+        return _manager
+
+
+def close_connections():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close_all()
+            _manager = None
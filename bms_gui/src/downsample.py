@@ -0,0 +1,85 @@
+import numpy as np
+
+# Downsampling of time series to a fixed number of points for plotting.
+#
+# minmax keeps the lowest and highest sample of every bucket, so spikes
+# survive at any zoom level. lttb (Largest-Triangle-Three-Buckets) keeps the
+# one sample per bucket that best preserves the visual shape of the line.
+# Both take x (n,) and y (n,) or (n, lines) and return copies with at most
+# `points` rows; shorter input is returned unchanged. With several lines each
+# line keeps its own samples, so x comes back as (points, lines) as well.
+
+def _bucket_edges(n, buckets):
+    return np.linspace(0, n, buckets + 1).astype(np.intp)
+
+def minmax(x, y, points):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    buckets = max(points // 2, 1)
+    if n <= points:
+        return _unchanged(x, y)
+
+    squeeze = y.ndim == 1
+    y2 = y.reshape(n, -1)
+    # Equal-size buckets as one 3D view; the few leftover samples join the last bucket
+    size = n // buckets
+    blocks = y2[:buckets * size].reshape(buckets, size, -1)
+    low, high = blocks.argmin(axis=1), blocks.argmax(axis=1)
+    if n > buckets * size:
+        last = (buckets - 1) * size
+        low[-1], high[-1] = y2[last:].argmin(axis=0), y2[last:].argmax(axis=0)
+
+    base = (np.arange(buckets) * size)[:, None, None]
+    # Both samples of a bucket, in time order
+    picks = np.stack([np.minimum(low, high), np.maximum(low, high)], axis=1) + base
+    return _select(x, y2, picks.reshape(2 * buckets, -1), squeeze)
+
+def _unchanged(x, y):
+    if y.ndim == 1:
+        return x, y
+    return np.repeat(x[:, None], y.shape[1], axis=1), y
+
+def _select(x, y2, index, squeeze):
+    values = np.take_along_axis(y2, index, axis=0)
+    if squeeze:
+        return x[index[:, 0]], values[:, 0]
+    return x[index], values
+
+def lttb(x, y, points):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= points or points < 3:
+        return _unchanged(x, y)
+
+    squeeze = y.ndim == 1
+    y2 = y.reshape(n, -1)
+    xf = x.astype(np.float64)
+
+    # First and last points are kept, the rest is split into points - 2 buckets
+    edges = 1 + _bucket_edges(n - 2, points - 2)
+    starts, ends = edges[:-1], edges[1:]
+    # Average of every bucket, used as the third triangle corner for the bucket before it
+    x_avg = np.add.reduceat(xf[1:-1], starts - 1) / (ends - starts)
+    y_avg = np.add.reduceat(y2[1:-1], starts - 1, axis=0) / (ends - starts)[:, None]
+    x_avg = np.append(x_avg, xf[-1])
+    y_avg = np.vstack([y_avg, y2[-1]])
+
+    index = np.empty((points, y2.shape[1]), dtype=np.intp)
+    index[0], index[-1] = 0, n - 1
+    prev = np.zeros(y2.shape[1], dtype=np.intp)
+    cols = np.arange(y2.shape[1])
+    for b in range(points - 2):
+        lo, hi = starts[b], ends[b]
+        bx = xf[lo:hi, None]
+        by = y2[lo:hi]
+        px, py = xf[prev], y2[prev, cols]
+        # Twice the triangle area for every candidate, all lines at once
+        area = np.abs((px - x_avg[b + 1]) * (by - py) - (px - bx) * (y_avg[b + 1] - py))
+        prev = lo + np.argmax(area, axis=0)
+        index[b + 1] = prev
+
+    return _select(x, y2, index, squeeze)
+
+METHODS = {'LTTB': lttb, 'Min/max': minmax}
@@ -0,0 +1,164 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import threading
+
+from database import iter_range, log_export, get_packs
+from database_schema import SAMPLE_COLUMNS, DEFAULT_PACK_ID, pack_columns
+from rollups import get_rollup_data
+from time_utils import now_ms, from_epoch_ms
+
+# Export formats as shown in the GUI -> (file extension, ExportLogs format name)
+EXPORT_FORMATS = {
+    'CSV': ('.csv', 'CSV'),
+    'CSV (gzip)': ('.csv.gz', 'CSV_GZ'),
+    'JSON Lines': ('.jsonl', 'JSONL'),
+    'Columnar archive': ('', 'COLUMNAR'),
+}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportJob:
+    """Export a time range of one pack to a file on a worker thread.
+
+    Only the cells the pack has are written. Rows are streamed from iter_range
+    in batches, so memory use doesn't depend
+    on the size of the range. The GUI polls rows_written/total_rows and state,
+    and can call cancel() at any time. Finished exports are recorded in ExportLogs.
+    """
+
+    def __init__(self, file_path, export_format='CSV', start_ms=None, end_ms=None, batch_size=5000,
+                 pack_id=DEFAULT_PACK_ID):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+        self.file_path = file_path
+        self.export_format = export_format
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.batch_size = batch_size
+        self.pack_id = pack_id
+        self.columns = SAMPLE_COLUMNS
+
+        self.state = 'pending'   # pending, running, done, cancelled, failed
+        self.error = None
+        self.rows_written = 0
+        self.total_rows = 0
+        self.thread = None
+        self._cancel = threading.Event()
+
+    def start(self):
+        self.state = 'running'
+        self.thread = threading.Thread(target=self._run, name="ExportJob")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def finished(self):
+        return self.state in ('done', 'cancelled', 'failed')
+
+    @property
+    def progress(self):
+        """Fraction done, based on the rollup sample counts estimated up front"""
+        if self.state == 'done':
+            return 1.0
+        if not self.total_rows:
+            return 0.0
+        return min(self.rows_written / self.total_rows, 1.0)
+
+    def _estimate_rows(self):
+        # Hourly rollups give the row count of any range for the price of a few rows
+        start = self.start_ms if self.start_ms is not None else 0
+        end = self.end_ms if self.end_ms is not None else now_ms() + 1
+        _, rows = get_rollup_data(start, end, resolution='1h', pack_id=self.pack_id, columns=[])
+        return sum(row[1] for row in rows)
+
+    def _check_cancel(self):
+        if self._cancel.is_set():
+            raise ExportCancelled()
+
+    def _run(self):
+        existed = os.path.exists(self.file_path)
+        try:
+            pack = get_packs().get(self.pack_id)
+            if pack:
+                self.columns = pack_columns(pack[1])
+            self.total_rows = self._estimate_rows()
+            if self.export_format == 'Columnar archive':
+                from archive import export_archive
+
+                def progress(count):
+                    self.rows_written = count
+                    self._check_cancel()
+                export_archive(self.file_path, self.start_ms, self.end_ms, progress=progress,
+                               pack_id=self.pack_id, columns=self.columns)
+            elif self.export_format == 'JSON Lines':
+                with open(self.file_path, 'w') as f:
+                    self._write_jsonl(f)
+            elif self.export_format == 'CSV (gzip)':
+                with gzip.open(self.file_path, 'wt', newline='') as f:
+                    self._write_csv(f)
+            else:
+                with open(self.file_path, 'w', newline='') as f:
+                    self._write_csv(f)
+
+            log_export(self.file_path, EXPORT_FORMATS[self.export_format][1])
+            self.state = 'done'
+        except ExportCancelled:
+            self._remove_partial(existed)
+            self.state = 'cancelled'
+        except Exception as e:
+            self._remove_partial(existed)
+            self.error = str(e)
+            self.state = 'failed'
+
+    def _remove_partial(self, existed):
+        """Delete what a cancelled or failed export left behind"""
+        try:
+            if self.export_format != 'Columnar archive':
+                if os.path.exists(self.file_path):
+                    os.remove(self.file_path)
+            elif not existed:
+                shutil.rmtree(self.file_path, ignore_errors=True)
+            else:
+                # Exported into an existing directory, only remove the archive's own files
+                from archive import MANIFEST_FILE
+
+                for name in ['timestamp'] + list(self.columns) + [MANIFEST_FILE]:
+                    path = os.path.join(self.file_path, name if name == MANIFEST_FILE else f'{name}.bin')
+                    if os.path.exists(path):
+                        os.remove(path)
+        except OSError as e:
+            print(f"Error removing partial export {self.file_path}: {str(e)}")
+
+    def _batches(self):
+        for batch in iter_range(self.start_ms, self.end_ms, columns=self.columns, batch_size=self.batch_size,
+                                pack_id=self.pack_id):
+            self._check_cancel()
+            yield batch
+            self.rows_written += len(batch)
+
+    def _write_csv(self, f):
+        # Earlier versions wrote no pack_id and always three cells; csv_importer.py reads both
+        writer = csv.writer(f)
+        writer.writerow(['timestamp', 'pack_id'] + self.columns)
+        pack_id = self.pack_id
+        for batch in self._batches():
+            writer.writerows((from_epoch_ms(row[0]).isoformat(), pack_id) + tuple(row[1:]) for row in batch)
+
+    def _write_jsonl(self, f):
+        for batch in self._batches():
+            lines = []
+            for row in batch:
+                record = {'timestamp': from_epoch_ms(row[0]).isoformat(), 'timestamp_ms': row[0],
+                          'pack_id': self.pack_id}
+                record.update(zip(self.columns, row[1:]))
+                lines.append(json.dumps(record))
+            f.write('\n'.join(lines) + '\n')
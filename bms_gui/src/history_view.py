@@ -0,0 +1,209 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+from database import iter_range, get_packs
+from database_schema import SAMPLE_COLUMNS, ROLLUP_RESOLUTIONS, DEFAULT_PACK_ID, DEFAULT_CELL_COUNT, pack_columns
+from downsample import METHODS
+from live_plot import to_datenum, from_datenum
+from rollups import get_rollup_data
+from time_utils import LOCAL_TZ, now_ms
+
+# History browser: any time range, drawn with a fixed number of points.
+#
+# Ranges with few enough samples are read raw, longer ones from the rollup
+# tables, and either way the result is downsampled to the canvas width
+# before it reaches matplotlib. Panning or zooming with the toolbar reloads
+# the visible range at the resolution that fits it. Each pack is shown with
+# one line per cell it has.
+
+HISTORY_WINDOWS = {
+    "10 minutes": 10 * 60,
+    "1 hour": 60 * 60,
+    "24 hours": 24 * 60 * 60,
+    "7 days": 7 * 24 * 60 * 60,
+}
+
+# Points per line, whatever the canvas width
+MAX_POINTS = 2000
+# Above this many samples the rollups are read instead of raw rows
+RAW_ROW_LIMIT = 50000
+# Rollup buckets fetched per displayed point, so downsampling has something to choose from
+ROLLUP_FETCH_FACTOR = 20
+RELOAD_DELAY_MS = 150
+
+
+def load_history(start_ms, end_ms, points, method='Min/max', pack_id=DEFAULT_PACK_ID, columns=None):
+    """Return (timestamps, values, source) of one pack for [start_ms, end_ms) with at most `points` rows per line.
+
+    timestamps and values are (rows, columns) arrays, one column per entry of
+    columns (default SAMPLE_COLUMNS); source is 'raw' or the rollup resolution used.
+    """
+    columns = list(columns or SAMPLE_COLUMNS)
+    # Hourly rollups give the row count of any range for the price of a few rows
+    _, hours = get_rollup_data(start_ms, end_ms, resolution='1h', pack_id=pack_id, columns=[])
+    if sum(row[1] for row in hours) <= RAW_ROW_LIMIT:
+        source = 'raw'
+        batches = list(iter_range(start_ms, end_ms, columns=columns, as_numpy=True, pack_id=pack_id))
+        if batches:
+            timestamps = np.concatenate([batch[0] for batch in batches])
+            values = np.concatenate([batch[1] for batch in batches])
+        else:
+            timestamps = np.empty(0, dtype=np.int64)
+            values = np.empty((0, len(columns)))
+    else:
+        source, buckets = get_rollup_data(start_ms, end_ms, max_points=points * ROLLUP_FETCH_FACTOR,
+                                          pack_id=pack_id, columns=columns)
+        bucket_ms = dict(ROLLUP_RESOLUTIONS)[source]
+        data = np.array(buckets, dtype=np.float64).reshape(len(buckets), 2 + 3 * len(columns))
+        # Each bucket becomes its min and max half a bucket apart, so spikes stay visible
+        timestamps = np.repeat(data[:, 0].astype(np.int64), 2)
+        timestamps[1::2] += bucket_ms // 2
+        values = np.empty((len(timestamps), len(columns)))
+        values[0::2] = data[:, 2::3]
+        values[1::2] = data[:, 3::3]
+
+    timestamps, values = METHODS[method](timestamps, values, points)
+    return timestamps, values, source
+
+
+class HistoryWindow:
+    def __init__(self, root):
+        self.top = tk.Toplevel(root)
+        self.top.title("History")
+        self.top.geometry("1100x750")
+
+        controls = ttk.Frame(self.top, padding="5")
+        controls.pack(side=tk.TOP, fill=tk.X)
+        ttk.Label(controls, text="Window:").pack(side=tk.LEFT, padx=5)
+        self.window_var = tk.StringVar(value="1 hour")
+        window_box = ttk.Combobox(controls, textvariable=self.window_var, values=list(HISTORY_WINDOWS),
+                                  state="readonly", width=12)
+        window_box.pack(side=tk.LEFT, padx=5)
+        window_box.bind("<<ComboboxSelected>>", lambda event: self.show_window())
+
+        ttk.Label(controls, text="Downsampling:").pack(side=tk.LEFT, padx=5)
+        self.method_var = tk.StringVar(value="Min/max")
+        method_box = ttk.Combobox(controls, textvariable=self.method_var, values=list(METHODS),
+                                  state="readonly", width=10)
+        method_box.pack(side=tk.LEFT, padx=5)
+        method_box.bind("<<ComboboxSelected>>", lambda event: self.reload_visible())
+
+        # Packs and their cell counts, from the Packs table
+        self.packs = get_packs() or {DEFAULT_PACK_ID: (None, DEFAULT_CELL_COUNT)}
+        ttk.Label(controls, text="Pack:").pack(side=tk.LEFT, padx=5)
+        self.pack_var = tk.StringVar(value=str(min(self.packs)))
+        pack_box = ttk.Combobox(controls, textvariable=self.pack_var, values=[str(p) for p in sorted(self.packs)],
+                                state="readonly", width=6)
+        pack_box.pack(side=tk.LEFT, padx=5)
+        pack_box.bind("<<ComboboxSelected>>", lambda event: self.select_pack())
+
+        ttk.Button(controls, text="Latest", command=self.show_window).pack(side=tk.LEFT, padx=5)
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(controls, textvariable=self.status_var).pack(side=tk.RIGHT, padx=5)
+
+        self.fig = Figure(figsize=(10, 7))
+        self.ax1 = self.fig.add_subplot(3, 1, 1)
+        self.ax2 = self.fig.add_subplot(3, 1, 2, sharex=self.ax1)
+        self.ax3 = self.fig.add_subplot(3, 1, 3, sharex=self.ax1)
+
+        # One line per column of the selected pack, in column order; build_lines adds the cells
+        self.columns = []
+        self.cell_lines = []
+        self.temp_line, = self.ax2.plot([], [], 'r-', label='Temperature')
+        self.soc_line, = self.ax3.plot([], [], 'm-', label='SOC')
+        for ax, title in [(self.ax1, 'Cell Voltages (V)'), (self.ax2, 'Temperature (°C)'),
+                          (self.ax3, 'State of Charge (%)')]:
+            ax.set_title(title)
+            ax.grid(True)
+        self.ax2.legend(loc='upper right')
+        self.ax3.legend(loc='upper right')
+        self.build_lines()
+        locator = mdates.AutoDateLocator(tz=LOCAL_TZ)
+        self.ax3.xaxis.set_major_locator(locator)
+        self.ax3.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator, tz=LOCAL_TZ))
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.top)
+        toolbar = NavigationToolbar2Tk(self.canvas, self.top, pack_toolbar=False)
+        toolbar.update()
+        toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        self._loading = False
+        self._reload_id = None
+        # Axes share x, so one callback covers pan and zoom on any of them
+        self.ax1.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+        self.top.update_idletasks()
+        self.show_window()
+
+    @property
+    def pack_id(self):
+        return int(self.pack_var.get())
+
+    @property
+    def lines(self):
+        return self.cell_lines + [self.temp_line, self.soc_line]
+
+    def build_lines(self):
+        """One voltage line per cell of the selected pack"""
+        cell_count = self.packs[self.pack_id][1]
+        self.columns = pack_columns(cell_count)
+        for line in self.cell_lines:
+            line.remove()
+        self.cell_lines = [self.ax1.plot([], [], '-', label=f'Cell {cell}')[0]
+                           for cell in range(1, cell_count + 1)]
+        self.ax1.legend(loc='upper right', ncol=max(1, cell_count // 8), fontsize='small')
+
+    def select_pack(self):
+        self.build_lines()
+        self.reload_visible()
+
+    def show_window(self):
+        """Show the selected window up to now"""
+        end = now_ms()
+        self.load(end - HISTORY_WINDOWS[self.window_var.get()] * 1000, end, set_limits=True)
+
+    def reload_visible(self):
+        self._reload_id = None
+        left, right = self.ax1.get_xlim()
+        self.load(from_datenum(left), from_datenum(right))
+
+    def _on_xlim_changed(self, ax):
+        if self._loading:
+            return
+        # Wait until panning/zooming pauses before reading the new range
+        if self._reload_id:
+            self.top.after_cancel(self._reload_id)
+        self._reload_id = self.top.after(RELOAD_DELAY_MS, self.reload_visible)
+
+    def load(self, start_ms, end_ms, set_limits=False):
+        width = self.canvas.get_tk_widget().winfo_width()
+        points = min(max(width, 100), MAX_POINTS)
+        try:
+            timestamps, values, source = load_history(start_ms, end_ms, points, self.method_var.get(),
+                                                      pack_id=self.pack_id, columns=self.columns)
+        except Exception as e:
+            print(f"History load error: {str(e)}")
+            return
+
+        self._loading = True
+        try:
+            for column, line in enumerate(self.lines):
+                line.set_data(to_datenum(timestamps[:, column]), values[:, column])
+            if set_limits:
+                self.ax1.set_xlim(to_datenum(start_ms), to_datenum(end_ms))
+            for ax in [self.ax1, self.ax2, self.ax3]:
+                ax.relim()
+                ax.autoscale_view(scalex=False)
+        finally:
+            self._loading = False
+
+        detail = "raw samples" if source == 'raw' else f"{source} rollups"
+        self.status_var.set(f"{len(timestamps)} points per line from {detail}")
+        self.fig.tight_layout()
+        self.canvas.draw_idle()
@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+import logging
+
+from database import insert_many, register_pack
+from time_utils import now_ms
+
+
+class _FlushMarker:
+    """Queue entry used to wait until everything submitted before it is on disk"""
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class IngestWriter:
+    """Write-behind ingest queue for BatteryData.
+
+    Acquisition threads call submit() with a PackSample, or submit_row() with
+    a storage row, which only enqueues it. A single
+    background thread drains the queue and writes the rows with executemany in
+    group commits, either when batch_size rows are pending or when
+    flush_interval seconds have passed since the first pending row.
+    """
+
+    def __init__(self, max_queue_size=10000, batch_size=500, flush_interval=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self.is_running = False
+
+        # Cell count of every pack seen, registered in Packs by the writer thread
+        self.cell_counts = {}
+        self._packs_changed = False
+
+        # Counters for diagnostics
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.commits = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.is_running = True
+        self.thread = threading.Thread(target=self._writer_loop, name="IngestWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, sample):
+        """Queue a PackSample without waiting for the database. Returns False if it was dropped."""
+        if not sample.timestamp:
+            # Stamp at acquisition time, not at write time
+            sample.timestamp = now_ms()
+        return self.submit_row(sample.row(), len(sample.cells))
+
+    def submit_row(self, row, cell_count):
+        """Queue a (timestamp_ms, pack_id, *SAMPLE_COLUMNS) row of a pack with cell_count cells"""
+        if self.cell_counts.get(row[1]) != cell_count:
+            self.cell_counts[row[1]] = cell_count
+            self._packs_changed = True
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.rows_dropped += 1
+            if self.rows_dropped % 1000 == 1:
+                logging.warning(f"Ingest queue full, {self.rows_dropped} samples dropped so far")
+            return False
+
+    def flush(self, timeout=None):
+        """Block until every sample submitted before this call has been committed"""
+        if not self.thread or not self.thread.is_alive():
+            # No writer running, write whatever is pending from this thread
+            self._write_batch(self._drain_nowait())
+            return True
+        marker = _FlushMarker()
+        self.queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def shutdown(self, timeout=5.0):
+        """Flush pending samples and stop the writer thread"""
+        if not self.thread:
+            return
+        self.flush(timeout)
+        self.is_running = False
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logging.error(f"Database writer didn't stop, {self.queue.qsize()} samples not written")
+            return
+        self.thread = None
+        # Samples submitted after the flush, or left over when it timed out
+        self._write_batch(self._drain_nowait())
+
+    def _drain_nowait(self):
+        rows = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if isinstance(item, _FlushMarker):
+                item.done.set()
+            else:
+                rows.append(item)
+
+    def _writer_loop(self):
+        while self.is_running:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            rows = []
+            markers = []
+            deadline = time.monotonic() + self.flush_interval
+
+            # Collect until the batch is full, the time budget is spent or someone asks for a flush
+            while True:
+                if isinstance(item, _FlushMarker):
+                    markers.append(item)
+                    break
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            self._write_batch(rows)
+            for marker in markers:
+                marker.done.set()
+
+    def _write_batch(self, rows):
+        if not rows:
+            return
+        if self._packs_changed:
+            self._packs_changed = False
+            for pack_id, cell_count in list(self.cell_counts.items()):
+                register_pack(pack_id, cell_count)
+        if insert_many(rows):
+            self.rows_written += len(rows)
+            self.commits += 1
+        else:
+            logging.error(f"Failed to write batch of {len(rows)} samples")
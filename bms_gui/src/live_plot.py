@@ -0,0 +1,154 @@
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import matplotlib.dates as mdates
+
+# Incremental renderer for the live graphs.
+#
+# The line artists are marked animated, so a normal draw renders everything
+# else (axes, grid, ticks, legends, threshold lines) and that background is
+# cached per axes. A frame then only restores the background, draws the
+# lines and blits the axes area. A full draw, with layout, happens only when
+# the newest sample runs past the x limits or a value leaves the y limits,
+# and frames are capped at max_fps.
+
+DEFAULT_MAX_FPS = 10
+
+# Fraction of the window left empty on the right, so the x axis only jumps
+# forward once every window * X_HEADROOM instead of every frame
+X_HEADROOM = 0.1
+Y_MARGIN = 0.1
+
+# Matplotlib date number of the Unix epoch, to convert epoch ms without pandas
+EPOCH_DATENUM = mdates.date2num(datetime(1970, 1, 1, tzinfo=timezone.utc))
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def to_datenum(timestamps_ms):
+    """Epoch milliseconds (scalar or array) to matplotlib date numbers"""
+    return np.asarray(timestamps_ms) / MS_PER_DAY + EPOCH_DATENUM
+
+
+def from_datenum(datenum):
+    """Matplotlib date number to epoch milliseconds"""
+    return int(round((datenum - EPOCH_DATENUM) * MS_PER_DAY))
+
+
+class BlitRenderer:
+    def __init__(self, canvas, axes_lines, window, max_fps=DEFAULT_MAX_FPS, keep_visible=None):
+        """axes_lines maps each axes to its lines; window is the x span in data units.
+        keep_visible maps an axes to a y value that must stay in view (e.g. a threshold)."""
+        self.canvas = canvas
+        self.figure = canvas.figure
+        self.axes_lines = axes_lines
+        self.window = window
+        self.keep_visible = keep_visible or {}
+        self.set_max_fps(max_fps)
+
+        self._backgrounds = None
+        self._last_frame = 0.0
+        self.frames = 0
+        self.full_draws = 0
+
+        for lines in axes_lines.values():
+            for line in lines:
+                line.set_animated(True)
+        canvas.mpl_connect('draw_event', self._on_draw)
+        canvas.mpl_connect('resize_event', self._on_resize)
+
+    def set_max_fps(self, max_fps):
+        self.frame_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+
+    def render(self, force=False):
+        """Draw a frame unless the frame budget says to wait; returns True if drawn"""
+        now = time.perf_counter()
+        if not force and now - self._last_frame < self.frame_interval:
+            return False
+        self._last_frame = now
+        self.frames += 1
+
+        if self._backgrounds is None or self._rescale():
+            self.full_draws += 1
+            self.figure.tight_layout()
+            self.canvas.draw()
+        else:
+            self._blit()
+        return True
+
+    def invalidate(self):
+        """Force a full draw on the next frame, e.g. after lines were cleared"""
+        self._backgrounds = None
+
+    def set_lines(self, axes_lines):
+        """Replace the animated lines, e.g. after the plot was rebuilt for another cell count"""
+        for lines in axes_lines.values():
+            for line in lines:
+                line.set_animated(True)
+        self.axes_lines = axes_lines
+        self._backgrounds = None
+
+    def _on_resize(self, event):
+        self._backgrounds = None
+        self.figure.tight_layout()
+
+    def _on_draw(self, event):
+        # Called at the end of every full draw, with the lines left out
+        self._backgrounds = {ax: self.canvas.copy_from_bbox(ax.bbox) for ax in self.axes_lines}
+        for ax, lines in self.axes_lines.items():
+            for line in lines:
+                ax.draw_artist(line)
+
+    def _blit(self):
+        for ax, lines in self.axes_lines.items():
+            self.canvas.restore_region(self._backgrounds[ax])
+            for line in lines:
+                ax.draw_artist(line)
+            self.canvas.blit(ax.bbox)
+        self.canvas.flush_events()
+
+    def _data_range(self, lines):
+        x_max, y_min, y_max = None, None, None
+        for line in lines:
+            x, y = line.get_xdata(), line.get_ydata()
+            if not len(x):
+                continue
+            x_max = x[-1] if x_max is None else max(x_max, x[-1])
+            finite = y[np.isfinite(y)]
+            if len(finite):
+                lo, hi = finite.min(), finite.max()
+                y_min = lo if y_min is None else min(y_min, lo)
+                y_max = hi if y_max is None else max(y_max, hi)
+        return x_max, y_min, y_max
+
+    def _rescale(self):
+        """Move the limits of all axes if any data left them; returns True if anything changed"""
+        ranges = {ax: self._data_range(lines) for ax, lines in self.axes_lines.items()}
+
+        changed = False
+        for ax, (x_max, y_min, y_max) in ranges.items():
+            if x_max is None:
+                continue
+            left, right = ax.get_xlim()
+            bottom, top = ax.get_ylim()
+            if not left <= x_max <= right:
+                changed = True
+            if y_min is not None and (y_min < bottom or y_max > top):
+                changed = True
+        if not changed:
+            return False
+
+        # Refit everything at once so the axes scroll together and y can shrink again
+        for ax, (x_max, y_min, y_max) in ranges.items():
+            if x_max is None:
+                continue
+            right = x_max + self.window * X_HEADROOM
+            ax.set_xlim(right - self.window * (1 + X_HEADROOM), right)
+            if y_min is None:
+                continue
+            if ax in self.keep_visible:
+                y_min = min(y_min, self.keep_visible[ax])
+                y_max = max(y_max, self.keep_visible[ax])
+            margin = max((y_max - y_min) * Y_MARGIN, abs(y_max) * 0.01, 0.1)
+            ax.set_ylim(y_min - margin, y_max + margin)
+        return True
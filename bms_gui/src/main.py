@@ -1,7 +1,7 @@
+import startup_timing
 import os
 import sys
 import logging
-from database_schema import create_database
 from main_gui import BMSGUI
 import tkinter as tk
 
@@ -24,11 +24,9 @@ def main():
         
         # Log startup
         logging.info("=== BMS Application Starting ===")
+        startup_timing.mark("imports")
         
-        # Initialize database
-        create_database()
-        
-        # Start the GUI
+        # Start the GUI (it also initializes the database)
         root = tk.Tk()
         app = BMSGUI(root)
         root.mainloop()
@@ -1,16 +1,42 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd
 from datetime import datetime, timedelta
-import sqlite3
 from bms_communication import BMSCommunication
 import threading
+import queue
 import time
 import os
 import sys
-from database import create_database, insert_data, get_recent_data, clear_data
+import math
+from database import create_database, clear_data, get_configuration
+from database_schema import CELL_COLUMNS, pack_columns
+from pack_model import PackSample
+from db_connection import close_connections
+from ingest_writer import IngestWriter
+from time_utils import LOCAL_TZ, now_ms
+from exporter import ExportJob, EXPORT_FORMATS
+import startup_timing
+
+# Seconds of history shown in the live graphs
+LIVE_WINDOW_SECONDS = 60
+
+# How often the Tk thread drains the sample queue and refreshes the display
+UI_REFRESH_MS = 100
+UI_QUEUE_SIZE = 1000
+ALERT_LIST_SIZE = 100
+# Cell readouts per column of the real-time display
+CELLS_PER_COLUMN = 8
+# Longest the Tk thread waits for the database writer to catch up, in seconds
+WRITER_FLUSH_TIMEOUT = 2.0
+
+# Export dialog choices -> window length in seconds (None exports everything)
+EXPORT_RANGES = {
+    "Last 10 minutes": 10 * 60,
+    "Last hour": 60 * 60,
+    "Last 24 hours": 24 * 60 * 60,
+    "Last 7 days": 7 * 24 * 60 * 60,
+    "All data": None,
+}
 
 class BMSGUI:
     def __init__(self, root):
@@ -25,16 +51,30 @@ class BMSGUI:
             self.temp_threshold = 30.0
             self.cell_voltage_threshold = 14.0
             self.collection_thread = None
+            self.writer = None
+            self.alert_engine = None
+            self.buffer = None
+            # Cell count the display and the graph lines are built for
+            self.cell_count = 0
+            # Samples from the collection thread to the Tk thread; no Tk calls happen off the Tk thread
+            self.ui_queue = queue.Queue(maxsize=UI_QUEUE_SIZE)
+            self.ui_after_id = None
+            self.graph_dirty = False
             
             # Create database directory and initialize database
             try:
                 os.makedirs('database', exist_ok=True)
                 create_database()
+                startup_timing.mark("database")
             except Exception as e:
                 messagebox.showerror("Database Error", f"Failed to initialize database: {str(e)}")
                 self.root.destroy()
                 return
             
+            # Start the background database writer
+            self.writer = IngestWriter()
+            self.writer.start()
+            
             # Initialize BMS communication
             try:
                 self.bms = BMSCommunication()
@@ -43,12 +83,47 @@ class BMSGUI:
                 self.root.destroy()
                 return
             
-            # Create UI elements
+            # Create UI elements; the graphs follow once the window is on screen
             self.create_frames()
             self.create_connection_panel()
             self.create_real_time_display()
-            self.create_graphs()
             self.create_control_panel()
+            self.graph_placeholder = ttk.Label(self.graph_frame, text="Loading graphs...")
+            self.graph_placeholder.pack(expand=True)
+            self.root.update()
+            startup_timing.mark("window")
+            
+            # NumPy and matplotlib are imported only now, so they don't delay the first frame
+            from sample_buffer import SampleBuffer
+            from alerts import AlertEngine
+            from rules import RuleSet
+            
+            # Threshold alerts are evaluated on their own thread, with the limits from Configuration
+            alert_rules = RuleSet.from_configuration()
+            self.alert_engine = AlertEngine(alert_rules)
+            self.alert_engine.start()
+            # A serial board's samples go to storage and alerting straight from its thread
+            self.bms.attach(self.writer, self.alert_engine)
+            
+            # Threshold lines show the configured limits (the lowest one for the cell voltages)
+            temp_limit = alert_rules.limit('temperature')
+            cell_limit = min(alert_rules.limit(column) for column in CELL_COLUMNS[:self.bms.cell_count])
+            if math.isfinite(temp_limit):
+                self.temp_threshold = temp_limit
+            if math.isfinite(cell_limit):
+                self.cell_voltage_threshold = cell_limit
+            
+            # Recent samples for the live graphs, seeded from the database
+            self.buffer = SampleBuffer(columns=pack_columns(self.bms.cell_count), pack_id=self.bms.pack_id)
+            self.buffer.preload(LIVE_WINDOW_SECONDS)
+            
+            self.graph_placeholder.destroy()
+            self.create_graphs()
+            startup_timing.mark("graphs")
+            startup_timing.report()
+            
+            self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+            self.ui_after_id = self.root.after(UI_REFRESH_MS, self.process_ui_queue)
             
         except Exception as e:
             messagebox.showerror("Initialization Error", f"Failed to initialize application: {str(e)}")
@@ -85,43 +160,60 @@ class BMSGUI:
 
     def create_real_time_display(self):
         try:
-            # Cell voltage displays
-            ttk.Label(self.display_frame, text="Cell 1 (V):").grid(row=0, column=0, padx=5, pady=5)
-            self.cell1_var = tk.StringVar(value="0.0")
-            ttk.Label(self.display_frame, textvariable=self.cell1_var).grid(row=0, column=1, padx=5, pady=5)
-            self.cell1_warning = ttk.Label(self.display_frame, text="", foreground="red")
-            self.cell1_warning.grid(row=0, column=2, padx=5, pady=5)
-            
-            ttk.Label(self.display_frame, text="Cell 2 (V):").grid(row=1, column=0, padx=5, pady=5)
-            self.cell2_var = tk.StringVar(value="0.0")
-            ttk.Label(self.display_frame, textvariable=self.cell2_var).grid(row=1, column=1, padx=5, pady=5)
-            self.cell2_warning = ttk.Label(self.display_frame, text="", foreground="red")
-            self.cell2_warning.grid(row=1, column=2, padx=5, pady=5)
-            
-            ttk.Label(self.display_frame, text="Cell 3 (V):").grid(row=2, column=0, padx=5, pady=5)
-            self.cell3_var = tk.StringVar(value="0.0")
-            ttk.Label(self.display_frame, textvariable=self.cell3_var).grid(row=2, column=1, padx=5, pady=5)
-            self.cell3_warning = ttk.Label(self.display_frame, text="", foreground="red")
-            self.cell3_warning.grid(row=2, column=2, padx=5, pady=5)
+            # Cell voltage displays, built for the pack's cell count
+            self.cell_frame = ttk.Frame(self.display_frame)
+            self.cell_frame.grid(row=0, column=0, columnspan=3, sticky="w")
+            self.cell_vars = []
+            self.warning_labels = {}
             
             # Temperature display
-            ttk.Label(self.display_frame, text="Temperature (°C):").grid(row=3, column=0, padx=5, pady=5)
+            ttk.Label(self.display_frame, text="Temperature (°C):").grid(row=1, column=0, padx=5, pady=5)
             self.temp_var = tk.StringVar(value="0.0")
-            ttk.Label(self.display_frame, textvariable=self.temp_var).grid(row=3, column=1, padx=5, pady=5)
+            ttk.Label(self.display_frame, textvariable=self.temp_var).grid(row=1, column=1, padx=5, pady=5)
             self.temp_warning = ttk.Label(self.display_frame, text="", foreground="red")
-            self.temp_warning.grid(row=3, column=2, padx=5, pady=5)
+            self.temp_warning.grid(row=1, column=2, padx=5, pady=5)
             
             # State of charge display
-            ttk.Label(self.display_frame, text="State of Charge (%):").grid(row=4, column=0, padx=5, pady=5)
+            ttk.Label(self.display_frame, text="State of Charge (%):").grid(row=2, column=0, padx=5, pady=5)
             self.soc_var = tk.StringVar(value="0.0")
-            ttk.Label(self.display_frame, textvariable=self.soc_var).grid(row=4, column=1, padx=5, pady=5)
+            ttk.Label(self.display_frame, textvariable=self.soc_var).grid(row=2, column=1, padx=5, pady=5)
+            
+            # Alert notifications, newest first; nothing here blocks the UI
+            ttk.Label(self.display_frame, text="Alerts:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+            self.alert_list = tk.Listbox(self.display_frame, height=10, width=50)
+            self.alert_list.grid(row=4, column=0, columnspan=3, padx=5, pady=5, sticky="nsew")
+            
+            self.build_cell_display(self.bms.cell_count)
         except Exception as e:
             messagebox.showerror("UI Error", f"Failed to create real-time display: {str(e)}")
             raise
 
+    def build_cell_display(self, cell_count):
+        """(Re)create one readout and warning label per cell"""
+        for widget in self.cell_frame.winfo_children():
+            widget.destroy()
+        self.cell_count = cell_count
+        self.cell_vars = []
+        # Warning label and text shown while an alert on that column is open
+        self.warning_labels = {'temperature': (self.temp_warning, "⚠ High Temperature!")}
+        for index, column in enumerate(CELL_COLUMNS[:cell_count]):
+            row, group = index % CELLS_PER_COLUMN, 3 * (index // CELLS_PER_COLUMN)
+            ttk.Label(self.cell_frame, text=f"Cell {index + 1} (V):").grid(row=row, column=group, padx=5, pady=5)
+            var = tk.StringVar(value="0.0")
+            ttk.Label(self.cell_frame, textvariable=var).grid(row=row, column=group + 1, padx=5, pady=5)
+            warning = ttk.Label(self.cell_frame, text="", foreground="red")
+            warning.grid(row=row, column=group + 2, padx=5, pady=5)
+            self.cell_vars.append(var)
+            self.warning_labels[column] = (warning, "⚠ High Voltage!")
+
     def create_graphs(self):
         try:
-            self.fig = plt.figure(figsize=(10, 8))
+            from matplotlib.figure import Figure
+            import matplotlib.dates as mdates
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from live_plot import BlitRenderer, DEFAULT_MAX_FPS
+            
+            self.fig = Figure(figsize=(10, 8))
             
             # Create a 2x2 grid of graphs
             self.ax1 = self.fig.add_subplot(2, 2, 1)  # Cell Voltages (top-left)
@@ -131,10 +223,8 @@ class BMSGUI:
             self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
             self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
             
-            # Cell voltage lines
-            self.cell1_line, = self.ax1.plot([], [], 'r-', label='Cell 1')
-            self.cell2_line, = self.ax1.plot([], [], 'g-', label='Cell 2')
-            self.cell3_line, = self.ax1.plot([], [], 'b-', label='Cell 3')
+            # Cell voltage lines are added by build_cell_lines
+            self.cell_lines = []
             
             self.temp_line, = self.ax2.plot([], [], 'r-', label='Temperature')
             self.soc_line, = self.ax3.plot([], [], 'm-', label='SOC')
@@ -146,7 +236,6 @@ class BMSGUI:
             # Configure each graph
             self.ax1.set_title('Cell Voltages (V)')
             self.ax1.set_ylabel('Voltage')
-            self.ax1.legend(loc='upper right')
             self.ax1.grid(True)
             
             self.ax2.set_title('Temperature (°C)')
@@ -160,16 +249,46 @@ class BMSGUI:
             self.ax3.grid(True)
             
             # Format the x-axis to display time properly
+            date_format = mdates.DateFormatter('%H:%M:%S', tz=LOCAL_TZ)
             for ax in [self.ax1, self.ax2, self.ax3]:
                 ax.set_xlabel('Time')
                 ax.tick_params(axis='x', rotation=45)
-                plt.setp(ax.get_xticklabels(), ha='right')
+                ax.xaxis.set_major_formatter(date_format)
+                for label in ax.get_xticklabels():
+                    label.set_horizontalalignment('right')
             
             self.fig.tight_layout()
+            
+            # Only the lines are redrawn per frame; limits and layout change when data leaves them
+            try:
+                max_fps = float(get_configuration().get('graph_max_fps', DEFAULT_MAX_FPS))
+            except ValueError:
+                max_fps = DEFAULT_MAX_FPS
+            self.renderer = BlitRenderer(
+                self.canvas,
+                {self.ax2: [self.temp_line], self.ax3: [self.soc_line]},
+                window=LIVE_WINDOW_SECONDS / (24 * 60 * 60),
+                max_fps=max_fps,
+                keep_visible={self.ax1: self.cell_voltage_threshold, self.ax2: self.temp_threshold},
+            )
+            self.build_cell_lines(self.cell_count)
         except Exception as e:
             messagebox.showerror("UI Error", f"Failed to create graphs: {str(e)}")
             raise
 
+    def build_cell_lines(self, cell_count):
+        """(Re)create one voltage line per cell and hand them to the renderer"""
+        for line in self.cell_lines:
+            line.remove()
+        self.cell_lines = [self.ax1.plot([], [], '-', label=f'Cell {cell}')[0]
+                           for cell in range(1, cell_count + 1)]
+        self.ax1.legend(loc='upper right', ncol=max(1, cell_count // CELLS_PER_COLUMN), fontsize='small')
+        self.renderer.set_lines({
+            self.ax1: self.cell_lines,
+            self.ax2: [self.temp_line],
+            self.ax3: [self.soc_line],
+        })
+
     def create_control_panel(self):
         try:
             self.start_button = ttk.Button(self.control_frame, text="Start Monitoring", command=self.toggle_monitoring)
@@ -180,6 +299,9 @@ class BMSGUI:
             
             self.clear_button = ttk.Button(self.control_frame, text="Clear Data", command=self.clear_data)
             self.clear_button.grid(row=0, column=2, padx=5, pady=5)
+            
+            self.history_button = ttk.Button(self.control_frame, text="History", command=self.open_history)
+            self.history_button.grid(row=0, column=3, padx=5, pady=5)
         except Exception as e:
             messagebox.showerror("UI Error", f"Failed to create control panel: {str(e)}")
             raise
@@ -212,146 +334,124 @@ class BMSGUI:
         except Exception as e:
             messagebox.showerror("Monitoring Error", f"Failed to toggle monitoring: {str(e)}")
 
-    def check_warnings(self, temperature, cell_voltages):
+    def check_warnings(self):
+        """Show alert events from the alert engine as warning labels and list entries"""
         try:
-            # Check for temperature warnings
-            if temperature > self.temp_threshold:
-                self.temp_warning.config(text="⚠ High Temperature!")
-                messagebox.showerror("High Temperature Alert", f"High Temperature Detected: {temperature:.2f}°C exceeds threshold of {self.temp_threshold}°C!")
-            else:
-                self.temp_warning.config(text="")
-                
-            # Check for cell voltage warnings
-            voltage_exceeded = False
-            if cell_voltages[0] > self.cell_voltage_threshold:
-                self.cell1_warning.config(text="⚠ High Voltage!")
-                voltage_exceeded = True
-            else:
-                self.cell1_warning.config(text="")
-                
-            if cell_voltages[1] > self.cell_voltage_threshold:
-                self.cell2_warning.config(text="⚠ High Voltage!")
-                voltage_exceeded = True
-            else:
-                self.cell2_warning.config(text="")
-                
-            if cell_voltages[2] > self.cell_voltage_threshold:
-                self.cell3_warning.config(text="⚠ High Voltage!")
-                voltage_exceeded = True
-            else:
-                self.cell3_warning.config(text="")
-                
-            # Show a message box for voltage warning only if we haven't shown one recently
-            if voltage_exceeded:
-                over_cells = [f"Cell {i+1}: {v:.2f}V" for i, v in enumerate(cell_voltages) if v > self.cell_voltage_threshold]
-                messagebox.showerror("High Voltage Alert", f"High Voltage Detected!\n{', '.join(over_cells)} exceeds threshold of {self.cell_voltage_threshold}V!")
-                
+            for event in self.alert_engine.poll_events():
+                label, text = self.warning_labels.get(event.rule.column, (None, ""))
+                if event.kind == 'open':
+                    if label:
+                        label.config(text=text)
+                    self.alert_list.insert(0, event.describe())
+                    self.alert_list.itemconfig(0, foreground="red")
+                    self.root.bell()
+                else:
+                    # Other rules on the same column may still be open
+                    if label and not any(rule.column == event.rule.column
+                                         for rule in self.alert_engine.active_rules()):
+                        label.config(text="")
+                    self.alert_list.insert(0, event.describe())
+            
+            if self.alert_list.size() > ALERT_LIST_SIZE:
+                self.alert_list.delete(ALERT_LIST_SIZE, tk.END)
         except Exception as e:
             print(f"Warning check error: {str(e)}")
 
     def collect_data(self):
+        from sample_buffer import SampleBuffer
+        
+        # One record, refilled every poll; everyone downstream copies what they keep
+        record = PackSample()
         while self.data_collection_active:
             try:
                 if self.bms and self.bms.connected:
-                    data = self.bms.read_data()
-                    if data:
-                        # Update displays
-                        if 'cell_voltages' in data and len(data['cell_voltages']) >= 3:
-                            self.cell1_var.set(f"{data['cell_voltages'][0]:.2f}")
-                            self.cell2_var.set(f"{data['cell_voltages'][1]:.2f}")
-                            self.cell3_var.set(f"{data['cell_voltages'][2]:.2f}")
+                    sample = self.bms.read_data(record)
+                    while sample:
+                        # Queue data for the background database writer and keep it for the graphs
+                        if not self.bms.replaying:
+                            sample.timestamp = now_ms()
+                        timestamp = sample.timestamp
+                        readings = sample.readings()
+                        if len(readings) != len(self.buffer.columns):
+                            # The pack's cell count changed; the Tk thread rebuilds the display to match
+                            self.buffer = SampleBuffer(columns=sample.columns(), pack_id=sample.pack_id)
+                        if not self.bms.streaming:
+                            if self.bms.stores_samples:
+                                self.writer.submit(sample)
+                            self.alert_engine.submit(timestamp, sample.values())
+                        self.buffer.append(timestamp, readings)
                         
-                        # Update temperature
-                        self.temp_var.set(f"{data['temperature']:.2f}")
-                        
-                        # Update state of charge
-                        self.soc_var.set(f"{data['state_of_charge']:.2f}")
-                        
-                        # Insert data into database
-                        insert_data(
-                            data['cell_voltages'][0],
-                            data['cell_voltages'][1],
-                            data['cell_voltages'][2],
-                            data['temperature'],
-                            data['state_of_charge']
-                        )
-                        
-                        self.check_warnings(data['temperature'], data['cell_voltages'])
-                        
-                        self.update_graphs()
+                        # Hand the sample to the Tk thread
+                        self.push_ui_sample(timestamp, readings)
+                        # A replay serves every sample that has come due, one per call
+                        sample = self.bms.read_data(record) if self.bms.replaying else None
             except Exception as e:
                 print(f"Data collection error: {str(e)}")
             
-            time.sleep(1)
+            # As often as the source produces readings (the ADC rate on the Pi)
+            time.sleep(self.bms.poll_interval if self.bms else 1)
+
+    def push_ui_sample(self, timestamp, sample):
+        try:
+            self.ui_queue.put_nowait((timestamp, sample))
+        except queue.Full:
+            # The display is behind; it only needs the newest samples, so drop the oldest
+            try:
+                self.ui_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.ui_queue.put_nowait((timestamp, sample))
+
+    def process_ui_queue(self):
+        """Drain the sample queue on the Tk thread and refresh the display once per UI tick"""
+        try:
+            samples = []
+            while True:
+                try:
+                    samples.append(self.ui_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            if samples:
+                # Labels show the newest sample; the alert engine has seen all of them
+                _, latest = samples[-1]
+                cell_count = len(latest) - 2
+                if cell_count != self.cell_count:
+                    self.build_cell_display(cell_count)
+                    self.build_cell_lines(cell_count)
+                for var, value in zip(self.cell_vars, latest):
+                    var.set(f"{value:.2f}")
+                self.temp_var.set(f"{latest[-2]:.2f}")
+                self.soc_var.set(f"{latest[-1]:.2f}")
+                self.graph_dirty = True
+            
+            self.check_warnings()
+            
+            # Also retries a frame the renderer skipped to stay within its frame budget
+            if self.graph_dirty:
+                self.update_graphs()
+        except Exception as e:
+            print(f"UI update error: {str(e)}")
+        finally:
+            self.ui_after_id = self.root.after(UI_REFRESH_MS, self.process_ui_queue)
 
     def update_graphs(self):
         try:
-            data = get_recent_data(60)
-            if not data:
-                print("No data returned from get_recent_data")
+            # Views into the ring buffer; the database is only read if the
+            # window reaches back before the oldest buffered sample
+            timestamps, values = self.buffer.window(LIVE_WINDOW_SECONDS)
+            lines = self.cell_lines + [self.temp_line, self.soc_line]
+            if not len(timestamps) or values.shape[1] != len(lines):
+                self.graph_dirty = False
                 return
-                
-            # Convert data to DataFrame with explicit column names
-            df = pd.DataFrame(data, columns=['timestamp', 'cell1_voltage', 'cell2_voltage', 
-                                           'cell3_voltage', 'temperature', 'state_of_charge'])
+            from live_plot import to_datenum
+            times = to_datenum(timestamps)
             
-            # Convert timestamp strings to datetime objects
-            try:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                print(f"Converted timestamps. Sample: {df['timestamp'].iloc[0] if not df.empty else 'No data'}")
-            except Exception as te:
-                print(f"Timestamp conversion error: {str(te)}. First timestamp: {df['timestamp'].iloc[0] if not df.empty else 'No data'}")
-                return
+            for column, line in enumerate(lines):
+                line.set_data(times, values[:, column])
             
-            # Debug print
-            print(f"Data retrieved: {len(df)} rows")
-            if not df.empty:
-                print(f"Sample data - Time: {df['timestamp'].iloc[0]}, Cell1: {df['cell1_voltage'].iloc[0]}")
-            
-            # Reset data on all lines first
-            self.cell1_line.set_data([], [])
-            self.cell2_line.set_data([], [])
-            self.cell3_line.set_data([], [])
-            self.temp_line.set_data([], [])
-            self.soc_line.set_data([], [])
-            
-            # If we have data, then set it
-            if not df.empty:
-                # Update individual cell voltage graphs
-                self.cell1_line.set_data(df['timestamp'], df['cell1_voltage'])
-                self.cell2_line.set_data(df['timestamp'], df['cell2_voltage'])
-                self.cell3_line.set_data(df['timestamp'], df['cell3_voltage'])
-                
-                # Update temperature graph
-                self.temp_line.set_data(df['timestamp'], df['temperature'])
-                
-                # Update SOC graph
-                self.soc_line.set_data(df['timestamp'], df['state_of_charge'])
-                
-                # Update the axis limits
-                for ax in [self.ax1, self.ax2, self.ax3]:
-                    ax.relim()
-                    ax.autoscale_view()
-                
-                # Set date formatter for x-axis
-                from matplotlib.dates import DateFormatter
-                date_format = DateFormatter('%H:%M:%S')
-                for ax in [self.ax1, self.ax2, self.ax3]:
-                    ax.xaxis.set_major_formatter(date_format)
-                
-                # Ensure threshold lines remain visible after autoscaling
-                y_min, y_max = self.ax1.get_ylim()
-                if y_max < self.cell_voltage_threshold:
-                    self.ax1.set_ylim(y_min, self.cell_voltage_threshold * 1.1)
-                
-                y_min, y_max = self.ax2.get_ylim()
-                if y_max < self.temp_threshold:
-                    self.ax2.set_ylim(y_min, self.temp_threshold * 1.1)
-            
-            # Force redraw
-            self.fig.tight_layout()  # Adjust layout to accommodate labels
-            self.canvas.draw_idle()
-            self.canvas.flush_events()
+            # Blits the lines, or does a full redraw if the data left the axis limits
+            self.graph_dirty = not self.renderer.render()
         except Exception as e:
             print(f"Graph update error: {str(e)}")
             import traceback
@@ -359,80 +459,117 @@ class BMSGUI:
 
     def export_data(self):
         try:
-            from tkinter import filedialog
-            
-            # Ask user if they want to export recent data or cancel
-            export_option = messagebox.askokcancel(
-                "Export Options", 
-                "Export recent data (last hour)?\n\nClick 'OK' to export or 'Cancel' to abort."
-            )
-            
-            if not export_option:  # User clicked Cancel
-                return
+            dialog = tk.Toplevel(self.root)
+            dialog.title("Export Data")
+            dialog.transient(self.root)
+            dialog.resizable(False, False)
+            
+            ttk.Label(dialog, text="Time range:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+            range_var = tk.StringVar(value="Last hour")
+            ttk.Combobox(dialog, textvariable=range_var, values=list(EXPORT_RANGES),
+                         state="readonly").grid(row=0, column=1, padx=5, pady=5)
+            
+            ttk.Label(dialog, text="Format:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+            format_var = tk.StringVar(value="CSV")
+            ttk.Combobox(dialog, textvariable=format_var, values=list(EXPORT_FORMATS),
+                         state="readonly").grid(row=1, column=1, padx=5, pady=5)
+            
+            progress_var = tk.DoubleVar(value=0.0)
+            ttk.Progressbar(dialog, variable=progress_var, maximum=1.0, length=250).grid(
+                row=2, column=0, columnspan=2, padx=5, pady=5)
+            status_var = tk.StringVar(value="")
+            ttk.Label(dialog, textvariable=status_var).grid(row=3, column=0, columnspan=2, padx=5)
+            
+            export_button = ttk.Button(dialog, text="Export")
+            export_button.grid(row=4, column=0, padx=5, pady=5)
+            cancel_button = ttk.Button(dialog, text="Close", command=dialog.destroy)
+            cancel_button.grid(row=4, column=1, padx=5, pady=5)
+            
+            # The running export, cancelled when the dialog is closed
+            current = {'job': None}
+            
+            def close_dialog():
+                if current['job'] and not current['job'].finished:
+                    current['job'].cancel()
+                dialog.destroy()
+            
+            dialog.protocol("WM_DELETE_WINDOW", close_dialog)
+            
+            def start_export():
+                extension, _ = EXPORT_FORMATS[format_var.get()]
+                default_name = f"bms_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                if format_var.get() == "Columnar archive":
+                    # Archives are a directory of column files
+                    folder = filedialog.askdirectory(title="Choose a folder for the archive")
+                    filename = os.path.join(folder, default_name) if folder else ""
+                else:
+                    filename = filedialog.asksaveasfilename(
+                        title="Save BMS Data",
+                        initialfile=default_name + extension,
+                        defaultextension=extension,
+                        filetypes=[(format_var.get(), f"*{extension}"), ("All Files", "*.*")]
+                    )
+                if not filename:  # User cancelled file dialog
+                    return
                 
-            # Export recent data only
-            data = get_recent_data(60)  # Get last hour of data
-            title = "Recent BMS Data (Last Hour)"
-            
-            if not data:
-                messagebox.showinfo("Info", "No data to export")
-                return
+                # Include samples still waiting in the write-behind queue
+                if not self.writer.flush(WRITER_FLUSH_TIMEOUT):
+                    print("Database writer is behind, the newest samples may be missing from the export")
+                window = EXPORT_RANGES[range_var.get()]
+                start_ms = now_ms() - window * 1000 if window else None
+                job = ExportJob(filename, format_var.get(), start_ms=start_ms)
+                job.start()
+                current['job'] = job
                 
-            df = pd.DataFrame(data, columns=['timestamp', 'cell1_voltage', 'cell2_voltage', 
-                                           'cell3_voltage', 'temperature', 'state_of_charge'])
-            
-            # Default filename with timestamp
-            default_filename = f"bms_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-            # Open file dialog to let user choose save location
-            filename = filedialog.asksaveasfilename(
-                title=f"Save {title}", 
-                initialfile=default_filename,
-                defaultextension=".csv",
-                filetypes=[("CSV Files", "*.csv"), ("All Files", "*.*")]
-            )
-            
-            if not filename:  # User cancelled file dialog
-                return
+                export_button.configure(state="disabled")
+                cancel_button.configure(text="Cancel", command=job.cancel)
+                self.root.after(200, poll_export, job)
+            
+            def poll_export(job):
+                if not dialog.winfo_exists():
+                    return
+                progress_var.set(job.progress)
+                status_var.set(f"{job.rows_written} rows written")
+                if not job.finished:
+                    self.root.after(200, poll_export, job)
+                    return
                 
-            # Export the data
-            df.to_csv(filename, index=False)
-            messagebox.showinfo("Success", f"Data exported to {filename}")
-            
-            # Record the export in the database
-            conn = sqlite3.connect('database/battery_data.db')
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO ExportLogs (timestamp, file_path, export_format) VALUES (?, ?, ?)", 
-                (datetime.now().isoformat(), filename, "CSV")
-            )
-            conn.commit()
-            conn.close()
+                export_button.configure(state="normal")
+                cancel_button.configure(text="Close", command=dialog.destroy)
+                if job.state == "done":
+                    status_var.set(f"Exported {job.rows_written} rows")
+                    messagebox.showinfo("Success", f"Data exported to {job.file_path}", parent=dialog)
+                elif job.state == "cancelled":
+                    status_var.set("Export cancelled")
+                else:
+                    messagebox.showerror("Export Error", f"Failed to export data: {job.error}", parent=dialog)
+            
+            export_button.configure(command=start_export)
             
         except Exception as e:
             messagebox.showerror("Export Error", f"Failed to export data: {str(e)}")
 
+    def open_history(self):
+        try:
+            from history_view import HistoryWindow
+            HistoryWindow(self.root)
+        except Exception as e:
+            messagebox.showerror("History Error", f"Failed to open history: {str(e)}")
+
     def clear_data(self):
         try:
             if messagebox.askyesno("Confirm", "Are you sure you want to clear all data?"):
+                # Make sure queued samples don't reappear after the clear
+                self.writer.flush(WRITER_FLUSH_TIMEOUT)
                 clear_data()
+                self.buffer.preload(LIVE_WINDOW_SECONDS)
                 
                 # Reset displays
-                self.cell1_var.set("0.0")
-                self.cell2_var.set("0.0")
-                self.cell3_var.set("0.0")
-                self.temp_var.set("0.0")
-                self.soc_var.set("0.0")
-                
-                # Clear warning labels
-                self.cell1_warning.config(text="")
-                self.cell2_warning.config(text="")
-                self.cell3_warning.config(text="")
-                self.temp_warning.config(text="")
+                for var in self.cell_vars + [self.temp_var, self.soc_var]:
+                    var.set("0.0")
                 
                 # Clear graphs
-                for line in [self.cell1_line, self.cell2_line, self.cell3_line, 
-                           self.temp_line, self.soc_line]:
+                for line in self.cell_lines + [self.temp_line, self.soc_line]:
                     line.set_data([], [])
                 self.canvas.draw()
                 
@@ -440,6 +577,24 @@ class BMSGUI:
         except Exception as e:
             messagebox.showerror("Clear Error", f"Failed to clear data: {str(e)}")
 
+    def on_close(self):
+        try:
+            self.data_collection_active = False
+            if self.ui_after_id:
+                self.root.after_cancel(self.ui_after_id)
+                self.ui_after_id = None
+            if self.bms and self.bms.connected:
+                self.bms.disconnect()
+            if self.alert_engine:
+                self.alert_engine.shutdown()
+            if self.writer:
+                self.writer.shutdown()
+            close_connections()
+        except Exception as e:
+            print(f"Shutdown error: {str(e)}")
+        finally:
+            self.root.destroy()
+
 if __name__ == "__main__":
     try:
         root = tk.Tk()
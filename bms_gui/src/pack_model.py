@@ -0,0 +1,72 @@
+from array import array
+
+from database_schema import MAX_CELLS, DEFAULT_PACK_ID, DEFAULT_CELL_COUNT, pack_columns
+
+# One reading of one pack, with any number of cells up to MAX_CELLS.
+#
+# PackSample is a __slots__ record with the cell voltages in a flat
+# array('d'). Acquisition keeps one record per pack and updates it in place,
+# and read_data() copies it into a record the caller owns, so sampling
+# allocates no dicts or lists per sample. values() and row() lay a sample out
+# in SAMPLE_COLUMNS order for storage and alerting, readings() in the compact
+# pack_columns(cell_count) order the live graphs use.
+
+# None for every cell a pack doesn't have, by cell count
+_PADDING = [(None,) * (MAX_CELLS - n) for n in range(MAX_CELLS + 1)]
+
+
+class PackSample:
+    __slots__ = ('pack_id', 'timestamp', 'cells', 'current', 'temperature', 'state_of_charge')
+
+    def __init__(self, pack_id=DEFAULT_PACK_ID, cell_count=DEFAULT_CELL_COUNT):
+        if not 0 < cell_count <= MAX_CELLS:
+            raise ValueError(f"A pack has 1 to {MAX_CELLS} cells, not {cell_count}")
+        self.pack_id = pack_id
+        self.timestamp = 0
+        self.cells = array('d', bytes(8 * cell_count))
+        self.current = 0.0
+        self.temperature = 0.0
+        self.state_of_charge = 0.0
+
+    @property
+    def cell_count(self):
+        return len(self.cells)
+
+    @property
+    def voltage(self):
+        return sum(self.cells)
+
+    def columns(self):
+        return pack_columns(len(self.cells))
+
+    def set_cells(self, values):
+        """Replace the cell voltages; the cell count follows len(values), up to MAX_CELLS"""
+        if len(values) > MAX_CELLS:
+            values = values[:MAX_CELLS]
+        self.cells[:] = values if isinstance(values, array) else array('d', values)
+
+    def copy_to(self, other):
+        """Copy this sample into another record and return it"""
+        other.pack_id = self.pack_id
+        other.timestamp = self.timestamp
+        other.cells[:] = self.cells
+        other.current = self.current
+        other.temperature = self.temperature
+        other.state_of_charge = self.state_of_charge
+        return other
+
+    def copy(self):
+        return self.copy_to(PackSample(self.pack_id, len(self.cells)))
+
+    def values(self):
+        """Measurements in SAMPLE_COLUMNS order, None for cells the pack doesn't have"""
+        return (*self.cells, *_PADDING[len(self.cells)], self.temperature, self.state_of_charge)
+
+    def row(self):
+        """(timestamp_ms, pack_id, *SAMPLE_COLUMNS) as stored by insert_many"""
+        return (self.timestamp, self.pack_id, *self.cells, *_PADDING[len(self.cells)],
+                self.temperature, self.state_of_charge)
+
+    def readings(self):
+        """Measurements in pack_columns(cell_count) order"""
+        return (*self.cells, self.temperature, self.state_of_charge)
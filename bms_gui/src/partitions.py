@@ -0,0 +1,184 @@
+from datetime import datetime, timezone
+
+from database_schema import SAMPLE_COLUMNS, LEGACY_SAMPLE_COLUMNS, DEFAULT_PACK_ID, ROLLUP_RESOLUTIONS, rollup_table
+from time_utils import now_ms
+
+# Raw samples are stored in one table per UTC day (BatteryData_YYYYMMDD).
+# BatteryPartitions lists them, and BatteryData is a view spanning all of them
+# so ad-hoc SQL keeps working. Application code goes through the router below,
+# which only touches the partitions overlapping the requested time range.
+# Expiring old data is a DROP TABLE per day instead of a DELETE over millions of rows.
+
+DAY_MS = 24 * 60 * 60 * 1000
+DEFAULT_RETENTION_DAYS = 90
+
+# SQLite limits a compound SELECT to 500 terms, the view only spans the newest partitions
+MAX_VIEW_PARTITIONS = 400
+
+def partition_day(timestamp_ms):
+    return timestamp_ms // DAY_MS
+
+def partition_table(day):
+    date = datetime.fromtimestamp(day * DAY_MS / 1000, tz=timezone.utc)
+    return f"BatteryData_{date.strftime('%Y%m%d')}"
+
+def create_partition_registry(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS BatteryPartitions (
+        day INTEGER PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL
+    )
+    ''')
+
+def _create_partition_sql(table):
+    # Measurements are nullable: cells a pack doesn't have, and readings that dropped out
+    columns = ',\n        '.join(f'{col} REAL' for col in SAMPLE_COLUMNS)
+    return f'''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        timestamp INTEGER NOT NULL,
+        pack_id INTEGER NOT NULL DEFAULT {DEFAULT_PACK_ID},
+        {columns}
+    )
+    '''
+
+def create_partition_index(conn, table):
+    # Covering index; every query reads one pack, so pack_id leads
+    conn.execute(f'''
+    CREATE INDEX IF NOT EXISTS idx_{table}_cover
+    ON {table}(pack_id, timestamp, {', '.join(SAMPLE_COLUMNS)})
+    ''')
+
+def list_partitions(conn, start_ms=None, end_ms=None):
+    """Return [(day, table_name)] in time order, limited to partitions overlapping [start_ms, end_ms)"""
+    sql = 'SELECT day, table_name FROM BatteryPartitions WHERE 1'
+    params = []
+    if start_ms is not None:
+        sql += ' AND end_ms > ?'
+        params.append(start_ms)
+    if end_ms is not None:
+        sql += ' AND start_ms < ?'
+        params.append(end_ms)
+    return conn.execute(sql + ' ORDER BY day', params).fetchall()
+
+def ensure_partition(conn, day):
+    """Return the table for a day, creating it (and refreshing the view) if needed"""
+    row = conn.execute('SELECT table_name FROM BatteryPartitions WHERE day = ?', (day,)).fetchone()
+    if row:
+        return row[0], False
+
+    table = partition_table(day)
+    conn.execute(_create_partition_sql(table))
+    create_partition_index(conn, table)
+    conn.execute(
+        'INSERT INTO BatteryPartitions (day, table_name, start_ms, end_ms) VALUES (?, ?, ?, ?)',
+        (day, table, day * DAY_MS, (day + 1) * DAY_MS)
+    )
+    rebuild_view(conn)
+    return table, True
+
+def rebuild_partition(conn, table, columns):
+    """Copy a partition with only the given measurement columns into the current layout"""
+    cols = ', '.join(columns)
+    conn.execute(f'DROP INDEX IF EXISTS idx_{table}_cover')
+    conn.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+    conn.execute(_create_partition_sql(table))
+    conn.execute(f'''
+    INSERT INTO {table} (id, timestamp, {cols})
+    SELECT id, timestamp, {cols} FROM {table}_old ORDER BY id
+    ''')
+    conn.execute(f'DROP TABLE {table}_old')
+    create_partition_index(conn, table)
+
+def rebuild_view(conn):
+    """Recreate the BatteryData view over the current partitions"""
+    columns = f"id, timestamp, pack_id, {', '.join(SAMPLE_COLUMNS)}"
+    tables = [table for _, table in list_partitions(conn)][-MAX_VIEW_PARTITIONS:]
+    if tables:
+        body = '\nUNION ALL\n'.join(f'SELECT {columns} FROM {table}' for table in tables)
+    else:
+        # Keep the view (and its column list) valid when no data is stored
+        empty = ', '.join(f'NULL AS {col}' for col in ['id', 'timestamp', 'pack_id'] + SAMPLE_COLUMNS)
+        body = f'SELECT {empty} WHERE 0'
+    conn.execute('DROP VIEW IF EXISTS BatteryData')
+    conn.execute(f'CREATE VIEW BatteryData AS {body}')
+
+def drop_partitions(conn, days):
+    """Drop whole partitions; cost depends on the number of days, not rows"""
+    dropped = 0
+    for day in days:
+        row = conn.execute('SELECT table_name FROM BatteryPartitions WHERE day = ?', (day,)).fetchone()
+        if not row:
+            continue
+        conn.execute(f'DROP TABLE IF EXISTS {row[0]}')
+        conn.execute('DELETE FROM BatteryPartitions WHERE day = ?', (day,))
+        dropped += 1
+    if dropped:
+        rebuild_view(conn)
+    return dropped
+
+def drop_all_partitions(conn):
+    return drop_partitions(conn, [day for day, _ in list_partitions(conn)])
+
+def get_retention_days(conn):
+    """retention_days from Configuration; 0 or less keeps data forever"""
+    row = conn.execute(
+        "SELECT value FROM Configuration WHERE parameter_name = 'retention_days' ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    try:
+        return int(row[0]) if row else DEFAULT_RETENTION_DAYS
+    except ValueError:
+        return DEFAULT_RETENTION_DAYS
+
+def retention_cutoff_ms(conn, retention_days=None):
+    """Start of the oldest day that is kept, or None if retention is disabled"""
+    if retention_days is None:
+        retention_days = get_retention_days(conn)
+    if retention_days <= 0:
+        return None
+    return (partition_day(now_ms()) - retention_days) * DAY_MS
+
+def apply_retention(conn, retention_days=None):
+    """Drop partitions older than the retention window and trim the 1 s rollups with them.
+
+    The 1 min and 1 h rollups are small and are kept, so long-term trends
+    outlive the raw samples.
+    """
+    if retention_days is None:
+        retention_days = get_retention_days(conn)
+    cutoff_ms = retention_cutoff_ms(conn, retention_days)
+    if cutoff_ms is None:
+        return 0
+
+    old_days = [day for day, _ in list_partitions(conn, end_ms=cutoff_ms)]
+    dropped = drop_partitions(conn, old_days)
+    if dropped:
+        print(f"Retention: dropped {dropped} day partition(s) older than {retention_days} days")
+        finest = ROLLUP_RESOLUTIONS[0][0]
+        conn.execute(f'DELETE FROM {rollup_table(finest)} WHERE bucket < ?', (cutoff_ms,))
+    return dropped
+
+def migrate_to_partitions(conn):
+    """Move rows from a plain BatteryData table into day partitions"""
+    create_partition_registry(conn)
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'BatteryData'").fetchone()
+    if row and row[0] == 'table':
+        conn.execute('ALTER TABLE BatteryData RENAME TO BatteryData_unpartitioned')
+        cols = ', '.join(LEGACY_SAMPLE_COLUMNS)
+        days = [r[0] for r in conn.execute(
+            f'SELECT DISTINCT timestamp / {DAY_MS} FROM BatteryData_unpartitioned ORDER BY 1'
+        )]
+        for day in days:
+            table, _ = ensure_partition(conn, day)
+            conn.execute(f'''
+            INSERT INTO {table} (id, timestamp, {cols})
+            SELECT id, timestamp, {cols} FROM BatteryData_unpartitioned
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+            ''', (day * DAY_MS, (day + 1) * DAY_MS))
+        conn.execute('DROP TABLE BatteryData_unpartitioned')
+    elif row and row[0] == 'view':
+        return
+    rebuild_view(conn)
@@ -0,0 +1,311 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from database_schema import SAMPLE_COLUMNS, MAX_CELLS, DEFAULT_PACK_ID, DEFAULT_CELL_COUNT
+from pack_model import PackSample
+from time_utils import now_ms
+
+# Replay of recorded samples through the live pipeline.
+#
+# Recordings come from the database (BatteryData), a columnar archive
+# directory (archive.py) or an exported bms_data_*.csv file, always as
+# (timestamps, (n, SAMPLE_COLUMNS) values) batches of one pack. A Prefetcher
+# reads batches on a background thread while the previous ones are replayed,
+# so replay never waits on the disk. A Replayer hands the samples out paced at
+# `speed` times real time (1 or 10) or as fast as they are taken (speed 0,
+# "max"). Paced samples are re-timed to when they are handed out: the
+# recording starts now and its time runs `speed` times faster, so timestamps
+# never run ahead of the clock. At max speed the recorded times are kept.
+#
+# The replay goes wherever live samples go: the 'replay' BMS source
+# (bms_source = replay, see bms_communication.py) serves it through
+# read_data(), the 'replay' acquisition source feeds every sample to storage
+# and alerting, and run as a script it checks a recording against the
+# current alert rules and prints the alerts, e.g. to compare rule changes on
+# real field data:
+#
+#   python replay.py [PATH] [--pack N] [--start ISO] [--end ISO] [--speed 1|10|max]
+
+# Replay speed choices -> multiple of real time (0 = no pacing)
+REPLAY_SPEEDS = {'1x': 1.0, '10x': 10.0, 'max': 0.0}
+DEFAULT_BATCH_SIZE = 5000
+# Batches read ahead of the one being replayed
+PREFETCH_BATCHES = 4
+
+
+def parse_speed(text):
+    """'1x', '10', 'max', ... -> multiple of real time, 0 for max"""
+    text = str(text).strip().lower()
+    if text in REPLAY_SPEEDS:
+        return REPLAY_SPEEDS[text]
+    speed = float(text.rstrip('x'))
+    if speed < 0:
+        raise ValueError(f"Invalid replay speed: {text}")
+    return speed
+
+
+def database_batches(start_ms=None, end_ms=None, pack_id=DEFAULT_PACK_ID, batch_size=DEFAULT_BATCH_SIZE):
+    from database import iter_range
+    return iter_range(start_ms, end_ms, batch_size=batch_size, as_numpy=True, pack_id=pack_id)
+
+
+def archive_batches(path, start_ms=None, end_ms=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Batches of an archive directory; an archive holds one pack"""
+    from archive import load_archive
+
+    columns = load_archive(path, start_ms, end_ms)
+    timestamps = columns['timestamp']
+    for start in range(0, len(timestamps), batch_size):
+        end = start + batch_size
+        values = np.full((len(timestamps[start:end]), len(SAMPLE_COLUMNS)), np.nan)
+        for index, column in enumerate(SAMPLE_COLUMNS):
+            if column in columns:
+                values[:, index] = columns[column][start:end]
+        yield np.array(timestamps[start:end], dtype=np.int64), values
+
+
+def csv_batches(path, start_ms=None, end_ms=None, pack_id=DEFAULT_PACK_ID, batch_size=DEFAULT_BATCH_SIZE):
+    """Batches of one pack from a CSV export; files without a pack_id column are pack 1"""
+    from csv_importer import read_csv_rows
+
+    for rows in read_csv_rows(path, batch_size):
+        rows = [row for row in rows if row[1] == pack_id
+                and (start_ms is None or row[0] >= start_ms) and (end_ms is None or row[0] < end_ms)]
+        if not rows:
+            continue
+        timestamps = np.array([row[0] for row in rows], dtype=np.int64)
+        # None (empty fields) becomes NaN
+        values = np.array([row[2:] for row in rows], dtype=np.float64)
+        if np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+        yield timestamps, values
+
+
+def open_batches(path=None, start_ms=None, end_ms=None, pack_id=DEFAULT_PACK_ID, batch_size=DEFAULT_BATCH_SIZE):
+    """Batches from the database (no path), an archive directory or a CSV file"""
+    if not path:
+        return database_batches(start_ms, end_ms, pack_id, batch_size)
+    if os.path.isdir(path):
+        return archive_batches(path, start_ms, end_ms, batch_size)
+    if path.lower().endswith('.csv'):
+        return csv_batches(path, start_ms, end_ms, pack_id, batch_size)
+    raise ValueError(f"Don't know how to replay {path}: expected an archive directory or a .csv file")
+
+
+class Prefetcher:
+    """Iterate over batches read up to `depth` batches ahead on a background thread"""
+
+    _END = object()
+
+    def __init__(self, batches, depth=PREFETCH_BATCHES):
+        self.batches = batches
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="ReplayPrefetch")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.queue.get()
+        if item is self._END:
+            # Further calls keep ending
+            self.queue.put(self._END)
+            if self.error:
+                raise self.error
+            raise StopIteration
+        return item
+
+    def close(self):
+        self._stop.set()
+        # Unblock the reader if it waits for room
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.thread.join(timeout=2.0)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for batch in self.batches:
+                if not len(batch[0]):
+                    continue
+                if not self._put(batch):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            close = getattr(self.batches, 'close', None)
+            if close:
+                # Releases the reader connection of a database replay
+                close()
+            self._put(self._END)
+
+
+class Replayer:
+    """Hand out recorded batches paced at `speed` times real time (0 = max), re-timed to when they are due"""
+
+    def __init__(self, batches, speed=1.0, retime=True, prefetch=PREFETCH_BATCHES):
+        self.batches = Prefetcher(batches, prefetch)
+        self.speed = speed
+        self.retime = retime
+        self.samples = 0
+        self.finished = False
+
+        self._timestamps = None
+        self._values = None
+        self._due = None
+        self._position = 0
+        self._first_ms = None
+        self._started_ms = None
+        self._started = None
+        self.cell_count = DEFAULT_CELL_COUNT
+
+    def _load(self):
+        """Make sure a batch with samples left is loaded; False once the recording has ended"""
+        if self._timestamps is not None and self._position < len(self._timestamps):
+            return True
+        batch = next(self.batches, None)
+        if batch is None:
+            self.finished = True
+            return False
+        self._timestamps, self._values = batch
+        self._position = 0
+        if self._first_ms is None:
+            self._first_ms = int(self._timestamps[0])
+            self._started_ms = now_ms()
+            self._started = time.monotonic()
+        if self.speed:
+            self._due = self._started + (self._timestamps - self._first_ms) / self.speed / 1000
+        # Cells the recording has: up to the last one with any reading in the batch
+        used = np.flatnonzero(~np.isnan(self._values[:, :MAX_CELLS]).all(axis=0))
+        if len(used):
+            self.cell_count = int(used[-1]) + 1
+        return True
+
+    def _retimed(self, timestamps):
+        """Recorded epoch-ms timestamps (int or array) -> the wall-clock time they are due"""
+        if not self.retime or not self.speed:
+            return timestamps
+        return self._started_ms + (timestamps - self._first_ms) // self.speed
+
+    def wait(self):
+        """Seconds until the next sample is due (0 if it is due or at max speed), None once finished"""
+        if not self._load():
+            return None
+        if not self.speed:
+            return 0.0
+        return max(self._due[self._position] - time.monotonic(), 0.0)
+
+    def take(self):
+        """Every sample due now, at least one, as (timestamps, values); None once finished.
+
+        At max speed that is the rest of the current batch.
+        """
+        if not self._load():
+            return None
+        start = self._position
+        if self.speed:
+            end = max(int(np.searchsorted(self._due, time.monotonic(), side='right')), start + 1)
+        else:
+            end = len(self._timestamps)
+        self._position = end
+        self.samples += end - start
+        return self._retimed(self._timestamps[start:end]).astype(np.int64), self._values[start:end]
+
+    def read_data(self, into=None):
+        """The next sample as a PackSample if it is due, else None; samples come in order, none is skipped"""
+        wait = self.wait()
+        if wait is None or wait > 0:
+            return None
+        row = self._values[self._position]
+        sample = into if into is not None else PackSample(cell_count=self.cell_count)
+        sample.timestamp = int(self._retimed(int(self._timestamps[self._position])))
+        sample.set_cells(row[:self.cell_count])
+        sample.temperature = float(row[MAX_CELLS])
+        sample.state_of_charge = float(row[MAX_CELLS + 1])
+        self._position += 1
+        self.samples += 1
+        return sample
+
+    def __iter__(self):
+        """Blocking iteration over (timestamps, values) slices, sleeping between them as paced"""
+        while True:
+            wait = self.wait()
+            if wait is None:
+                return
+            if wait:
+                time.sleep(wait)
+            yield self.take()
+
+    def close(self):
+        self.batches.close()
+
+
+def check_alerts(path=None, pack_id=DEFAULT_PACK_ID, start_ms=None, end_ms=None, speed=0.0):
+    """Replay a recording through the alert rules from Configuration; returns (samples, AlertEvents)"""
+    from alerts import AlertEngine
+    from rules import RuleSet
+
+    # Evaluated right here rather than on the engine thread, so nothing is dropped at max speed
+    # Rules of this pack, including its pack<N>_ overrides
+    engine = AlertEngine(RuleSet.from_configuration(pack_ids=[pack_id]))
+    replayer = Replayer(open_batches(path, start_ms, end_ms, pack_id), speed, retime=False)
+    pack = engine.rules.pack_index[pack_id]
+    events = []
+    try:
+        for timestamps, values in replayer:
+            events.extend(engine.evaluate(timestamps, values, np.full(len(timestamps), pack, dtype=np.intp)))
+    finally:
+        replayer.close()
+    return replayer.samples, events
+
+
+def main():
+    from time_utils import to_epoch_ms
+
+    parser = argparse.ArgumentParser(description="Replay recorded BMS samples through the alert rules")
+    parser.add_argument('path', nargs='?', default=None,
+                        help="Archive directory or bms_data_*.csv file (default: the database)")
+    parser.add_argument('--pack', type=int, default=DEFAULT_PACK_ID)
+    parser.add_argument('--start', default=None, help="ISO time of the first sample")
+    parser.add_argument('--end', default=None, help="ISO time to stop at")
+    parser.add_argument('--speed', default='max', help="1x, 10x, max or any multiple of real time")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    samples, events = check_alerts(
+        args.path, args.pack,
+        to_epoch_ms(args.start) if args.start else None,
+        to_epoch_ms(args.end) if args.end else None,
+        parse_speed(args.speed))
+    for event in events:
+        print(f"Alert {event.kind}: {event.describe()}")
+    elapsed = time.perf_counter() - started
+    opened = sum(1 for event in events if event.kind == 'open')
+    print(f"Replayed {samples} samples in {elapsed:.1f} s, {opened} alerts opened")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+from db_connection import get_connection_manager
+from database_schema import SAMPLE_COLUMNS, DEFAULT_PACK_ID, ROLLUP_RESOLUTIONS, rollup_table
+
+# Rollups are maintained by the same transaction that inserts the raw rows, so
+# the rollup tables never disagree with the raw data. SQLite does the grouping:
+# only the rows just inserted into a partition (id > last id before the insert)
+# are aggregated per pack and bucket and merged into existing buckets with an
+# UPSERT. Columns a pack doesn't have stay NULL; the merge keeps whichever
+# side is not NULL, since SQLite's two-argument MIN/MAX return NULL otherwise.
+
+_STAT_COLUMNS = ', '.join(f'{col}_min, {col}_max, {col}_sum' for col in SAMPLE_COLUMNS)
+
+_MERGE = 'sample_count = sample_count + excluded.sample_count,\n        ' + ',\n        '.join(
+    f'{col}_min = COALESCE(MIN({col}_min, excluded.{col}_min), {col}_min, excluded.{col}_min), '
+    f'{col}_max = COALESCE(MAX({col}_max, excluded.{col}_max), {col}_max, excluded.{col}_max), '
+    f'{col}_sum = COALESCE({col}_sum + excluded.{col}_sum, {col}_sum, excluded.{col}_sum)'
+    for col in SAMPLE_COLUMNS
+)
+
+def _upsert_sql(resolution, bucket_ms, table):
+    aggregates = ', '.join(f'MIN({col}), MAX({col}), SUM({col})' for col in SAMPLE_COLUMNS)
+    # "WHERE true" is needed so SQLite doesn't parse ON CONFLICT as a join constraint
+    return f'''
+    INSERT INTO {rollup_table(resolution)} (pack_id, bucket, sample_count, {_STAT_COLUMNS})
+    SELECT pack_id, (timestamp / {bucket_ms}) * {bucket_ms} AS bucket, COUNT(*), {aggregates}
+    FROM {table}
+    WHERE id > ? AND true
+    GROUP BY pack_id, bucket
+    ON CONFLICT(pack_id, bucket) DO UPDATE SET
+        {_MERGE}
+    '''
+
+def _upsert_values_sql(resolution):
+    placeholders = ', '.join('?' for _ in range(3 + 3 * len(SAMPLE_COLUMNS)))
+    return f'''
+    INSERT INTO {rollup_table(resolution)} (pack_id, bucket, sample_count, {_STAT_COLUMNS})
+    VALUES ({placeholders})
+    ON CONFLICT(pack_id, bucket) DO UPDATE SET
+        {_MERGE}
+    '''
+
+def last_row_id(conn, table):
+    """Highest id in a raw data table; pass it to update_rollups after inserting new rows"""
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+
+def update_rollups(conn, table, after_id):
+    """Fold every row of table with id > after_id into all rollup tables"""
+    for resolution, bucket_ms in ROLLUP_RESOLUTIONS:
+        conn.execute(_upsert_sql(resolution, bucket_ms, table), (after_id,))
+
+def update_rollups_from_rows(conn, rows):
+    """Fold (timestamp_ms, pack_id, *SAMPLE_COLUMNS) rows into the rollups when they aren't stored as table rows"""
+    import numpy as np
+
+    timestamps = np.array([row[0] for row in rows], dtype=np.int64)
+    packs = np.array([row[1] for row in rows], dtype=np.int64)
+    # Missing values (None) become NaN, and the NaN-ignoring reductions below skip them
+    values = np.array([row[2:] for row in rows], dtype=np.float64)
+    present = ~np.isnan(values)
+    zeroed = np.where(present, values, 0.0)
+    for resolution, bucket_ms in ROLLUP_RESOLUTIONS:
+        buckets = (timestamps // bucket_ms) * bucket_ms
+        order = np.lexsort((buckets, packs))
+        keys, buckets = packs[order], buckets[order]
+
+        # Start index of every run of equal (pack, bucket), then reduce each run
+        starts = np.flatnonzero(np.r_[True, (buckets[1:] != buckets[:-1]) | (keys[1:] != keys[:-1])])
+        counts = np.diff(np.r_[starts, len(buckets)])
+        sums = np.add.reduceat(zeroed[order], starts, axis=0)
+        sums[~np.logical_or.reduceat(present[order], starts, axis=0)] = np.nan
+        stats = np.stack([
+            np.fmin.reduceat(values[order], starts, axis=0),
+            np.fmax.reduceat(values[order], starts, axis=0),
+            sums,
+        ], axis=2).reshape(len(starts), -1)
+
+        # NaN is stored as NULL
+        params = [(pack, bucket, count, *row) for pack, bucket, count, row
+                  in zip(keys[starts].tolist(), buckets[starts].tolist(), counts.tolist(), stats.tolist())]
+        conn.executemany(_upsert_values_sql(resolution), params)
+
+def clear_rollups(conn):
+    for resolution, _ in ROLLUP_RESOLUTIONS:
+        conn.execute(f'DELETE FROM {rollup_table(resolution)}')
+
+def rebuild_rollups(conn, tables=None):
+    """Recompute all rollups from scratch (used by migrations and bulk imports)"""
+    if tables is None:
+        from partitions import list_partitions
+        tables = [table for _, table in list_partitions(conn)]
+    clear_rollups(conn)
+    for table in tables:
+        update_rollups(conn, table, 0)
+
+def choose_resolution(start_ms, end_ms, max_points):
+    """Pick the finest rollup resolution that keeps the window within max_points buckets"""
+    span = max(end_ms - start_ms, 1)
+    for resolution, bucket_ms in ROLLUP_RESOLUTIONS:
+        if span / bucket_ms <= max_points:
+            return resolution
+    # Even the coarsest rollup is over budget, it's still the cheapest option
+    return ROLLUP_RESOLUTIONS[-1][0]
+
+def get_rollup_data(start_ms, end_ms, max_points=2000, resolution=None, pack_id=DEFAULT_PACK_ID,
+                    columns=None):
+    """Return (resolution, rows) of one pack for [start_ms, end_ms).
+
+    Each row is (bucket, sample_count, then min, max, mean for every column in
+    columns, by default SAMPLE_COLUMNS). The resolution is chosen from the
+    point budget unless given.
+    """
+    if resolution is None:
+        resolution = choose_resolution(start_ms, end_ms, max_points)
+    bucket_ms = dict(ROLLUP_RESOLUTIONS)[resolution]
+
+    if columns is None:
+        columns = SAMPLE_COLUMNS
+    select = ', '.join(['bucket', 'sample_count'] + [
+        f'{col}_min, {col}_max, {col}_sum / sample_count' for col in columns
+    ])
+    try:
+        with get_connection_manager().reader() as conn:
+            cursor = conn.execute(f'''
+            SELECT {select}
+            FROM {rollup_table(resolution)}
+            WHERE pack_id = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+            ''', (pack_id, (start_ms // bucket_ms) * bucket_ms, end_ms))
+            return resolution, cursor.fetchall()
+    except Exception as e:
+        print(f"Error getting rollup data: {str(e)}")
+        return resolution, []
+
+def rollup_columns(columns=None):
+    """Column names matching the rows returned by get_rollup_data"""
+    names = ['bucket', 'sample_count']
+    for col in SAMPLE_COLUMNS if columns is None else columns:
+        names += [f'{col}_min', f'{col}_max', f'{col}_mean']
+    return names
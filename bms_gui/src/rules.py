@@ -0,0 +1,194 @@
+import numpy as np
+
+from database_schema import SAMPLE_COLUMNS
+
+# Threshold rules compiled into NumPy arrays.
+#
+# Limits come from Configuration:
+#   <name>_warning_threshold    upper limit, e.g. cell1_warning_threshold
+#   <name>_low_threshold        lower limit, e.g. state_of_charge_low_threshold
+#   <name>_hysteresis           how far back a value must go before an alert clears
+#   alert_min_duration_ms       how long a limit must be exceeded (or cleared) before it counts
+# where <name> is the sample column without the _voltage suffix. Cells without
+# limits of their own use the ones named just cell, e.g. cell_warning_threshold.
+# Any of them can be overridden per pack with a pack<id>_ prefix, e.g.
+# pack2_cell1_warning_threshold. NaN is no reading: cells a pack doesn't have
+# and readings that dropped out neither exceed a limit nor clear an alert,
+# and they restart any debounce in progress.
+#
+# Every (pack, column, direction) is one slot of a (packs, 2 * columns)
+# array. Lower limits are stored negated, so "value > limit" checks both
+# directions and a batch of samples from any mix of packs is checked in a
+# single comparison. Only packs that are in alert or exceeded a limit in the
+# batch go through the per-sample debounce.
+
+DEFAULT_MIN_DURATION_MS = 2000
+DEFAULT_HYSTERESIS = {'temperature': 1.0}
+DEFAULT_VOLTAGE_HYSTERESIS = 0.1
+
+
+def limit_name(column):
+    return column[:-len('_voltage')] if column.endswith('_voltage') else column
+
+
+class AlertRule:
+    def __init__(self, name, column, threshold, hysteresis=0.0, min_duration_ms=DEFAULT_MIN_DURATION_MS,
+                 above=True, severity='warning', message=None, pack_id=None):
+        if column not in SAMPLE_COLUMNS:
+            raise ValueError(f"Unknown column: {column}")
+        self.name = name
+        self.column = column
+        self.threshold = threshold
+        self.clear_threshold = threshold - hysteresis if above else threshold + hysteresis
+        self.min_duration_ms = min_duration_ms
+        self.above = above
+        self.severity = severity
+        self.message = message or name
+        self.pack_id = pack_id
+
+
+class RuleSet:
+    def __init__(self, upper, lower, hysteresis, min_duration_ms, pack_ids=(1,), columns=None):
+        """upper, lower and hysteresis are (packs, columns) arrays; inf/-inf disables a limit"""
+        self.columns = list(columns or SAMPLE_COLUMNS)
+        self.pack_ids = list(pack_ids)
+        self.pack_index = {pack_id: i for i, pack_id in enumerate(self.pack_ids)}
+        packs = len(self.pack_ids)
+        shape = (packs, len(self.columns))
+
+        upper = np.broadcast_to(np.asarray(upper, dtype=np.float64), shape)
+        lower = np.broadcast_to(np.asarray(lower, dtype=np.float64), shape)
+        hysteresis = np.broadcast_to(np.asarray(hysteresis, dtype=np.float64), shape)
+
+        # Slots: upper limits first, then the negated lower limits
+        self.threshold = np.concatenate([upper, -lower], axis=1)
+        self.clear_threshold = self.threshold - np.concatenate([hysteresis, hysteresis], axis=1)
+        self.min_duration_ms = np.broadcast_to(
+            np.asarray(min_duration_ms, dtype=np.int64), self.threshold.shape).copy()
+
+        self.active = np.zeros(self.threshold.shape, dtype=bool)
+        self.since = np.full(self.threshold.shape, -1, dtype=np.int64)
+        self.peak = np.full(self.threshold.shape, -np.inf)
+        self._rules = {}
+
+    @classmethod
+    def from_configuration(cls, config=None, pack_ids=(1,)):
+        if config is None:
+            from database import get_configuration
+            config = get_configuration()
+
+        def setting(pack_id, key, default, names=None):
+            # The first of names that has the key set, e.g. cell7 then cell
+            value = None
+            for name in names or ['']:
+                full_key = f'{name}_{key}' if name else key
+                value = config.get(f'pack{pack_id}_{full_key}', config.get(full_key))
+                if value is not None:
+                    break
+            try:
+                return float(value) if value is not None else default
+            except ValueError:
+                return default
+
+        shape = (len(pack_ids), len(SAMPLE_COLUMNS))
+        upper, lower, hysteresis = np.full(shape, np.inf), np.full(shape, -np.inf), np.zeros(shape)
+        min_duration = np.zeros(shape, dtype=np.int64)
+        for p, pack_id in enumerate(pack_ids):
+            for c, column in enumerate(SAMPLE_COLUMNS):
+                name = limit_name(column)
+                names = [name, 'cell'] if column.endswith('_voltage') else [name]
+                default_hysteresis = DEFAULT_HYSTERESIS.get(
+                    name, DEFAULT_VOLTAGE_HYSTERESIS if column.endswith('_voltage') else 0.0)
+                upper[p, c] = setting(pack_id, 'warning_threshold', np.inf, names)
+                lower[p, c] = setting(pack_id, 'low_threshold', -np.inf, names)
+                hysteresis[p, c] = setting(pack_id, 'hysteresis', default_hysteresis, names)
+                min_duration[p, c] = setting(pack_id, 'alert_min_duration_ms', DEFAULT_MIN_DURATION_MS)
+        return cls(upper, lower, hysteresis, np.concatenate([min_duration, min_duration], axis=1),
+                   pack_ids=pack_ids)
+
+    def limit(self, column, pack_id=None, above=True):
+        """Configured limit of a column (inf/-inf if none)"""
+        p = self.pack_index[pack_id] if pack_id is not None else 0
+        c = self.columns.index(column)
+        return float(self.threshold[p, c] if above else -self.threshold[p, c + len(self.columns)])
+
+    def rule(self, p, slot):
+        """AlertRule describing one slot, built on first use"""
+        key = (p, slot)
+        if key not in self._rules:
+            columns = len(self.columns)
+            above = slot < columns
+            column = self.columns[slot % columns]
+            name = limit_name(column)
+            threshold = self.threshold[p, slot] if above else -self.threshold[p, slot]
+            hysteresis = self.threshold[p, slot] - self.clear_threshold[p, slot]
+
+            label = name.replace('_', ' ').capitalize()
+            if column.endswith('_voltage'):
+                label = f"{label.replace('Cell', 'Cell ')} {'high' if above else 'low'} voltage"
+            else:
+                label = f"{'High' if above else 'Low'} {label.lower()}"
+            pack_id = self.pack_ids[p]
+            prefix = f'pack{pack_id}_' if len(self.pack_ids) > 1 else ''
+            if prefix:
+                label = f"Pack {pack_id}: {label}"
+
+            self._rules[key] = AlertRule(
+                f"{prefix}{name}_{'high' if above else 'low'}", column, float(threshold),
+                hysteresis=float(hysteresis), min_duration_ms=int(self.min_duration_ms[p, slot]),
+                above=above, severity='critical' if column == 'temperature' and above else 'warning',
+                message=label, pack_id=pack_id)
+        return self._rules[key]
+
+    def active_rules(self):
+        return [self.rule(p, slot) for p, slot in zip(*np.nonzero(self.active))]
+
+    def evaluate(self, timestamps, values, packs=None):
+        """Check a batch of samples, in time order per pack.
+
+        timestamps is (n,), values (n, columns) and packs the (n,) pack index
+        of each row (all pack 0 if omitted). Returns the transitions as
+        (kind, pack index, slot, timestamp, value) with kind 'open' or 'close'.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(timestamps), len(self.columns))
+        packs = np.zeros(len(timestamps), dtype=np.intp) if packs is None else np.asarray(packs, dtype=np.intp)
+
+        # One pass over the whole batch
+        signed = np.concatenate([values, -values], axis=1)
+        breached_rows = (signed > self.threshold[packs]).any(axis=1)
+
+        candidate = self.active.any(axis=1)
+        candidate[packs[breached_rows]] = True
+        # Packs with nothing going on: any half-finished debounce is over
+        quiet = np.zeros(len(self.pack_ids), dtype=bool)
+        quiet[packs] = True
+        quiet &= ~candidate
+        self.since[quiet] = -1
+        if not candidate.any():
+            return []
+
+        events = []
+        for row in np.nonzero(candidate[packs])[0]:
+            p = packs[row]
+            timestamp = timestamps[row]
+            value = signed[row]
+            active, since = self.active[p], self.since[p]
+
+            # Inactive slots wait for a breach, active ones for the clear threshold; NaN is neither
+            condition = np.where(active, value <= self.clear_threshold[p], value > self.threshold[p])
+            condition &= ~np.isnan(value)
+            starting = condition & (since < 0)
+            self.peak[p] = np.where(starting & ~active, value,
+                                    np.where(active | condition, np.fmax(self.peak[p], value), self.peak[p]))
+            since = np.where(condition, np.where(since < 0, timestamp, since), -1)
+            fire = condition & (timestamp - since >= self.min_duration_ms[p])
+
+            for slot in np.nonzero(fire)[0]:
+                kind = 'close' if active[slot] else 'open'
+                peak = self.peak[p, slot] if slot < len(self.columns) else -self.peak[p, slot]
+                events.append((kind, p, slot, int(since[slot]), float(peak)))
+            self.active[p] = active ^ fire
+            since[fire] = -1
+            self.since[p] = since
+        return events
@@ -0,0 +1,118 @@
+import threading
+
+import numpy as np
+
+from database_schema import SAMPLE_COLUMNS, DEFAULT_PACK_ID
+from time_utils import now_ms
+
+# Fixed-capacity in-memory history of recent samples of one pack for the
+# live graphs, holding only the columns the graphs show.
+#
+# Every sample is written twice, at slot i and i + capacity, so the newest n
+# samples always form one contiguous slice of the backing arrays. Reading a
+# window is then a binary search plus slicing: the arrays handed to the plots
+# are views, nothing is copied and nothing depends on how much history the
+# database holds. Only windows reaching further back than the buffer go to
+# the database.
+
+DEFAULT_CAPACITY = 65536
+
+
+class SampleBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY, columns=None, pack_id=DEFAULT_PACK_ID):
+        self.capacity = capacity
+        self.columns = list(columns or SAMPLE_COLUMNS)
+        self.pack_id = pack_id
+        self.lock = threading.Lock()
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.zeros((2 * capacity, len(self.columns)), dtype=np.float64)
+        self._next = 0        # slot the next sample goes to
+        self._count = 0
+        # Everything stored from this timestamp on is in the buffer
+        self._complete_from = None
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp_ms, values):
+        """Add one sample; values are in column order"""
+        with self.lock:
+            slot = self._next
+            self._timestamps[slot] = self._timestamps[slot + self.capacity] = timestamp_ms
+            self._values[slot] = self._values[slot + self.capacity] = values
+            self._next = (slot + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+            else:
+                # Overwrote the oldest sample
+                self._complete_from = int(self._timestamps[self._end() - self._count])
+            if self._complete_from is None:
+                self._complete_from = int(timestamp_ms)
+
+    def extend(self, timestamps, values):
+        """Add samples in time order from arrays (n,) and (n, columns)"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)[-self.capacity:]
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.columns))[-self.capacity:]
+        count = len(timestamps)
+        if not count:
+            return
+        with self.lock:
+            slots = (self._next + np.arange(count)) % self.capacity
+            self._timestamps[slots] = self._timestamps[slots + self.capacity] = timestamps
+            self._values[slots] = self._values[slots + self.capacity] = values
+            self._next = (self._next + count) % self.capacity
+            evicted = self._count + count > self.capacity
+            self._count = min(self._count + count, self.capacity)
+            if evicted:
+                self._complete_from = int(self._timestamps[self._end() - self._count])
+            elif self._complete_from is None:
+                self._complete_from = int(timestamps[0])
+
+    def preload(self, seconds):
+        """Fill the buffer from the database with the last `seconds` of samples"""
+        from database import iter_range
+
+        start = now_ms() - int(seconds * 1000)
+        self.clear()
+        for timestamps, values in iter_range(start, columns=self.columns, as_numpy=True, pack_id=self.pack_id):
+            self.extend(timestamps, values)
+        with self.lock:
+            if self._count < self.capacity:
+                self._complete_from = start
+
+    def clear(self):
+        with self.lock:
+            self._next = 0
+            self._count = 0
+            self._complete_from = None
+
+    def _end(self):
+        # Backing index one past the newest sample
+        return self._next + self.capacity
+
+    def view(self, start_ms=None):
+        """Return (timestamps, values) views of the buffered samples from start_ms on"""
+        with self.lock:
+            end = self._end()
+            begin = end - self._count
+            timestamps = self._timestamps[begin:end]
+            if start_ms is not None:
+                begin += int(np.searchsorted(timestamps, start_ms, side='left'))
+            return self._timestamps[begin:end], self._values[begin:end]
+
+    def window(self, seconds):
+        """Samples from the last `seconds`, reading the database only for the part before the buffer"""
+        start = now_ms() - int(seconds * 1000)
+        timestamps, values = self.view(start)
+        complete_from = self._complete_from
+        if complete_from is None or start >= complete_from:
+            return timestamps, values
+
+        from database import iter_range
+
+        older = list(iter_range(start, complete_from, columns=self.columns, as_numpy=True,
+                                pack_id=self.pack_id))
+        if not older:
+            return timestamps, values
+        return (np.concatenate([batch[0] for batch in older] + [timestamps]),
+                np.concatenate([batch[1] for batch in older] + [values]))
@@ -0,0 +1,125 @@
+import heapq
+import logging
+import threading
+import time
+
+# Deadline-based sampling of sensors, each at its own rate.
+#
+# Every task has a period and the absolute time of its next read. The
+# scheduler runs whichever task is due first and sleeps until the next
+# deadline. Deadlines move on by whole periods from the original schedule,
+# so timing errors don't accumulate; if a read finishes after its next
+# deadline has already passed, the deadlines it overran are counted as
+# missed and skipped rather than run back to back. Sensors that can block
+# for long (the DHT22 retries internally) are marked isolated and get their
+# own thread, so they never delay the others.
+
+
+class SensorTask:
+    def __init__(self, name, rate_hz, read, isolated=False):
+        if rate_hz <= 0:
+            raise ValueError(f"Invalid rate for {name}: {rate_hz}")
+        self.name = name
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.read = read
+        self.isolated = isolated
+        self.deadline = 0.0
+
+        # Statistics; latency is the duration of a read, jitter how late it started
+        self.reads = 0
+        self.errors = 0
+        self.missed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+
+    def run(self):
+        started = time.monotonic()
+        jitter = max(started - self.deadline, 0.0)
+        try:
+            self.read()
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"{self.name} read failed: {str(e)}")
+        finished = time.monotonic()
+
+        latency = finished - started
+        self.reads += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.jitter_total += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+
+        self.deadline += self.period
+        if finished > self.deadline:
+            overrun = int((finished - self.deadline) / self.period) + 1
+            self.missed += overrun
+            self.deadline += overrun * self.period
+
+    def stats(self):
+        reads = max(self.reads, 1)
+        return {
+            'rate_hz': self.rate_hz,
+            'reads': self.reads,
+            'errors': self.errors,
+            'missed': self.missed,
+            'latency_ms': self.latency_total / reads * 1000,
+            'latency_max_ms': self.latency_max * 1000,
+            'jitter_ms': self.jitter_total / reads * 1000,
+            'jitter_max_ms': self.jitter_max * 1000,
+        }
+
+
+class SensorScheduler:
+    def __init__(self):
+        self.tasks = []
+        self.stop_event = threading.Event()
+
+    def add(self, name, rate_hz, read, isolated=False):
+        task = SensorTask(name, rate_hz, read, isolated)
+        self.tasks.append(task)
+        return task
+
+    def run(self):
+        """Run until stop() is called: shared tasks on this thread, isolated ones on their own"""
+        self.stop_event.clear()
+        now = time.monotonic()
+        for task in self.tasks:
+            task.deadline = now
+
+        threads = []
+        for task in self.tasks:
+            if task.isolated:
+                thread = threading.Thread(target=self._loop, args=([task],), name=f"Sensor-{task.name}")
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        try:
+            self._loop([task for task in self.tasks if not task.isolated])
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join(timeout=2.0)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        return {task.name: task.stats() for task in self.tasks}
+
+    def _loop(self, tasks):
+        if not tasks:
+            self.stop_event.wait()
+            return
+        # Earliest deadline first; the index breaks ties without comparing tasks
+        queue = [(task.deadline, i, task) for i, task in enumerate(tasks)]
+        heapq.heapify(queue)
+        while not self.stop_event.is_set():
+            deadline, i, task = queue[0]
+            delay = deadline - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            task.run()
+            heapq.heapreplace(queue, (task.deadline, i, task))
@@ -0,0 +1,175 @@
+import binascii
+import struct
+
+import numpy as np
+
+# Framed binary protocol for external BMS boards on a serial line.
+#
+# Frame:   SYNC (AA 55) | length (uint16 LE) | payload | CRC (uint16 LE)
+# The CRC is CRC-16/CCITT (binascii.crc_hqx, initial value 0xFFFF) over
+# the length field and the payload.
+#
+# Sample payload, all little endian:
+#   type (uint8, 0x01) | cell count (uint8) | current (float32, A) |
+#   temperature (float32, °C) | state of charge (float32, %) | cell voltages (float32 each, V)
+#
+# FrameDecoder takes whatever bytes the port returned, however they are
+# split, and returns the complete payloads. Searching for the sync word and
+# checking the CRC run in C, so the cost is per frame, not per byte. After a
+# corrupt frame the decoder resynchronizes on the next sync word, and intact
+# sample frames without cells are counted and dropped.
+# decode_samples() turns a batch of sample payloads into NumPy arrays in one
+# frombuffer call per run of samples with the same cell count.
+
+SYNC = b'\xaa\x55'
+LENGTH = struct.Struct('<H')
+CRC = struct.Struct('<H')
+HEADER_SIZE = len(SYNC) + LENGTH.size
+CRC_INIT = 0xFFFF
+# Longer length fields can only come from a corrupt header
+MAX_PAYLOAD = 1024
+
+MSG_SAMPLE = 0x01
+SAMPLE_HEADER = struct.Struct('<BBfff')
+
+
+def encode_frame(payload):
+    length = LENGTH.pack(len(payload))
+    return SYNC + length + payload + CRC.pack(binascii.crc_hqx(length + payload, CRC_INIT))
+
+
+def encode_sample(cell_voltages, temperature, state_of_charge, current=0.0):
+    payload = SAMPLE_HEADER.pack(MSG_SAMPLE, len(cell_voltages), current, temperature, state_of_charge)
+    return encode_frame(payload + struct.pack(f'<{len(cell_voltages)}f', *cell_voltages))
+
+
+def sample_dtype(cell_count):
+    return np.dtype([
+        ('type', 'u1'), ('cell_count', 'u1'),
+        ('current', '<f4'), ('temperature', '<f4'), ('state_of_charge', '<f4'),
+        ('cells', '<f4', (cell_count,)),
+    ])
+
+
+def _sample_cell_count(payload):
+    """Cell count of a well-formed sample payload, else None"""
+    if len(payload) < SAMPLE_HEADER.size or payload[0] != MSG_SAMPLE:
+        return None
+    cell_count = payload[1]
+    if not cell_count or len(payload) != SAMPLE_HEADER.size + 4 * cell_count:
+        return None
+    return cell_count
+
+
+def decode_samples(payloads):
+    """Decode sample payloads; returns one structured array per run of samples with the same cell count.
+
+    The runs are in arrival order, so the samples come back in the order they
+    were sent. Payloads that are not samples, that have no cells or whose
+    length does not match their cell count are skipped.
+    """
+    runs = []
+    for payload in payloads:
+        cell_count = _sample_cell_count(payload)
+        if cell_count is None:
+            continue
+        if runs and runs[-1][0] == cell_count:
+            runs[-1][1].append(payload)
+        else:
+            runs.append((cell_count, [payload]))
+    return [np.frombuffer(b''.join(group), dtype=sample_dtype(cell_count)) for cell_count, group in runs]
+
+
+class ReceiptClock:
+    """Timestamps for frames, which carry no time of their own.
+
+    The samples decoded from one read arrived since the previous read, so
+    they are spread evenly over that interval with the last one at the
+    receipt time. Up to one sample per millisecond every sample gets its own
+    timestamp, which keeps them apart when stored and deduplicated on
+    (timestamp, pack).
+    """
+
+    def __init__(self, first_period_ms=1.0):
+        # Spacing for the very first read, which has no previous one
+        self.first_period_ms = first_period_ms
+        self.last_ms = None
+
+    def stamp(self, received_ms, count):
+        """int64 timestamps of count samples received together at received_ms, oldest first"""
+        if self.last_ms is None:
+            period_ms = self.first_period_ms
+        else:
+            period_ms = max(received_ms - self.last_ms, 0) / count
+        self.last_ms = received_ms
+        return received_ms - np.round(np.arange(count - 1, -1, -1) * period_ms).astype(np.int64)
+
+
+class FrameDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+
+        # Statistics
+        self.frames = 0
+        self.crc_errors = 0
+        self.length_errors = 0
+        self.bad_samples = 0
+        self.bytes_discarded = 0
+
+    def feed(self, data):
+        """Add received bytes; returns the payloads of all frames completed by them"""
+        buffer = self.buffer
+        buffer += data
+        payloads = []
+        pos = 0
+        while True:
+            start = buffer.find(SYNC, pos)
+            if start < 0:
+                # Keep a trailing first sync byte, its second byte may be in the next read
+                keep = 1 if buffer[-1:] == SYNC[:1] else 0
+                self.bytes_discarded += len(buffer) - pos - keep
+                pos = len(buffer) - keep
+                break
+            self.bytes_discarded += start - pos
+            if len(buffer) - start < HEADER_SIZE:
+                pos = start
+                break
+
+            length, = LENGTH.unpack_from(buffer, start + len(SYNC))
+            if length > MAX_PAYLOAD:
+                # Not a real header; look for the next sync word
+                self.length_errors += 1
+                self.bytes_discarded += 1
+                pos = start + 1
+                continue
+            end = start + HEADER_SIZE + length + CRC.size
+            if len(buffer) < end:
+                pos = start
+                break
+
+            crc, = CRC.unpack_from(buffer, end - CRC.size)
+            if binascii.crc_hqx(buffer[start + len(SYNC):end - CRC.size], CRC_INIT) != crc:
+                self.crc_errors += 1
+                self.bytes_discarded += 1
+                pos = start + 1
+                continue
+            payload = bytes(buffer[start + HEADER_SIZE:end - CRC.size])
+            self.frames += 1
+            pos = end
+            if payload[:1] == bytes([MSG_SAMPLE]) and _sample_cell_count(payload) is None:
+                # Intact frame, but no cells or a length that doesn't match them
+                self.bad_samples += 1
+                continue
+            payloads.append(payload)
+
+        del buffer[:pos]
+        return payloads
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'crc_errors': self.crc_errors,
+            'length_errors': self.length_errors,
+            'bad_samples': self.bad_samples,
+            'bytes_discarded': self.bytes_discarded,
+        }
@@ -0,0 +1,127 @@
+import argparse
+import math
+import os
+import random
+import threading
+import time
+import tty
+
+from serial_protocol import encode_sample
+
+# Simulated external BMS board on a local pseudo-terminal (POSIX only).
+#
+# Streams sample frames in the format of serial_protocol.py to a pty, so the
+# serial driver can be tested without hardware: point com_port at the
+# printed device and set bms_source to 'serial'. corrupt_rate damages that
+# fraction of the frames (flipped bytes or stray garbage) to exercise
+# resynchronization.
+#
+#   python serial_simulator.py [--rate HZ] [--cells N] [--corrupt FRACTION]
+
+CELL_BASES = [12.0, 12.5, 12.8]
+# Frames are written in one batch per tick above this rate
+MAX_TICK_HZ = 100
+# Unsent bytes kept while nobody reads the port
+MAX_PENDING = 64 * 1024
+
+
+class PtySimulator:
+    def __init__(self, rate_hz=100.0, cell_count=3, corrupt_rate=0.0, seed=None):
+        self.rate_hz = rate_hz
+        self.cell_count = cell_count
+        self.corrupt_rate = corrupt_rate
+        self.random = random.Random(seed)
+
+        self.master, self.slave = os.openpty()
+        # Raw mode, so the line discipline doesn't echo or translate anything
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        os.set_blocking(self.master, False)
+
+        self.thread = None
+        self.is_running = False
+        self.frames_sent = 0
+        self.frames_corrupted = 0
+        self.bytes_dropped = 0
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, name="PtySimulator")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def frame(self, n):
+        """Encoded sample number n"""
+        wave = math.sin(n / (10 * self.rate_hz)) * 0.5
+        cells = [CELL_BASES[i % len(CELL_BASES)] + wave + self.random.uniform(-0.1, 0.1)
+                 for i in range(self.cell_count)]
+        temperature = 25.0 + wave + self.random.uniform(-0.5, 0.5)
+        soc = 80.0 + wave * 3 + self.random.uniform(-1, 1)
+        frame = encode_sample(cells, temperature, soc)
+
+        if self.corrupt_rate and self.random.random() < self.corrupt_rate:
+            self.frames_corrupted += 1
+            if self.random.random() < 0.5:
+                damaged = bytearray(frame)
+                damaged[self.random.randrange(len(damaged))] ^= 0xFF
+                frame = bytes(damaged)
+            else:
+                frame = bytes(self.random.randrange(256) for _ in range(self.random.randint(1, 16))) + frame
+        return frame
+
+    def _run(self):
+        tick = 1.0 / min(self.rate_hz, MAX_TICK_HZ)
+        started = time.monotonic()
+        n = 0
+        pending = b''
+        while self.is_running:
+            # Catch up to where the schedule says we should be
+            due = int((time.monotonic() - started) * self.rate_hz)
+            if due > n:
+                pending += b''.join(self.frame(i) for i in range(n, due))
+                self.frames_sent += due - n
+                n = due
+            if pending:
+                try:
+                    pending = pending[os.write(self.master, pending):]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    break
+                if len(pending) > MAX_PENDING:
+                    self.bytes_dropped += len(pending)
+                    pending = b''
+            time.sleep(tick)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated serial BMS on a pseudo-terminal")
+    parser.add_argument('--rate', type=float, default=100.0, help="Frames per second")
+    parser.add_argument('--cells', type=int, default=3)
+    parser.add_argument('--corrupt', type=float, default=0.0, help="Fraction of frames to damage")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = PtySimulator(args.rate, args.cells, args.corrupt, args.seed)
+    simulator.start()
+    print(f"Simulated BMS on {simulator.port} ({args.rate:g} frames/s, {args.cells} cells)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{simulator.frames_sent} frames sent, {simulator.frames_corrupted} corrupted, "
+                  f"{simulator.bytes_dropped} bytes dropped")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import sqlite3
+from db_connection import get_connection_manager
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QLabel, QDialogButtonBox
 
 class SettingsDialog(QDialog):
@@ -42,16 +43,12 @@ class SettingsDialog(QDialog):
 
     def load_settings(self):
         try:
-            conn = sqlite3.connect('database/battery_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT parameter_name, value FROM Configuration')
-            settings = dict(cursor.fetchall())
+            with get_connection_manager().reader() as conn:
+                cursor = conn.execute('SELECT parameter_name, value FROM Configuration')
+                settings = dict(cursor.fetchall())
             
             self.warning_threshold.setText(settings.get('warning_threshold', '11.5'))
             self.critical_threshold.setText(settings.get('critical_threshold', '12.0'))
             self.update_interval.setText(settings.get('update_interval', '1'))
-            
-            conn.close()
         except sqlite3.Error as e:
             print(f"Error loading settings: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,277 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from database_schema import SAMPLE_COLUMNS, MAX_CELLS, DEFAULT_PACK_ID, DEFAULT_CELL_COUNT
+from time_utils import now_ms
+
+# Seeded battery pack simulator.
+#
+# PackSimulator produces the same waveform the simulated BMS always did (a
+# slow sine on every reading plus noise) with faults injected on a random
+# schedule: voltage spikes (which also pull the state of charge down),
+# temperature spikes and sensor dropouts, where readings are NaN for a few
+# samples. Samples are generated vectorized in fixed-size blocks from one
+# numpy Generator, so a seed gives the same stream whether it is consumed a
+# sample at a time in real time (next_sample) or in large batches
+# (take/fast_forward).
+#
+# Run as a script it is a load generator: days of samples for any number of
+# packs are written straight to storage (rollups included) and checked
+# against the alert rules, as fast as they can be produced.
+#
+#   python simulator.py [--days N] [--packs N] [--cells N] [--rate HZ] [--seed N]
+#                       [--dropout-rate FRACTION] [--no-store] [--no-alerts]
+
+# Starting values; cells past the third repeat the pattern
+CELL_BASES = [12.0, 12.5, 12.8]
+TEMPERATURE_BASE = 25.0
+SOC_BASE = 80.0
+# Share of a voltage spike each cell gets, repeating like CELL_BASES
+SPIKE_SHARES = [1.0, 0.8, 0.6]
+SPIKE_SOC_DROP = 5.0
+
+# Samples between faults, fault sizes and fault lengths in samples, as
+# (low, high) ranges. Spikes of a few samples outlast the alert debounce at
+# the default rate, single-sample ones don't, so both paths get exercised.
+VOLTAGE_SPIKE_EVERY = (20, 40)
+VOLTAGE_SPIKE = (1.0, 2.5)
+VOLTAGE_SPIKE_LENGTH = (1, 5)
+TEMPERATURE_SPIKE_EVERY = (30, 60)
+TEMPERATURE_SPIKE = (5.0, 10.0)
+TEMPERATURE_SPIKE_LENGTH = (1, 5)
+DROPOUT_LENGTH = (1, 5)
+
+# Samples generated per block; the stream doesn't depend on how it is consumed
+BLOCK_SIZE = 4096
+DEFAULT_BATCH_SIZE = 50000
+
+
+class PackSimulator:
+    def __init__(self, cell_count=DEFAULT_CELL_COUNT, seed=None, pack_id=DEFAULT_PACK_ID, rate_hz=1.0,
+                 start_ms=None, voltage_spikes=True, temperature_spikes=True, dropout_rate=0.0):
+        """dropout_rate is the fraction of samples that start a sensor dropout"""
+        if not 0 < cell_count <= MAX_CELLS:
+            raise ValueError(f"A pack has 1 to {MAX_CELLS} cells, not {cell_count}")
+        self.cell_count = cell_count
+        self.pack_id = pack_id
+        self.rate_hz = rate_hz
+        self.start_ms = now_ms() if start_ms is None else start_ms
+        self.voltage_spikes = voltage_spikes
+        self.temperature_spikes = temperature_spikes
+        self.dropout_rate = dropout_rate
+        self.rng = np.random.default_rng(seed)
+
+        self.bases = np.array(CELL_BASES)[np.arange(cell_count) % len(CELL_BASES)]
+        self.shares = np.array(SPIKE_SHARES)[np.arange(cell_count) % len(SPIKE_SHARES)]
+        # Index of the next sample to generate and of the next scheduled faults;
+        # the first spikes come early, like they always did
+        self.generated = 0
+        self.next_voltage_spike = int(self.rng.integers(5, 16))
+        self.next_temperature_spike = int(self.rng.integers(5, 16))
+        # Faults that ran past the end of the last block, as (samples left, size)
+        self.voltage_carry = []
+        self.temperature_carry = []
+        self.dropout_carry = []
+
+        # Generated but not yet handed out
+        self._timestamps = np.empty(0, dtype=np.int64)
+        self._values = np.empty((0, len(SAMPLE_COLUMNS)))
+        self._position = 0
+        self.samples = 0
+
+    def _schedule(self, next_index, every, end):
+        """Fault positions in [generated, end) from next_index on; returns (positions, next_index)"""
+        low, high = every
+        count = max((end - next_index) // low + 1, 0)
+        positions = next_index + np.concatenate([[0], np.cumsum(self.rng.integers(low, high + 1, count))])
+        return positions[positions < end], int(positions[positions >= end][0])
+
+    def _lengths(self, lengths, count):
+        return self.rng.integers(lengths[0], lengths[1] + 1, count)
+
+    @staticmethod
+    def _apply_runs(level, starts, lengths, sizes, carry):
+        """Add each size to level over its run of samples; returns the runs continuing past the block"""
+        n = len(level)
+        for left, size in carry:
+            level[:left] += size
+        for start, length, size in zip(starts.tolist(), lengths.tolist(), sizes.tolist()):
+            level[start:start + length] += size
+        return ([(left - n, size) for left, size in carry if left > n]
+                + [(start + length - n, size) for start, length, size
+                   in zip(starts.tolist(), lengths.tolist(), sizes.tolist()) if start + length > n])
+
+    def _block(self):
+        """Generate the next BLOCK_SIZE samples as (timestamps, (n, SAMPLE_COLUMNS) values)"""
+        n = BLOCK_SIZE
+        first = self.generated
+        index = np.arange(first, first + n)
+        self.generated += n
+        rng = self.rng
+
+        wave = np.sin(index / 10) * 0.5
+        values = np.full((n, len(SAMPLE_COLUMNS)), np.nan)
+        cells = values[:, :self.cell_count]
+        cells[:] = self.bases + wave[:, None] + rng.uniform(-0.1, 0.1, (n, self.cell_count))
+        temperature = TEMPERATURE_BASE + wave + rng.uniform(-0.5, 0.5, n)
+        soc = SOC_BASE + wave * 3 + rng.uniform(-1, 1, n)
+
+        # The schedules are always drawn, so switching a fault off doesn't change the rest of the stream
+        spikes, self.next_voltage_spike = self._schedule(self.next_voltage_spike, VOLTAGE_SPIKE_EVERY, first + n)
+        sizes = rng.uniform(*VOLTAGE_SPIKE, len(spikes))
+        lengths = self._lengths(VOLTAGE_SPIKE_LENGTH, len(spikes))
+        if self.voltage_spikes:
+            level = np.zeros(n)
+            self.voltage_carry = self._apply_runs(level, spikes - first, lengths, sizes, self.voltage_carry)
+            cells += level[:, None] * self.shares
+            # High load: the state of charge dips while the voltage spikes
+            soc[level > 0] -= SPIKE_SOC_DROP
+
+        spikes, self.next_temperature_spike = self._schedule(
+            self.next_temperature_spike, TEMPERATURE_SPIKE_EVERY, first + n)
+        sizes = rng.uniform(*TEMPERATURE_SPIKE, len(spikes))
+        lengths = self._lengths(TEMPERATURE_SPIKE_LENGTH, len(spikes))
+        if self.temperature_spikes:
+            self.temperature_carry = self._apply_runs(
+                temperature, spikes - first, lengths, sizes, self.temperature_carry)
+
+        values[:, MAX_CELLS] = temperature
+        values[:, MAX_CELLS + 1] = np.clip(soc, 0, 100)
+
+        # Dropouts: every reading of the pack is missing for a few samples
+        starts = np.flatnonzero(rng.random(n) < self.dropout_rate)
+        lengths = self._lengths(DROPOUT_LENGTH, len(starts))
+        if len(starts) or self.dropout_carry:
+            missing = np.zeros(n)
+            self.dropout_carry = self._apply_runs(missing, starts, lengths, np.ones(len(starts)), self.dropout_carry)
+            values[missing > 0] = np.nan
+
+        timestamps = (self.start_ms + index * 1000.0 / self.rate_hz).astype(np.int64)
+        return timestamps, values
+
+    def take(self, count):
+        """The next `count` samples as (timestamps, (count, SAMPLE_COLUMNS) values)"""
+        timestamps, values = [], []
+        while count > 0:
+            if self._position == len(self._timestamps):
+                self._timestamps, self._values = self._block()
+                self._position = 0
+            end = min(self._position + count, len(self._timestamps))
+            timestamps.append(self._timestamps[self._position:end])
+            values.append(self._values[self._position:end])
+            count -= end - self._position
+            self._position = end
+        if len(timestamps) == 1:
+            timestamps, values = timestamps[0], values[0]
+        elif timestamps:
+            timestamps, values = np.concatenate(timestamps), np.concatenate(values)
+        else:
+            timestamps, values = self._timestamps[:0], self._values[:0]
+        self.samples += len(timestamps)
+        return timestamps, values
+
+    def next_sample(self, sample):
+        """Fill a PackSample with the next sample (its simulated timestamp included) and return it"""
+        if self._position == len(self._timestamps):
+            self._timestamps, self._values = self._block()
+            self._position = 0
+        row = self._values[self._position]
+        sample.timestamp = int(self._timestamps[self._position])
+        self._position += 1
+        self.samples += 1
+        sample.set_cells(row[:self.cell_count])
+        sample.temperature = float(row[MAX_CELLS])
+        sample.state_of_charge = float(row[MAX_CELLS + 1])
+        return sample
+
+    def fast_forward(self, duration_s, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield (timestamps, values) batches covering duration_s of simulated time"""
+        remaining = int(duration_s * self.rate_hz)
+        while remaining > 0:
+            batch = self.take(min(batch_size, remaining))
+            remaining -= len(batch[0])
+            yield batch
+
+
+def load_test(days=1.0, packs=1, cell_count=DEFAULT_CELL_COUNT, rate_hz=1.0, seed=None, dropout_rate=0.0,
+              store=True, alerts=True, batch_size=DEFAULT_BATCH_SIZE):
+    """Write `days` of simulated samples of every pack, ending now; returns a dict of counters and timings"""
+    from database import insert_many, register_pack
+    from rules import RuleSet
+
+    duration_s = days * 24 * 60 * 60
+    start_ms = now_ms() - int(duration_s * 1000)
+    pack_ids = list(range(1, packs + 1))
+    # One seed gives every pack its own, reproducible stream
+    seeds = np.random.SeedSequence(seed).spawn(packs)
+    simulators = [PackSimulator(cell_count, pack_seed, pack_id, rate_hz, start_ms, dropout_rate=dropout_rate)
+                  for pack_id, pack_seed in zip(pack_ids, seeds)]
+    rules = RuleSet.from_configuration(pack_ids=pack_ids) if alerts else None
+    stats = {'samples': 0, 'alerts': 0, 'generate_s': 0.0, 'store_s': 0.0, 'alert_s': 0.0}
+    if store:
+        for pack_id in pack_ids:
+            register_pack(pack_id, cell_count)
+
+    streams = [(simulator.pack_id, simulator.fast_forward(duration_s, batch_size)) for simulator in simulators]
+    started = time.perf_counter()
+    # Round robin over the packs, so storage sees them interleaved in time like live data
+    while streams:
+        for entry in list(streams):
+            pack_id, stream = entry
+            t = time.perf_counter()
+            batch = next(stream, None)
+            stats['generate_s'] += time.perf_counter() - t
+            if batch is None:
+                streams.remove(entry)
+                continue
+            timestamps, values = batch
+            stats['samples'] += len(timestamps)
+
+            if store:
+                t = time.perf_counter()
+                rows = [(timestamp, pack_id, *row) for timestamp, row in zip(timestamps.tolist(), values.tolist())]
+                if not insert_many(rows):
+                    raise RuntimeError("Storing simulated samples failed")
+                stats['store_s'] += time.perf_counter() - t
+            if rules:
+                t = time.perf_counter()
+                packs = np.full(len(timestamps), rules.pack_index[pack_id], dtype=np.intp)
+                events = rules.evaluate(timestamps, values, packs)
+                stats['alerts'] += sum(1 for event in events if event[0] == 'open')
+                stats['alert_s'] += time.perf_counter() - t
+    stats['elapsed_s'] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write simulated BMS samples as fast as possible")
+    parser.add_argument('--days', type=float, default=1.0, help="Simulated time per pack, ending now")
+    parser.add_argument('--packs', type=int, default=1)
+    parser.add_argument('--cells', type=int, default=DEFAULT_CELL_COUNT)
+    parser.add_argument('--rate', type=float, default=1.0, help="Samples per second of simulated time")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--dropout-rate', type=float, default=0.0)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--no-store', action='store_true', help="Only generate and check alerts")
+    parser.add_argument('--no-alerts', action='store_true', help="Don't evaluate the alert rules")
+    args = parser.parse_args()
+
+    store = not args.no_store
+    if store:
+        from database_schema import create_database
+        if not create_database():
+            return 1
+    stats = load_test(args.days, args.packs, args.cells, args.rate, args.seed, args.dropout_rate,
+                      store=store, alerts=not args.no_alerts, batch_size=args.batch_size)
+    elapsed = max(stats['elapsed_s'], 1e-9)
+    print(f"{stats['samples']} samples in {elapsed:.1f} s ({stats['samples'] / elapsed * 60:,.0f} per minute): "
+          f"generate {stats['generate_s']:.1f} s, store {stats['store_s']:.1f} s, "
+          f"alerts {stats['alert_s']:.1f} s ({stats['alerts']} alerts opened)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+import logging
+import time
+
+# Startup timing report. Import this module first in an entry point; every
+# mark() records the time since then, and report() logs the stages, e.g.
+#   Startup: imports 45 ms, window 180 ms (+135), graphs 610 ms (+430)
+
+_started = time.perf_counter()
+_marks = []
+
+
+def mark(stage):
+    """Record that `stage` finished; returns ms since startup"""
+    elapsed = (time.perf_counter() - _started) * 1000
+    _marks.append((stage, elapsed))
+    return elapsed
+
+
+def elapsed_ms():
+    return (time.perf_counter() - _started) * 1000
+
+
+def report(echo=True):
+    """Log and return the recorded stages as one line; echo also prints it"""
+    parts = []
+    previous = 0.0
+    for stage, elapsed in _marks:
+        parts.append(f"{stage} {elapsed:.0f} ms" + (f" (+{elapsed - previous:.0f})" if previous else ""))
+        previous = elapsed
+    line = "Startup: " + ", ".join(parts)
+    logging.info(line)
+    if echo:
+        print(line)
+    return line
@@ -0,0 +1,33 @@
+import time
+from datetime import datetime
+
+# Local timezone, used when epoch timestamps are shown to the user
+LOCAL_TZ = datetime.now().astimezone().tzinfo
+
+
+def now_ms():
+    """Current time as integer epoch milliseconds"""
+    return time.time_ns() // 1_000_000
+
+
+def to_epoch_ms(value):
+    """Convert an ISO-8601 string, datetime or number to epoch milliseconds.
+
+    Naive datetimes and strings are interpreted as local time, which is how the
+    application has always written them. Returns None if the value can't be parsed.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(round(value.timestamp() * 1000))
+    try:
+        return int(round(datetime.fromisoformat(str(value).strip()).timestamp() * 1000))
+    except ValueError:
+        return None
+
+
+def from_epoch_ms(ms):
+    """Convert epoch milliseconds to a naive local datetime"""
+    return datetime.fromtimestamp(ms / 1000)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The application modules are flat modules in bms_gui/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from db_connection import close_connections
+
+
+@pytest.fixture
+def database_dir(tmp_path, monkeypatch):
+    """Run in an empty directory, so database/battery_data.db is a fresh file"""
+    import database
+
+    monkeypatch.chdir(tmp_path)
+    close_connections()
+    # The storage backend and the registered packs are cached per process
+    monkeypatch.setattr(database, '_chunk_store', None)
+    monkeypatch.setattr(database, '_backend_checked', False)
+    monkeypatch.setattr(database, '_pack_cells', {})
+    yield tmp_path
+    close_connections()
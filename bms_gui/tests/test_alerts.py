@@ -0,0 +1,14 @@
+import numpy as np
+
+from alerts import AlertEngine
+from rules import RuleSet
+from database_schema import SAMPLE_COLUMNS
+
+
+def test_unknown_pack_is_skipped_and_counted():
+    engine = AlertEngine(RuleSet.from_configuration(config={}, pack_ids=[1, 2]))
+    values = [np.nan] * len(SAMPLE_COLUMNS)
+    assert engine.submit(1000, values, pack_id=2)
+    assert not engine.submit(1000, values, pack_id=7)
+    assert engine.samples_unknown_pack == 1
+    assert engine.queue.qsize() == 1
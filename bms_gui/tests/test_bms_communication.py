@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from bms_communication import BMSCommunication, SIMULATOR_RATE_HZ
+from database_schema import create_database
+from db_connection import get_connection_manager
+
+pytestmark = pytest.mark.usefixtures('database_dir')
+
+
+def _configure(**settings):
+    assert create_database()
+    with get_connection_manager().writer() as conn:
+        for key, value in settings.items():
+            conn.execute('DELETE FROM Configuration WHERE parameter_name = ?', (key,))
+            conn.execute('INSERT INTO Configuration (parameter_name, value, last_updated) VALUES (?, ?, ?)',
+                         (key, value, datetime.now()))
+
+
+def test_invalid_settings_only_reset_themselves():
+    _configure(bms_source='bluetooth', baud_rate='fast', simulator_rate_hz='0', adc_sample_rate_hz='-5',
+               cell_count='4', cell2_divider='x', cell4_divider='2.5', simulator_seed='7', replay_pack_id='3')
+    bms = BMSCommunication()
+    assert bms.source == 'auto'
+    assert bms.baud_rate == 9600
+    assert bms.simulator_rate_hz == SIMULATOR_RATE_HZ
+    assert bms.adc_rate_hz > 0
+    # Settings after the invalid ones still apply
+    assert bms.cell_count == 4
+    assert bms.cell_dividers[1] == BMSCommunication().cell_dividers[1]
+    assert bms.cell_dividers[3] == 2.5
+    assert bms.simulator_seed == 7
+    assert bms.replay_pack_id == 3
+
+
+def test_valid_source():
+    _configure(bms_source='replay', simulator_seed='')
+    bms = BMSCommunication()
+    assert bms.source == 'replay'
+    assert bms.simulator_seed is None
+    assert not bms.stores_samples
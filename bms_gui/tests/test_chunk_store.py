@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from chunk_store import decode_chunk, decode_segments, encode_chunk
+
+
+def test_round_trip():
+    rng = np.random.default_rng(1)
+    timestamps = 1_700_000_000_000 + np.cumsum(rng.integers(900, 1100, 500))
+    values = 3.7 + rng.normal(0, 0.01, (500, 5))
+    values[10:20, 2] = np.nan
+    decoded_timestamps, decoded_values = decode_chunk(encode_chunk(timestamps, values))
+    np.testing.assert_array_equal(decoded_timestamps, timestamps)
+    # Bit exact, NaN included
+    np.testing.assert_array_equal(decoded_values.view(np.uint64), values.view(np.uint64))
+
+
+def test_short_chunks():
+    for count in (0, 1, 2):
+        timestamps = np.arange(count, dtype=np.int64) * 1000 + 5
+        values = np.full((count, 2), 1.5)
+        decoded_timestamps, decoded_values = decode_chunk(encode_chunk(timestamps, values))
+        np.testing.assert_array_equal(decoded_timestamps, timestamps)
+        np.testing.assert_array_equal(decoded_values, values)
+
+
+def test_segments_back_to_back():
+    first = encode_chunk(np.array([1, 2, 3]), np.ones((3, 4)))
+    second = encode_chunk(np.array([4, 5]), np.zeros((2, 6)))
+    segments = decode_segments(first + second)
+    assert [len(timestamps) for timestamps, _ in segments] == [3, 2]
+    assert [values.shape[1] for _, values in segments] == [4, 6]
+    np.testing.assert_array_equal(segments[1][0], [4, 5])
+
+
+def _rows(start_ms, count, pack_id=1):
+    from database_schema import SAMPLE_COLUMNS
+
+    rows = []
+    for n in range(count):
+        values = [None] * len(SAMPLE_COLUMNS)
+        values[:3] = [3.0 + n / 1000] * 3
+        values[-2:] = [25.0, 50.0]
+        rows.append((start_ms + n * 1000, pack_id, *values))
+    return rows
+
+
+@pytest.mark.usefixtures('database_dir')
+def test_open_chunk_survives_restart():
+    from chunk_store import ChunkStore
+    from database_schema import create_database
+    from db_connection import get_connection_manager
+
+    assert create_database()
+    store = ChunkStore(chunk_size=100)
+    for n in range(6):
+        assert store.insert_many(_rows(n * 10_000, 10))
+
+    # A new process picks up the unsealed chunk and fills it up
+    store = ChunkStore(chunk_size=100)
+    assert store.insert_many(_rows(60_000, 50))
+    with get_connection_manager().reader() as conn:
+        chunks = conn.execute('SELECT sample_count, sealed FROM SampleChunks ORDER BY id').fetchall()
+    assert chunks == [(100, 1), (10, 0)]
+
+    timestamps, values = store.get_range(0, 10**9)
+    assert len(timestamps) == 110
+    assert np.all(np.diff(timestamps) > 0)
+    assert np.isnan(values[:, 3]).all()
+
+
+@pytest.mark.usefixtures('database_dir')
+@pytest.mark.parametrize('backend', ['rows', 'chunked'])
+def test_missing_cells_are_none_on_both_backends(backend):
+    from database import get_recent_data, insert_many, iter_range
+    from database_schema import create_database
+    from db_connection import get_connection_manager
+    from time_utils import now_ms
+
+    assert create_database()
+    with get_connection_manager().writer() as conn:
+        conn.execute("UPDATE Configuration SET value = ? WHERE parameter_name = 'storage_backend'", (backend,))
+    start_ms = now_ms() - 30_000
+    assert insert_many(_rows(start_ms, 10))
+
+    recent = get_recent_data(60)
+    assert len(recent) == 10
+    assert recent[0][1] == 3.0 and recent[0][4] is None
+    rows = [row for batch in iter_range(start_ms, columns=['cell1_voltage', 'cell4_voltage'], batch_size=4)
+            for row in batch]
+    assert rows[0] == (start_ms, 3.0, None)
+    buckets = [row for batch in iter_range(start_ms, columns=['cell1_voltage', 'cell4_voltage'],
+                                           bucket_ms=60_000) for row in batch]
+    assert all(row[2] is None for row in buckets)
+    # As arrays the missing values are NaN
+    timestamps, values = next(iter_range(start_ms, as_numpy=True))
+    assert np.isnan(values[:, 3]).all()
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from csv_importer import import_csv_files
+from database import clear_data, get_packs, insert_many, iter_range, register_pack
+from database_schema import SAMPLE_COLUMNS, create_database
+from db_connection import get_connection_manager
+from exporter import ExportJob
+from time_utils import now_ms
+
+pytestmark = pytest.mark.usefixtures('database_dir')
+
+
+def _use_backend(backend):
+    assert create_database()
+    with get_connection_manager().writer() as conn:
+        conn.execute("UPDATE Configuration SET value = ? WHERE parameter_name = 'storage_backend'", (backend,))
+
+
+def _row(timestamp_ms, n, pack_id=1):
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:4] = [3.0 + n / 100] * 4
+    values[-2:] = [25.0, 50.0 + n]
+    return (timestamp_ms, pack_id, *values)
+
+
+def _all_rows(pack_id=1):
+    return [row for batch in iter_range(pack_id=pack_id) for row in batch]
+
+
+@pytest.mark.parametrize('backend', ['rows', 'chunked'])
+def test_export_import_round_trip(tmp_path, backend):
+    _use_backend(backend)
+    assert register_pack(2, 4)
+    start_ms = now_ms() - 60_000
+    assert insert_many([_row(start_ms + n * 250, n, pack_id=2) for n in range(40)])
+    stored = _all_rows(pack_id=2)
+
+    job = ExportJob(str(tmp_path / 'bms_data_1.csv'), 'CSV', pack_id=2)
+    job.start()
+    job.thread.join(10)
+    assert job.state == 'done'
+    assert clear_data()
+    assert _all_rows(pack_id=2) == []
+
+    stats = import_csv_files([str(tmp_path / 'bms_data_1.csv')])
+    assert (stats['inserted'], stats['invalid']) == (40, 0)
+    assert _all_rows(pack_id=2) == stored
+    # Importing the same file again only finds duplicates
+    stats = import_csv_files([str(tmp_path / 'bms_data_1.csv')])
+    assert (stats['inserted'], stats['duplicates']) == (0, 40)
+
+
+@pytest.mark.parametrize('backend', ['rows', 'chunked'])
+def test_legacy_export_without_cells(tmp_path, backend):
+    _use_backend(backend)
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    lines = ['id,timestamp,voltage,current,temperature,state_of_charge']
+    lines += [f'{n + 1},{(start + timedelta(seconds=n)).isoformat(sep=" ")},12.1,0.5,24.5,{80 - n}'
+              for n in range(5)]
+    lines.append('6,not a time,12.1,0.5,24.5,75')
+    (tmp_path / 'bms_data_old.csv').write_text('\n'.join(lines) + '\n')
+
+    stats = import_csv_files([str(tmp_path / 'bms_data_old.csv')])
+    assert (stats['inserted'], stats['invalid']) == (5, 1)
+    rows = _all_rows()
+    assert len(rows) == 5
+    # No cell columns: cells are missing, temperature and state of charge are kept
+    assert rows[0][1:4] == (None, None, None)
+    assert rows[0][-2:] == (24.5, 80.0)
+    assert get_packs()[1][1] == 3
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from database_schema import SCHEMA_VERSION, SAMPLE_COLUMNS, create_database, rollup_table
+from time_utils import to_epoch_ms
+
+
+def _create_v1_database(path, timestamps):
+    """The original layout: ISO text timestamps and three cells"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+    CREATE TABLE BatteryData (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        cell1_voltage REAL NOT NULL,
+        cell2_voltage REAL NOT NULL,
+        cell3_voltage REAL NOT NULL,
+        temperature REAL NOT NULL,
+        state_of_charge REAL NOT NULL
+    );
+    CREATE INDEX idx_timestamp ON BatteryData(timestamp);
+    CREATE TABLE Configuration (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parameter_name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        last_updated TEXT NOT NULL
+    );
+    CREATE TABLE ExportLogs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        export_format TEXT NOT NULL
+    );
+    ''')
+    conn.executemany('''
+    INSERT INTO BatteryData (timestamp, cell1_voltage, cell2_voltage, cell3_voltage, temperature, state_of_charge)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(ts, 10.5, 11.2, 10.8, 25.0 + n, 80.0) for n, ts in enumerate(timestamps)])
+    conn.execute("INSERT INTO Configuration (parameter_name, value, last_updated) "
+                 "VALUES ('cell1_warning_threshold', '3.7', '2025-04-18T13:26:38')")
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.usefixtures('database_dir')
+def test_migrates_v1_database():
+    # Inside the retention window, spread over two days
+    start = datetime.now().replace(microsecond=0) - timedelta(days=1)
+    timestamps = [(start + timedelta(hours=n)).isoformat() for n in range(30)]
+    os.makedirs('database')
+    _create_v1_database('database/battery_data.db', timestamps + ['not a time'])
+
+    assert create_database()
+
+    conn = sqlite3.connect('database/battery_data.db')
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    rows = conn.execute(f'SELECT timestamp, pack_id, {", ".join(SAMPLE_COLUMNS)} '
+                        'FROM BatteryData ORDER BY timestamp').fetchall()
+    # The unparseable timestamp is dropped
+    assert [row[0] for row in rows] == [to_epoch_ms(ts) for ts in timestamps]
+    assert {row[1] for row in rows} == {1}
+    first = dict(zip(SAMPLE_COLUMNS, rows[0][2:]))
+    assert (first['cell1_voltage'], first['cell3_voltage'], first['cell4_voltage']) == (10.5, 10.8, None)
+    assert first['temperature'] == 25.0
+
+    # Day partitions behind the view, rollups per pack
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'BatteryData'").fetchone()[0] == 'view'
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'BatteryData_2%'").fetchone()[0] >= 2
+    assert conn.execute(f'SELECT SUM(sample_count) FROM {rollup_table("1h")} WHERE pack_id = 1').fetchone()[0] == 30
+    assert conn.execute('SELECT cell_count FROM Packs WHERE pack_id = 1').fetchone()[0] == 3
+    threshold = conn.execute("SELECT value FROM Configuration WHERE parameter_name = 'cell1_warning_threshold'")
+    assert threshold.fetchone()[0] != '3.7'
+    conn.close()
+
+    # Running it again changes nothing
+    assert create_database()
@@ -0,0 +1,61 @@
+import numpy as np
+
+from downsample import lttb, minmax
+
+
+def _lttb_reference(x, y, points):
+    """Plain per-bucket LTTB, as in the original description of the algorithm"""
+    n = len(x)
+    size = (n - 2) / (points - 2)
+    picked = [0]
+    for b in range(points - 2):
+        lo, hi = 1 + int(b * size), 1 + int((b + 1) * size)
+        if b == points - 3:
+            next_x, next_y = x[-1], y[-1]
+        else:
+            next_lo, next_hi = hi, 1 + int((b + 2) * size)
+            next_x, next_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        px, py = x[picked[-1]], y[picked[-1]]
+        areas = [abs((px - next_x) * (y[i] - py) - (px - x[i]) * (next_y - py)) for i in range(lo, hi)]
+        picked.append(lo + int(np.argmax(areas)))
+    picked.append(n - 1)
+    return picked
+
+
+def test_short_input_is_unchanged():
+    x, y = np.arange(10), np.arange(10.0)
+    assert lttb(x, y, 20)[1] is y
+    rx, ry = minmax(x, np.ones((10, 2)), 20)
+    assert rx.shape == (10, 2) and ry.shape == (10, 2)
+
+
+def test_minmax_keeps_spikes():
+    x = np.arange(10_001)
+    y = np.sin(x / 500.0)
+    y[1234], y[7777] = 5.0, -5.0
+    rx, ry = minmax(x, y, 200)
+    assert len(rx) <= 200
+    assert 5.0 in ry and -5.0 in ry
+    assert np.all(np.diff(rx) > 0)
+
+
+def test_lttb_matches_the_reference():
+    rng = np.random.default_rng(3)
+    x = np.cumsum(rng.integers(1, 5, 5003))
+    y = np.cumsum(rng.normal(size=5003))
+    rx, ry = lttb(x, y, 100)
+    picked = _lttb_reference(x.astype(float), y, 100)
+    np.testing.assert_array_equal(rx, x[picked])
+    np.testing.assert_array_equal(ry, y[picked])
+
+
+def test_lines_are_downsampled_independently():
+    x = np.arange(1000)
+    y = np.zeros((1000, 2))
+    y[300, 0] = 10.0
+    y[700, 1] = -10.0
+    rx, ry = lttb(x, y, 50)
+    assert rx.shape == ry.shape == (50, 2)
+    assert 300 in rx[:, 0] and 300 not in rx[:, 1]
+    assert 700 in rx[:, 1]
+    assert rx[0].tolist() == [0, 0] and rx[-1].tolist() == [999, 999]
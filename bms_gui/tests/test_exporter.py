@@ -0,0 +1,67 @@
+import csv
+import json
+
+import pytest
+
+from database import insert_many, register_pack
+from database_schema import SAMPLE_COLUMNS, create_database
+from exporter import ExportJob
+from time_utils import now_ms
+
+pytestmark = pytest.mark.usefixtures('database_dir')
+
+
+def _row(timestamp_ms, n):
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:3] = [3.0 + n / 100] * 3
+    values[-2:] = [25.0, 50.0]
+    return (timestamp_ms, 1, *values)
+
+
+def _export(path, export_format, **kwargs):
+    job = ExportJob(str(path), export_format, batch_size=7, **kwargs)
+    job.start()
+    job.thread.join(10)
+    return job
+
+
+def _stored(count=20):
+    assert create_database()
+    assert register_pack(1, 3)
+    start_ms = now_ms() - 60_000
+    assert insert_many([_row(start_ms + n * 1000, n) for n in range(count)])
+    return start_ms
+
+
+def test_csv_has_only_the_cells_of_the_pack(tmp_path):
+    _stored()
+    job = _export(tmp_path / 'export.csv', 'CSV')
+    assert job.state == 'done' and job.rows_written == 20
+    with open(tmp_path / 'export.csv', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['timestamp', 'pack_id', 'cell1_voltage', 'cell2_voltage', 'cell3_voltage',
+                       'temperature', 'state_of_charge']
+    assert len(rows) == 21
+    assert rows[1][1:] == ['1', '3.0', '3.0', '3.0', '25.0', '50.0']
+
+
+def test_jsonl_records(tmp_path):
+    start_ms = _stored()
+    job = _export(tmp_path / 'export.jsonl', 'JSON Lines', start_ms=start_ms + 5000)
+    assert job.state == 'done'
+    with open(tmp_path / 'export.jsonl') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 15
+    assert records[0]['timestamp_ms'] == start_ms + 5000
+    assert records[0]['cell1_voltage'] == pytest.approx(3.05)
+    assert 'cell4_voltage' not in records[0]
+
+
+def test_cancelled_export_leaves_no_file(tmp_path):
+    _stored()
+    job = ExportJob(str(tmp_path / 'export.csv'), 'CSV')
+    job.cancel()
+    job.start()
+    job.thread.join(10)
+    assert job.state == 'cancelled'
+    assert not (tmp_path / 'export.csv').exists()
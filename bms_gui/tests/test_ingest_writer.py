@@ -0,0 +1,62 @@
+import pytest
+
+from database_schema import SAMPLE_COLUMNS, create_database
+from db_connection import get_connection_manager
+from ingest_writer import IngestWriter
+from time_utils import now_ms
+
+pytestmark = pytest.mark.usefixtures('database_dir')
+
+
+def _row(timestamp_ms, pack_id=1):
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:3] = [3.7, 3.7, 3.7]
+    values[-2:] = [25.0, 50.0]
+    return (timestamp_ms, pack_id, *values)
+
+
+def _stored_count():
+    with get_connection_manager().reader() as conn:
+        return conn.execute('SELECT COUNT(*) FROM BatteryData').fetchone()[0]
+
+
+def test_rows_are_written_in_batches():
+    assert create_database()
+    start_ms = now_ms() - 3_600_000
+    writer = IngestWriter(batch_size=100, flush_interval=1.0)
+    writer.start()
+    try:
+        for n in range(250):
+            assert writer.submit_row(_row(start_ms + n * 1000), 3)
+        assert writer.flush(timeout=5.0)
+        # Two full batches, then the rest when the flush was requested
+        assert writer.commits == 3
+        assert writer.rows_written == 250
+        assert _stored_count() == 250
+    finally:
+        writer.shutdown()
+
+
+def test_shutdown_writes_everything_queued():
+    assert create_database()
+    start_ms = now_ms() - 3_600_000
+    writer = IngestWriter(batch_size=1000, flush_interval=1.0)
+    writer.start()
+    for n in range(300):
+        writer.submit_row(_row(start_ms + n * 1000), 3)
+    writer.shutdown()
+    assert writer.thread is None
+    assert writer.rows_dropped == 0
+    assert _stored_count() == 300
+
+
+def test_full_queue_drops_and_counts():
+    assert create_database()
+    start_ms = now_ms() - 3_600_000
+    writer = IngestWriter(max_queue_size=10)
+    for n in range(15):
+        writer.submit_row(_row(start_ms + n * 1000), 3)
+    assert writer.rows_dropped == 5
+    # Without a writer thread, flush writes from the calling thread
+    assert writer.flush()
+    assert _stored_count() == 10
@@ -0,0 +1,37 @@
+import pytest
+
+from database import insert_many, iter_range
+from database_schema import SAMPLE_COLUMNS, create_database
+from time_utils import now_ms
+
+pytestmark = pytest.mark.usefixtures('database_dir')
+
+
+def _row(timestamp_ms, cell_voltage, pack_id=1):
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:3] = [cell_voltage] * 3
+    values[-2:] = [25.0, 50.0]
+    return (timestamp_ms, pack_id, *values)
+
+
+def test_pages_split_inside_runs_of_equal_timestamps():
+    assert create_database()
+    start_ms = now_ms() - 60_000
+    # More rows at one timestamp than fit on a page, and runs that straddle page boundaries
+    timestamps = [start_ms] * 7 + [start_ms + 1000] * 6 + [start_ms + 2000] * 12 + [start_ms + 3000]
+    rows = [_row(ts, 3.0 + n / 100) for n, ts in enumerate(timestamps)]
+    assert insert_many(rows + [_row(start_ms, 9.9, pack_id=2)])
+
+    batches = list(iter_range(start_ms, columns=['cell1_voltage'], batch_size=5))
+    assert all(len(batch) <= 5 for batch in batches)
+    returned = [row for batch in batches for row in batch]
+    assert sorted(returned) == sorted((row[0], row[2]) for row in rows)
+    assert [row[0] for row in returned] == sorted(timestamps)
+
+
+def test_page_size_equal_to_the_row_count():
+    assert create_database()
+    start_ms = now_ms() - 60_000
+    assert insert_many([_row(start_ms, 3.0 + n / 100) for n in range(10)])
+    batches = list(iter_range(start_ms, batch_size=5))
+    assert [len(batch) for batch in batches] == [5, 5]
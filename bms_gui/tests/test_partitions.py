@@ -0,0 +1,47 @@
+import pytest
+
+from database import insert_many
+from database_schema import SAMPLE_COLUMNS, create_database, rollup_table
+from db_connection import get_connection_manager
+from partitions import DAY_MS, apply_retention, list_partitions, partition_day, partition_table
+from time_utils import now_ms
+
+pytestmark = pytest.mark.usefixtures('database_dir')
+
+
+def _row(timestamp_ms, pack_id=1):
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:3] = [3.7, 3.7, 3.7]
+    values[-2:] = [25.0, 50.0]
+    return (timestamp_ms, pack_id, *values)
+
+
+def _days_ago(days):
+    return (partition_day(now_ms()) - days) * DAY_MS + 12 * 60 * 60 * 1000
+
+
+def test_rows_go_to_their_day_partition():
+    assert create_database()
+    assert insert_many([_row(_days_ago(2)), _row(_days_ago(1)), _row(_days_ago(1) + 1000), _row(_days_ago(0))])
+    today = partition_day(now_ms())
+    with get_connection_manager().reader() as conn:
+        assert [day for day, _ in list_partitions(conn)] == [today - 2, today - 1, today]
+        assert conn.execute(f'SELECT COUNT(*) FROM {partition_table(today - 1)}').fetchone()[0] == 2
+        # The view covers every partition
+        assert conn.execute('SELECT COUNT(*) FROM BatteryData').fetchone()[0] == 4
+        # A window only touches the partitions it overlaps
+        assert [day for day, _ in list_partitions(conn, start_ms=_days_ago(1))] == [today - 1, today]
+
+
+def test_retention_drops_old_partitions_and_fine_rollups():
+    assert create_database()
+    assert insert_many([_row(_days_ago(5)), _row(_days_ago(1))])
+    with get_connection_manager().writer() as conn:
+        assert apply_retention(conn, retention_days=3) == 1
+        assert [day for day, _ in list_partitions(conn)] == [partition_day(now_ms()) - 1]
+        assert conn.execute('SELECT COUNT(*) FROM BatteryData').fetchone()[0] == 1
+        # The coarse rollups outlive the raw samples
+        assert conn.execute(f'SELECT COUNT(*) FROM {rollup_table("1s")}').fetchone()[0] == 1
+        assert conn.execute(f'SELECT COUNT(*) FROM {rollup_table("1h")}').fetchone()[0] == 2
+        # Disabled retention keeps everything
+        assert apply_retention(conn, retention_days=0) == 0
@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+import pytest
+
+from database_schema import SAMPLE_COLUMNS
+from replay import Replayer
+from time_utils import now_ms
+
+
+def _batches(count, start_ms=1_700_000_000_000, step_ms=100, batch_size=7):
+    timestamps = start_ms + np.arange(count, dtype=np.int64) * step_ms
+    values = np.full((count, len(SAMPLE_COLUMNS)), np.nan)
+    values[:, 0] = np.arange(count)
+    for start in range(0, count, batch_size):
+        yield timestamps[start:start + batch_size], values[start:start + batch_size]
+
+
+def test_paced_replay_is_never_ahead_of_the_clock():
+    # 100 ms apart at 10x: one sample every 10 ms
+    replayer = Replayer(_batches(30), speed=10.0)
+    try:
+        started_ms = now_ms()
+        first = replayer.read_data()
+        assert first.cells[0] == 0
+        assert replayer.read_data() is None
+        time.sleep(0.105)
+        # take() stops at the end of a batch; draining while samples are due crosses them
+        taken = []
+        while replayer.wait() == 0:
+            taken.append(replayer.take())
+        timestamps = np.concatenate([batch[0] for batch in taken])
+        values = np.concatenate([batch[1] for batch in taken])
+        # Everything due by now, and nothing more
+        assert len(timestamps) >= 10
+        assert replayer.wait() > 0
+        assert values[:, 0].tolist() == list(range(1, len(timestamps) + 1))
+        assert timestamps[-1] <= now_ms()
+        # Re-timed: the recording starts now and runs 10 times faster
+        assert np.all(np.diff(timestamps) == 10)
+        assert started_ms <= first.timestamp <= timestamps[0] - 10
+    finally:
+        replayer.close()
+
+
+def test_max_speed_keeps_the_recorded_times():
+    replayer = Replayer(_batches(30), speed=0.0)
+    try:
+        timestamps = []
+        sample = replayer.read_data()
+        while sample:
+            timestamps.append(sample.timestamp)
+            sample = replayer.read_data()
+        assert replayer.finished
+        assert timestamps == [1_700_000_000_000 + 100 * n for n in range(30)]
+    finally:
+        replayer.close()
+
+
+@pytest.mark.usefixtures('database_dir')
+def test_daemon_drains_due_samples_with_their_timestamps():
+    from datetime import datetime
+
+    from bms_daemon import AcquisitionDaemon
+    from database import insert_many
+    from db_connection import get_connection_manager
+    from database_schema import create_database
+
+    assert create_database()
+    start_ms = now_ms() - 3_600_000
+    rows = [(start_ms + n * 1000, 1, 3.7, 3.7, 3.7, *[None] * (len(SAMPLE_COLUMNS) - 5), 25.0, 50.0)
+            for n in range(50)]
+    assert insert_many(rows)
+    with get_connection_manager().writer() as conn:
+        for key, value in (('bms_source', 'replay'), ('replay_speed', 'max')):
+            conn.execute('DELETE FROM Configuration WHERE parameter_name = ?', (key,))
+            conn.execute('INSERT INTO Configuration (parameter_name, value, last_updated) VALUES (?, ?, ?)',
+                         (key, value, datetime.now()))
+
+    daemon = AcquisitionDaemon(interval=1.0)
+    daemon.start()
+    try:
+        submitted = []
+        daemon.alert_engine.submit = lambda timestamp, values, pack_id=None: submitted.append(timestamp)
+        daemon._sample()
+        # One tick takes everything that is due, with the replay's own timestamps
+        assert daemon.samples == 50
+        assert submitted == [row[0] for row in rows]
+    finally:
+        daemon.shutdown()
+    with get_connection_manager().reader() as conn:
+        # Replayed samples are not stored a second time
+        assert conn.execute('SELECT COUNT(*) FROM BatteryData').fetchone()[0] == 50
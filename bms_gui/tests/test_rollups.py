@@ -0,0 +1,51 @@
+import pytest
+
+from database import insert_many
+from database_schema import SAMPLE_COLUMNS, create_database
+from db_connection import get_connection_manager
+from rollups import get_rollup_data, rollup_columns, update_rollups_from_rows
+from time_utils import now_ms
+
+pytestmark = pytest.mark.usefixtures('database_dir')
+
+
+def _row(timestamp_ms, cell_voltage, pack_id=1):
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:3] = [cell_voltage] * 3
+    values[-2:] = [25.0, 50.0]
+    return (timestamp_ms, pack_id, *values)
+
+
+def _minute(rows):
+    """cell1 (min, max, mean) and the sample count of the only 1 min bucket"""
+    assert len(rows) == 1
+    row = dict(zip(rollup_columns(), rows[0]))
+    return row['sample_count'], row['cell1_voltage_min'], row['cell1_voltage_max'], row['cell1_voltage_mean']
+
+
+def test_batches_merge_into_existing_buckets():
+    assert create_database()
+    start_ms = (now_ms() // 60_000 - 10) * 60_000
+    assert insert_many([_row(start_ms + 1000, 3.6), _row(start_ms + 2000, 3.8)])
+    assert insert_many([_row(start_ms + 3000, 3.4), _row(start_ms + 4000, 4.0, pack_id=2)])
+
+    _, rows = get_rollup_data(start_ms, start_ms + 60_000, resolution='1m')
+    count, low, high, mean = _minute(rows)
+    assert (count, low, high) == (3, 3.4, 3.8)
+    assert mean == pytest.approx(3.6)
+    _, rows = get_rollup_data(start_ms, start_ms + 60_000, resolution='1m', pack_id=2)
+    assert _minute(rows)[0] == 1
+
+
+def test_rows_without_a_column_leave_it_null():
+    assert create_database()
+    start_ms = (now_ms() // 60_000 - 10) * 60_000
+    with get_connection_manager().writer() as conn:
+        update_rollups_from_rows(conn, [_row(start_ms, 3.7)])
+        update_rollups_from_rows(conn, [_row(start_ms + 1000, 3.5)])
+
+    _, rows = get_rollup_data(start_ms, start_ms + 60_000, resolution='1m')
+    count, low, high, mean = _minute(rows)
+    assert (count, low, high) == (2, 3.5, 3.7)
+    row = dict(zip(rollup_columns(), rows[0]))
+    assert row['cell4_voltage_min'] is None and row['cell4_voltage_mean'] is None
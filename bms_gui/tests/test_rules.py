@@ -0,0 +1,94 @@
+import numpy as np
+
+from database_schema import SAMPLE_COLUMNS
+from rules import RuleSet
+
+NAN = float('nan')
+
+
+def _rules(min_duration_ms=2000):
+    # One column, upper limit 50 clearing at 48, lower limit 10 clearing at 12
+    return RuleSet([[50.0]], [[10.0]], [[2.0]], min_duration_ms, columns=['temperature'])
+
+
+def _run(rules, readings, start_ms=0, step_ms=1000):
+    """Feed one reading per step, one batch each; returns [(kind, slot, timestamp)]"""
+    events = []
+    for n, value in enumerate(readings):
+        for kind, _, slot, timestamp, _ in rules.evaluate([start_ms + n * step_ms], [[value]]):
+            events.append((kind, int(slot), timestamp))
+    return events
+
+
+def test_short_breach_is_debounced():
+    rules = _rules()
+    assert _run(rules, [40, 55, 56, 40, 55, 40]) == []
+    assert not rules.active.any()
+
+
+def test_opens_after_min_duration_and_clears_with_hysteresis():
+    rules = _rules()
+    events = _run(rules, [40, 55, 56, 57, 49, 49, 49, 47, 47, 47])
+    # Open is stamped with the start of the breach, close with the start of the clear
+    assert events == [('open', 0, 1000), ('close', 0, 7000)]
+
+
+def test_lower_limit():
+    rules = _rules(min_duration_ms=0)
+    events = _run(rules, [20, 9, 11, 13])
+    assert events == [('open', 1, 1000), ('close', 1, 3000)]
+    assert rules.rule(0, 1).threshold == 10.0
+
+
+def test_dropouts_neither_breach_nor_clear():
+    rules = _rules()
+    assert _run(rules, [NAN] * 5) == []
+
+    # A dropout restarts the debounce of a breach
+    assert _run(rules, [55, 56, NAN, 55, 56], start_ms=10_000) == []
+    assert not rules.active.any()
+    assert _run(rules, [57], start_ms=15_000) == [('open', 0, 13_000)]
+
+    # An open alert stays open through dropouts, and they restart the clear debounce too
+    assert _run(rules, [NAN] * 10, start_ms=20_000) == []
+    assert rules.active[0, 0]
+    assert _run(rules, [40, 40, NAN, 40, 40, 40], start_ms=30_000) == [('close', 0, 33_000)]
+
+
+
+def test_batch_matches_sample_by_sample():
+    readings = [40, 55, 56, 57, NAN, 58, 49, 47, 47, 47, 5, 5, 5, 30]
+    one_by_one = _run(_rules(), readings)
+    batched = [(kind, int(slot), timestamp) for kind, _, slot, timestamp, _
+               in _rules().evaluate(np.arange(len(readings)) * 1000, np.array(readings)[:, None])]
+    assert batched == one_by_one
+    assert len(one_by_one) == 3
+
+
+def test_packs_in_one_batch_are_independent():
+    rules = RuleSet([[50.0], [30.0]], -np.inf, 0.0, 0, pack_ids=[1, 2], columns=['temperature'])
+    events = rules.evaluate([0, 0, 1000, 1000], [[40], [40], [20], [25]], packs=[0, 1, 0, 1])
+    assert [(kind, int(p), int(slot), timestamp) for kind, p, slot, timestamp, _ in events] == [
+        ('open', 1, 0, 0), ('close', 1, 0, 1000)]
+    assert rules.rule(1, 0).name == 'pack2_temperature_high'
+
+
+def test_limits_from_configuration():
+    config = {
+        'cell_warning_threshold': '14.0',
+        'cell2_warning_threshold': '13.5',
+        'pack2_cell_warning_threshold': '4.2',
+        'state_of_charge_low_threshold': '20',
+        'alert_min_duration_ms': '500',
+        'temperature_warning_threshold': 'not a number',
+    }
+    rules = RuleSet.from_configuration(config, pack_ids=[1, 2])
+    assert rules.limit('cell1_voltage') == 14.0
+    assert rules.limit('cell2_voltage') == 13.5
+    # Per pack overrides only replace the setting they name
+    assert rules.limit('cell1_voltage', pack_id=2) == 4.2
+    assert rules.limit('cell2_voltage', pack_id=2) == 13.5
+    assert rules.limit('state_of_charge', pack_id=2, above=False) == 20.0
+    assert rules.limit('temperature') == float('inf')
+    assert (rules.min_duration_ms == 500).all()
+    assert rules.threshold.shape == (2, 2 * len(SAMPLE_COLUMNS))
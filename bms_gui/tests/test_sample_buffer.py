@@ -0,0 +1,46 @@
+import numpy as np
+
+from sample_buffer import SampleBuffer
+
+
+def test_append_wraps_around_and_stays_contiguous():
+    buffer = SampleBuffer(capacity=4, columns=['temperature'])
+    for n in range(10):
+        buffer.append(1000 * n, [float(n)])
+    timestamps, values = buffer.view()
+    assert len(buffer) == 4
+    assert timestamps.tolist() == [6000, 7000, 8000, 9000]
+    assert values[:, 0].tolist() == [6, 7, 8, 9]
+    # Views of the backing arrays, not copies
+    assert timestamps.base is not None
+    # Samples before the oldest one in the buffer have to come from the database
+    assert buffer._complete_from == 6000
+
+
+def test_extend_across_the_wrap():
+    buffer = SampleBuffer(capacity=5, columns=['temperature', 'state_of_charge'])
+    buffer.extend([0, 1000, 1000], [[0, 0], [1, 1], [2, 2]])
+    buffer.extend([2000, 3000, 4000], [[3, 3], [4, 4], [5, 5]])
+    timestamps, values = buffer.view()
+    assert timestamps.tolist() == [1000, 1000, 2000, 3000, 4000]
+    assert values[:, 1].tolist() == [1, 2, 3, 4, 5]
+
+    # From the first sample at or after start_ms, including every equal timestamp
+    timestamps, values = buffer.view(1000)
+    assert values[:, 0].tolist() == [1, 2, 3, 4, 5]
+    timestamps, _ = buffer.view(2500)
+    assert timestamps.tolist() == [3000, 4000]
+
+
+def test_extend_with_more_than_the_capacity():
+    buffer = SampleBuffer(capacity=3, columns=['temperature'])
+    buffer.append(0, [0.0])
+    buffer.extend(np.arange(1, 8) * 1000, np.arange(1, 8, dtype=float))
+    timestamps, values = buffer.view()
+    assert timestamps.tolist() == [5000, 6000, 7000]
+    assert values[:, 0].tolist() == [5, 6, 7]
+    assert buffer._complete_from == 5000
+
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.view()[0].tolist() == []
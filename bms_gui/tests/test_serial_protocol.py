@@ -0,0 +1,74 @@
+import numpy as np
+
+from serial_protocol import FrameDecoder, ReceiptClock, decode_samples, encode_sample
+
+
+def _frames(count, cells=3):
+    return [encode_sample([3.0 + n / 100] * cells, 25.0 + n, 50.0) for n in range(count)]
+
+
+def test_frames_split_across_reads():
+    data = b''.join(_frames(5))
+    decoder = FrameDecoder()
+    payloads = []
+    for start in range(0, len(data), 7):
+        payloads += decoder.feed(data[start:start + 7])
+    assert len(payloads) == 5
+    assert decoder.stats()['bytes_discarded'] == 0
+
+
+def test_resync_after_garbage():
+    frames = _frames(3)
+    decoder = FrameDecoder()
+    payloads = decoder.feed(b'\x00\x13\xaa' + frames[0] + b'\xaa\x55\xff\xff' + frames[1] + frames[2])
+    assert len(payloads) == 3
+    assert decoder.stats()['length_errors'] == 1
+    assert decoder.stats()['bytes_discarded'] > 0
+
+
+def test_corrupt_frame_is_dropped():
+    frames = _frames(3)
+    corrupt = bytearray(frames[1])
+    corrupt[8] ^= 0xFF
+    decoder = FrameDecoder()
+    payloads = decoder.feed(frames[0] + bytes(corrupt) + frames[2])
+    assert len(payloads) == 2
+    assert decoder.stats()['crc_errors'] == 1
+    samples, = decode_samples(payloads)
+    np.testing.assert_allclose(samples['temperature'], [25.0, 27.0])
+
+
+def test_decode_samples_groups_cell_counts():
+    decoder = FrameDecoder()
+    batches = decode_samples(decoder.feed(b''.join(_frames(2) + _frames(1, cells=5))))
+    assert [batch['cells'].shape for batch in batches] == [(2, 3), (1, 5)]
+
+
+def test_decode_samples_keeps_interleaved_order():
+    frames = [encode_sample([3.0] * cells, float(n), 50.0) for n, cells in enumerate([3, 5, 3, 3, 5])]
+    batches = decode_samples(FrameDecoder().feed(b''.join(frames)))
+    assert [batch['cells'].shape[1] for batch in batches] == [3, 5, 3, 5]
+    assert np.concatenate([batch['temperature'] for batch in batches]).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_frame_without_cells_is_a_bad_sample():
+    decoder = FrameDecoder()
+    payloads = decoder.feed(b''.join(_frames(1) + [encode_sample([], 25.0, 50.0)] + _frames(1)))
+    assert len(payloads) == 2
+    assert decoder.stats()['bad_samples'] == 1
+    assert [len(batch) for batch in decode_samples(payloads)] == [2]
+
+
+def test_receipt_clock_spreads_samples_over_the_read_interval():
+    clock = ReceiptClock()
+    clock.stamp(1000, 1)
+    timestamps = clock.stamp(1100, 20)
+    assert timestamps[-1] == 1100
+    assert timestamps[0] > 1000
+    assert len(set(timestamps.tolist())) == 20
+    assert list(timestamps) == sorted(timestamps)
+
+
+def test_receipt_clock_first_read():
+    timestamps = ReceiptClock(first_period_ms=5.0).stamp(1000, 3)
+    assert list(timestamps) == [990, 995, 1000]
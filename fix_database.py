@@ -1,8 +1,14 @@
 import os
 import sqlite3
 import shutil
+import sys
 from datetime import datetime
 
+# The application modules live in bms_gui/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bms_gui', 'src'))
+from database import insert_many
+from database_schema import create_database, SAMPLE_COLUMNS, DEFAULT_PACK_ID
+
 print("Fixing BMS database...")
 
 # Create backup of existing database
@@ -29,74 +35,27 @@ except Exception as e:
 # Create database directory
 os.makedirs('database', exist_ok=True)
 
-# Create new database with correct schema
+# Create new database with the application's schema: partitioned BatteryData
+# behind a view, rollups, Packs, Configuration defaults, ...
 conn = None
 try:
-    conn = sqlite3.connect('database/battery_data.db', isolation_level=None)
-    print("Connected to database with isolation_level=None for DDL operations")
-    cursor = conn.cursor()
-
     print("Creating tables with correct schema...")
-    
-    # Create the BatteryData table
-    cursor.execute('''
-    CREATE TABLE BatteryData (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        cell1_voltage REAL NOT NULL,
-        cell2_voltage REAL NOT NULL,
-        cell3_voltage REAL NOT NULL,
-        temperature REAL NOT NULL,
-        state_of_charge REAL NOT NULL
-    )
-    ''')
-    
-    # Create the ExportLogs table
-    cursor.execute('''
-    CREATE TABLE ExportLogs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        file_path TEXT NOT NULL,
-        export_format TEXT NOT NULL
-    )
-    ''')
-    
-    # Create Configuration table
-    cursor.execute('''
-    CREATE TABLE Configuration (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        parameter_name TEXT NOT NULL,
-        value TEXT NOT NULL,
-        last_updated TEXT NOT NULL
-    )
-    ''')
-    
-    # Create index for better performance
-    cursor.execute('CREATE INDEX idx_timestamp ON BatteryData(timestamp)')
-
-    # Add default configurations
-    default_configs = [
-        ('voltage_threshold', '14.0', datetime.now().isoformat()),
-        ('temperature_threshold', '30.0', datetime.now().isoformat()),
-        ('baud_rate', '9600', datetime.now().isoformat()),
-        ('com_port', 'COM1', datetime.now().isoformat())
-    ]
-    
-    cursor.executemany('''
-    INSERT INTO Configuration (parameter_name, value, last_updated)
-    VALUES (?, ?, ?)
-    ''', default_configs)
-    
+    create_database()
     print("Database schema created successfully")
     
-    # Insert a test row to ensure the schema works
-    test_timestamp = datetime.now().isoformat()
-    cursor.execute('''
-    INSERT INTO BatteryData (timestamp, cell1_voltage, cell2_voltage, cell3_voltage, temperature, state_of_charge)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (test_timestamp, 10.5, 11.2, 10.8, 25.6, 87.5))
+    # Insert a test row to ensure the schema works; BatteryData is a view,
+    # rows go into the day partition through the storage layer
+    test_timestamp = int(datetime.now().timestamp() * 1000)
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:3] = [10.5, 11.2, 10.8]
+    values[-2:] = [25.6, 87.5]
+    if not insert_many([(test_timestamp, DEFAULT_PACK_ID, *values)]):
+        raise RuntimeError("Test row could not be inserted")
     print("Test row inserted successfully")
     
+    conn = sqlite3.connect('database/battery_data.db')
+    cursor = conn.cursor()
+    
     # Verify schema
     cursor.execute("PRAGMA table_info(BatteryData)")
     columns = cursor.fetchall()
@@ -105,17 +64,19 @@ try:
         print(f"  - {col[1]} ({col[2]})")
         
     # Verify test data
-    cursor.execute("SELECT * FROM BatteryData")
+    cursor.execute("SELECT id, timestamp, pack_id, cell1_voltage, cell2_voltage, cell3_voltage, "
+                   "temperature, state_of_charge FROM BatteryData ORDER BY timestamp DESC LIMIT 1")
     test_data = cursor.fetchone()
     if test_data:
         print("\nTest data verified:")
         print(f"  - ID: {test_data[0]}")
         print(f"  - Timestamp: {test_data[1]}")
-        print(f"  - Cell1 Voltage: {test_data[2]}")
-        print(f"  - Cell2 Voltage: {test_data[3]}")
-        print(f"  - Cell3 Voltage: {test_data[4]}")
-        print(f"  - Temperature: {test_data[5]}")
-        print(f"  - State of Charge: {test_data[6]}")
+        print(f"  - Pack: {test_data[2]}")
+        print(f"  - Cell1 Voltage: {test_data[3]}")
+        print(f"  - Cell2 Voltage: {test_data[4]}")
+        print(f"  - Cell3 Voltage: {test_data[5]}")
+        print(f"  - Temperature: {test_data[6]}")
+        print(f"  - State of Charge: {test_data[7]}")
 except Exception as e:
     print(f"Error creating database: {str(e)}")
     import traceback
@@ -124,4 +85,4 @@ finally:
     if conn:
         conn.close()
 
-print("\nDatabase fix complete. Run the main application now.") 
\ No newline at end of file
+print("\nDatabase fix complete. Run the main application now.")
@@ -0,0 +1,39 @@
+import os
+import sys
+import glob
+import sqlite3
+
+# The schema and migrations live with the application code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bms_gui', 'src'))
+from database_schema import migrate_database, SCHEMA_VERSION
+
+print(f"Migrating BMS databases to schema version {SCHEMA_VERSION}...")
+
+# The live database and every backup taken by fix_database.py / reset_database.py
+paths = sys.argv[1:] or (['database/battery_data.db'] + sorted(glob.glob('database/backups/*.db')))
+
+for path in paths:
+    if not os.path.exists(path):
+        print(f"Skipping {path}: file not found")
+        continue
+
+    conn = None
+    try:
+        conn = sqlite3.connect(path, timeout=10)
+        before = conn.execute('PRAGMA user_version').fetchone()[0]
+        after = migrate_database(conn)
+        conn.commit()
+
+        count = 0
+        if conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name='BatteryData'").fetchone():
+            count = conn.execute('SELECT COUNT(*) FROM BatteryData').fetchone()[0]
+        print(f"  - {path}: version {before} -> {after}, {count} BatteryData rows")
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"  - {path}: migration failed: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+print("\nMigration complete.")
@@ -3,9 +3,16 @@ from datetime import datetime, timedelta
 import random
 import time
 import os
+import sys
 
-# Make sure database directory exists
+# The application modules live in bms_gui/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bms_gui', 'src'))
+from database import insert_many
+from database_schema import create_database, SAMPLE_COLUMNS, DEFAULT_PACK_ID
+
+# Make sure the database exists with the current schema
 os.makedirs('database', exist_ok=True)
+create_database()
 
 # Function to insert a single test data point
 def insert_test_data():
@@ -17,17 +24,12 @@ def insert_test_data():
     temperature = 25.0 + random.uniform(-2.0, 2.0)
     state_of_charge = 75.0 + random.uniform(-5.0, 5.0)
     
-    # Insert into database
-    conn = sqlite3.connect('database/battery_data.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    INSERT INTO BatteryData (timestamp, cell1_voltage, cell2_voltage, cell3_voltage, temperature, state_of_charge)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (timestamp, cell1_voltage, cell2_voltage, cell3_voltage, temperature, state_of_charge))
-    
-    conn.commit()
-    conn.close()
+    # BatteryData is a view over the day partitions, insert through the storage layer
+    values = [None] * len(SAMPLE_COLUMNS)
+    values[:3] = [cell1_voltage, cell2_voltage, cell3_voltage]
+    values[-2:] = [temperature, state_of_charge]
+    if not insert_many([(int(timestamp.timestamp() * 1000), DEFAULT_PACK_ID, *values)]):
+        raise RuntimeError("Insert failed")
     
     return timestamp
 
@@ -1,29 +1,25 @@
 import sqlite3
 from datetime import datetime
 import os
+import sys
+
+# The application modules live in bms_gui/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bms_gui', 'src'))
+from database import insert_many
+from database_schema import create_database, SAMPLE_COLUMNS, DEFAULT_PACK_ID
 
 def insert_test_data():
     try:
         # Ensure database directory exists
         os.makedirs('database', exist_ok=True)
         
+        # Create the database or migrate it to the current schema
+        create_database()
+        
         # Connect to database
         conn = sqlite3.connect('database/battery_data.db')
         cursor = conn.cursor()
         
-        # Check if table exists, if not create it
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS BatteryData (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            cell1_voltage REAL NOT NULL,
-            cell2_voltage REAL NOT NULL,
-            cell3_voltage REAL NOT NULL,
-            temperature REAL NOT NULL,
-            state_of_charge REAL NOT NULL
-        )
-        ''')
-        
         # Check the table structure
         cursor.execute("PRAGMA table_info(BatteryData)")
         columns = cursor.fetchall()
@@ -32,7 +28,8 @@ def insert_test_data():
             print(f"  - {col[1]} ({col[2]})")
         
         # Generate sample data
-        timestamp = datetime.now().isoformat()
+        # Epoch milliseconds, same as the application writes
+        timestamp = int(datetime.now().timestamp() * 1000)
         cell1 = 10.5
         cell2 = 11.2
         cell3 = 10.8
@@ -43,13 +40,12 @@ def insert_test_data():
         print(f"\nInserting values: timestamp={timestamp}, cell1={cell1}, cell2={cell2}, cell3={cell3}, temp={temp}, soc={soc}")
         
         try:
-            cursor.execute('''
-            INSERT INTO BatteryData (timestamp, cell1_voltage, cell2_voltage, cell3_voltage, 
-                                   temperature, state_of_charge)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (timestamp, cell1, cell2, cell3, temp, soc))
-            
-            conn.commit()
+            # BatteryData is a view over the day partitions, insert through the storage layer
+            values = [None] * len(SAMPLE_COLUMNS)
+            values[:3] = [cell1, cell2, cell3]
+            values[-2:] = [temp, soc]
+            if not insert_many([(timestamp, DEFAULT_PACK_ID, *values)]):
+                raise RuntimeError("insert_many failed")
             print("Data inserted successfully!")
         except Exception as e:
             print(f"Error during insert: {str(e)}")
@@ -57,7 +53,7 @@ def insert_test_data():
             traceback.print_exc()
         
         # Check if data was inserted
-        cursor.execute("SELECT * FROM BatteryData ORDER BY id DESC LIMIT 1")
+        cursor.execute("SELECT * FROM BatteryData ORDER BY timestamp DESC LIMIT 1")
         row = cursor.fetchone()
         if row:
             print(f"\nLast row in database: {row}")